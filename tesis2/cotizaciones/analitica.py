@@ -0,0 +1,187 @@
+# cotizaciones/analitica.py
+"""
+Analítica por categoría de servicio y mes: tasa de aprobación, ticket
+promedio y margen sobre el precio base.
+
+Los items de servicio se leen con values_list().iterator() en lotes y se
+guardan en columnas NumPy; los agregados por grupo se calculan con
+operaciones vectorizadas (np.unique, np.bincount) sin crear instancias de
+modelo. NumPy es opcional: sin él, AnaliticaNoDisponible. La exportación a
+Parquet requiere además pyarrow.
+"""
+import csv
+import io
+from importlib.util import find_spec
+
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast, ExtractMonth, ExtractYear
+
+from .models import CategoriaServicio, ItemServicio
+
+# Filas leídas por consulta al recorrer los items
+TAMANO_LOTE = 20000
+
+# Estados en que la cotización ya tuvo respuesta (base de la tasa de aprobación)
+ESTADOS_DECIDIDOS = ('aprobada', 'rechazada', 'vencida')
+
+COLUMNAS_METRICAS = [
+    'categoria_id', 'categoria', 'periodo', 'cotizaciones', 'aprobadas', 'decididas',
+    'tasa_aprobacion', 'ingresos', 'ticket_promedio', 'precio_base', 'margen',
+]
+
+
+class AnaliticaNoDisponible(RuntimeError):
+    """numpy (o pyarrow, para Parquet) no está instalado"""
+
+
+def analitica_disponible():
+    return find_spec('numpy') is not None
+
+
+def parquet_disponible():
+    return analitica_disponible() and find_spec('pyarrow') is not None
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise AnaliticaNoDisponible('Para la analítica se requiere el paquete numpy')
+    return numpy
+
+
+def items_servicio(desde=None, hasta=None):
+    """
+    Items de servicio como tuplas (periodo, categoria_id, cotizacion_id,
+    estado, subtotal, base). periodo es año * 12 + mes - 1 en hora local;
+    base es cantidad * precio base del servicio. Los montos se leen como float.
+    """
+    items = ItemServicio.objects.order_by()
+    if desde:
+        items = items.filter(cotizacion__fecha_creacion__gte=desde)
+    if hasta:
+        items = items.filter(cotizacion__fecha_creacion__lt=hasta)
+    fecha = 'cotizacion__fecha_creacion'
+    return items.annotate(
+        periodo=ExtractYear(fecha) * 12 + ExtractMonth(fecha) - 1,
+        monto=Cast('subtotal', FloatField()),
+        base=Cast(F('cantidad') * F('servicio__precio_base'), FloatField()),
+    ).values_list('periodo', 'servicio__categoria_id', 'cotizacion_id', 'cotizacion__estado', 'monto', 'base')
+
+
+def cargar_columnas(filas, lote=TAMANO_LOTE):
+    """Lee las tuplas de items_servicio() por lotes y las deja en columnas NumPy"""
+    np = _numpy()
+    tipos = [('periodo', np.int32), ('categoria_id', np.int64), ('cotizacion_id', np.int64),
+             ('estado', 'U10'), ('subtotal', np.float64), ('base', np.float64)]
+    partes = {nombre: [] for nombre, _ in tipos}
+    pendientes = []
+
+    def volcar():
+        if pendientes:
+            for (nombre, tipo), valores in zip(tipos, zip(*pendientes)):
+                partes[nombre].append(np.array(valores, dtype=tipo))
+            pendientes.clear()
+
+    for fila in filas.iterator(chunk_size=lote):
+        pendientes.append(fila)
+        if len(pendientes) == lote:
+            volcar()
+    volcar()
+    return {
+        nombre: np.concatenate(partes[nombre]) if partes[nombre] else np.empty(0, dtype=tipo)
+        for nombre, tipo in tipos
+    }
+
+
+def agregar_por_categoria(columnas):
+    """
+    Agregados por (categoría, periodo) con operaciones vectorizadas. Cada
+    cotización cuenta una vez por grupo aunque tenga varios items de la
+    categoría. Retorna columnas con un elemento por grupo.
+    """
+    np = _numpy()
+    claves, grupo = np.unique(
+        np.stack([columnas['categoria_id'], columnas['periodo'].astype(np.int64)], axis=1),
+        axis=0, return_inverse=True,
+    )
+    grupo = grupo.ravel()
+    grupos = len(claves)
+    ingresos = np.bincount(grupo, weights=columnas['subtotal'], minlength=grupos)
+    base = np.bincount(grupo, weights=columnas['base'], minlength=grupos)
+
+    # Pares (grupo, cotización) distintos
+    _, primeros = np.unique(
+        np.stack([grupo.astype(np.int64), columnas['cotizacion_id']], axis=1), axis=0, return_index=True,
+    )
+    grupo_cotizacion = grupo[primeros]
+    estado = columnas['estado'][primeros]
+    cotizaciones = np.bincount(grupo_cotizacion, minlength=grupos)
+    aprobadas = np.bincount(grupo_cotizacion, weights=estado == 'aprobada', minlength=grupos)
+    decididas = np.bincount(grupo_cotizacion, weights=np.isin(estado, ESTADOS_DECIDIDOS), minlength=grupos)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'categoria_id': claves[:, 0],
+            'periodo': claves[:, 1],
+            'cotizaciones': cotizaciones,
+            'aprobadas': aprobadas.astype(np.int64),
+            'decididas': decididas.astype(np.int64),
+            'tasa_aprobacion': np.where(decididas > 0, aprobadas / decididas, np.nan),
+            'ingresos': ingresos,
+            'ticket_promedio': ingresos / cotizaciones,
+            'precio_base': base,
+            'margen': np.where(ingresos > 0, (ingresos - base) / ingresos, np.nan),
+        }
+
+
+def metricas_por_categoria(desde=None, hasta=None):
+    """Métricas por categoría y mes como lista de diccionarios (serializable a JSON)"""
+    np = _numpy()
+    agregados = agregar_por_categoria(cargar_columnas(items_servicio(desde, hasta)))
+    nombres = dict(CategoriaServicio.objects.filter(
+        pk__in=np.unique(agregados['categoria_id']).tolist()
+    ).values_list('pk', 'nombre'))
+
+    def valor(numero, decimales):
+        return None if np.isnan(numero) else round(float(numero), decimales)
+
+    return [
+        {
+            'categoria_id': int(categoria_id),
+            'categoria': nombres.get(int(categoria_id), ''),
+            'periodo': f'{periodo // 12:04d}-{periodo % 12 + 1:02d}',
+            'cotizaciones': int(cotizaciones),
+            'aprobadas': int(aprobadas),
+            'decididas': int(decididas),
+            'tasa_aprobacion': valor(tasa, 4),
+            'ingresos': round(float(ingresos), 2),
+            'ticket_promedio': round(float(ticket), 2),
+            'precio_base': round(float(base), 2),
+            'margen': valor(margen, 4),
+        }
+        for categoria_id, periodo, cotizaciones, aprobadas, decididas, tasa, ingresos, ticket, base, margen
+        in zip(*(agregados[columna] for columna in COLUMNAS_METRICAS if columna != 'categoria'))
+    ]
+
+
+def metricas_csv(metricas):
+    """Métricas como texto CSV con una fila por categoría y mes"""
+    salida = io.StringIO()
+    escritor = csv.DictWriter(salida, fieldnames=COLUMNAS_METRICAS)
+    escritor.writeheader()
+    escritor.writerows(metricas)
+    return salida.getvalue()
+
+
+def metricas_parquet(metricas):
+    """Métricas como bytes de un archivo Parquet (requiere pyarrow)"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise AnaliticaNoDisponible('Para exportar Parquet se requiere el paquete pyarrow')
+    tabla = pyarrow.table({columna: [fila[columna] for fila in metricas] for columna in COLUMNAS_METRICAS})
+    salida = io.BytesIO()
+    pyarrow.parquet.write_table(tabla, salida)
+    return salida.getvalue()
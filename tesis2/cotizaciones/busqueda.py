@@ -0,0 +1,289 @@
+# cotizaciones/busqueda.py
+"""
+Búsqueda con ranking y tolerancia a errores de tipeo para cotizaciones,
+clientes y materiales, y autocompletado de materiales por prefijo.
+
+En PostgreSQL se usan índices GIN de trigramas (pg_trgm) y de texto completo
+(migración 0003). En otras bases se usa la tabla TokenBusqueda, que guarda los
+trigramas de cada registro y se mantiene con señales (ver signals.py); la
+similitud es la fracción de trigramas de la búsqueda presentes en el registro,
+igual que word_similarity de pg_trgm.
+"""
+import re
+import unicodedata
+
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, FloatField, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Cliente, Cotizacion, Material, TokenBusqueda
+
+# Pesos por campo, los mismos de SearchRank (A, B, C)
+PESO_A = 1.0
+PESO_B = 0.4
+PESO_C = 0.2
+
+# Fracción mínima de trigramas de la búsqueda que debe tener un registro
+# (el mismo valor por defecto de pg_trgm.word_similarity_threshold)
+UMBRAL_SIMILITUD = 0.6
+
+CONFIG_TEXTO = 'spanish'
+
+# Resultados por tipo en la búsqueda global
+LIMITE_GLOBAL = 5
+
+# Máximo de sugerencias del autocompletado de materiales
+LIMITE_SUGERENCIAS = 20
+
+
+class Indice:
+    """
+    Campos buscables de un modelo. campos: (campo, peso) del propio modelo;
+    relacionados: (relación, campo, peso) de un modelo relacionado por FK;
+    texto_completo: campos de texto largo que además se buscan por palabras.
+    """
+    def __init__(self, clave, modelo, campos, relacionados=(), texto_completo=()):
+        self.clave = clave
+        self.modelo = modelo
+        self.campos = campos
+        self.relacionados = relacionados
+        self.texto_completo = texto_completo
+
+    def campos_de_token(self):
+        """Campos que se leen para indexar un registro"""
+        return [campo for campo, _ in self.campos] + [
+            f'{relacion}__{campo}' for relacion, campo, _ in self.relacionados
+        ]
+
+
+INDICES = {
+    indice.clave: indice for indice in (
+        Indice('cotizacion', Cotizacion,
+               campos=[('numero', PESO_A), ('referencia', PESO_C)],
+               relacionados=[('cliente', 'nombre', PESO_B)],
+               texto_completo=['referencia']),
+        Indice('cliente', Cliente,
+               campos=[('nombre', PESO_A), ('rut', PESO_A), ('email', PESO_B)]),
+        Indice('material', Material,
+               campos=[('codigo', PESO_A), ('nombre', PESO_A), ('descripcion', PESO_C)],
+               texto_completo=['descripcion']),
+    )
+}
+
+
+def indice_de(modelo):
+    for indice in INDICES.values():
+        if indice.modelo is modelo:
+            return indice
+    raise LookupError(f'{modelo.__name__} no tiene índice de búsqueda')
+
+
+def usa_tokens():
+    """Sin PostgreSQL la búsqueda usa la tabla de tokens"""
+    return connection.vendor != 'postgresql'
+
+
+# Normalización y trigramas
+
+def palabras(texto):
+    """
+    Palabras en minúsculas y sin tildes. Un grupo con separadores internos
+    (RUT, número de cotización, email) agrega además su forma compacta, para
+    que '12.345.678-9' y '123456789' coincidan.
+    """
+    texto = unicodedata.normalize('NFKD', str(texto or '')).encode('ascii', 'ignore').decode().lower()
+    resultado = []
+    for grupo in texto.split():
+        partes = re.findall(r'[a-z0-9]+', grupo)
+        resultado.extend(partes)
+        if len(partes) > 1:
+            resultado.append(''.join(partes))
+    return resultado
+
+
+def trigramas(texto):
+    """Trigramas de cada palabra con el mismo relleno que pg_trgm"""
+    resultado = set()
+    for palabra in palabras(texto):
+        relleno = f'  {palabra} '
+        resultado.update(relleno[i:i + 3] for i in range(len(relleno) - 2))
+    return resultado
+
+
+def tokens_de(valores):
+    """Trigramas de un registro con el mayor peso de los campos donde aparecen"""
+    tokens = {}
+    for valor, peso in valores:
+        for trigrama in trigramas(valor):
+            tokens[trigrama] = max(tokens.get(trigrama, 0), peso)
+    return tokens
+
+
+# Mantención de la tabla de tokens
+
+def indexar(modelo, pks):
+    """Reconstruye los tokens de los registros indicados (consultas por lote)"""
+    if not usa_tokens():
+        return
+    indice = indice_de(modelo)
+    filas = modelo.objects.filter(pk__in=pks).values_list('pk', *indice.campos_de_token())
+    _guardar_tokens(indice, {pk: valores for pk, *valores in filas})
+
+
+def indexar_objeto(instancia):
+    """Reconstruye los tokens de un registro con los valores que ya tiene en memoria"""
+    if not usa_tokens():
+        return
+    indice = indice_de(type(instancia))
+    valores = [getattr(instancia, campo) for campo, _ in indice.campos] + [
+        getattr(getattr(instancia, relacion), campo) for relacion, campo, _ in indice.relacionados
+    ]
+    _guardar_tokens(indice, {instancia.pk: valores})
+
+
+def _guardar_tokens(indice, valores_por_pk):
+    if not valores_por_pk:
+        return
+    pesos = [peso for _, peso in indice.campos] + [peso for _, _, peso in indice.relacionados]
+    nuevos = [
+        TokenBusqueda(indice=indice.clave, objeto_id=pk, token=token, peso=peso)
+        for pk, valores in valores_por_pk.items()
+        for token, peso in tokens_de(zip(valores, pesos)).items()
+    ]
+    # Sin savepoint: dentro de otra transacción (la del save) no agrega consultas
+    with transaction.atomic(savepoint=False):
+        TokenBusqueda.objects.filter(indice=indice.clave, objeto_id__in=list(valores_por_pk)).delete()
+        TokenBusqueda.objects.bulk_create(nuevos, batch_size=1000)
+
+
+def desindexar(modelo, pks):
+    if usa_tokens():
+        TokenBusqueda.objects.filter(indice=indice_de(modelo).clave, objeto_id__in=list(pks)).delete()
+
+
+def reconstruir(modelo, lote=500):
+    """Reindexa todos los registros de un modelo; devuelve cuántos"""
+    total = 0
+    pks = list(modelo.objects.order_by('pk').values_list('pk', flat=True))
+    TokenBusqueda.objects.filter(indice=indice_de(modelo).clave).exclude(
+        objeto_id__in=modelo.objects.values('pk')
+    ).delete()
+    for inicio in range(0, len(pks), lote):
+        indexar(modelo, pks[inicio:inicio + lote])
+        total += len(pks[inicio:inicio + lote])
+    return total
+
+
+# Consulta
+
+def buscar(queryset, texto):
+    """
+    Filtra el queryset por el texto y lo anota con 'relevancia'. Los
+    resultados quedan ordenados de mayor a menor relevancia y luego por el
+    orden original del queryset. Un texto sin letras ni números no filtra.
+    """
+    if not palabras(texto):
+        return queryset
+    indice = indice_de(queryset.model)
+    orden = queryset.query.order_by or queryset.model._meta.ordering
+    if usa_tokens():
+        queryset = _buscar_tokens(queryset, indice, texto)
+    else:
+        queryset = _buscar_postgres(queryset, indice, texto)
+    return queryset.order_by('-relevancia', *orden)
+
+
+def _buscar_tokens(queryset, indice, texto):
+    consulta = trigramas(texto)
+    minimo = max(1, round(len(consulta) * UMBRAL_SIMILITUD))
+    coincidencias = (
+        TokenBusqueda.objects
+        .filter(indice=indice.clave, token__in=consulta)
+        .values('objeto_id')
+        .annotate(puntaje=Sum('peso'), cantidad=Count('token'))
+        .filter(cantidad__gte=minimo)
+    )
+    relevancia = Subquery(
+        coincidencias.filter(objeto_id=OuterRef('pk')).values('puntaje')[:1],
+        output_field=FloatField(),
+    )
+    return (
+        queryset
+        .filter(pk__in=coincidencias.values('objeto_id'))
+        .annotate(relevancia=relevancia / Value(float(len(consulta))))
+    )
+
+
+def _buscar_postgres(queryset, indice, texto):
+    from django.contrib.postgres.lookups import TrigramWordSimilar
+    from django.contrib.postgres.search import (
+        SearchQuery, SearchRank, SearchVector, SearchVectorExact, TrigramWordSimilarity,
+    )
+
+    # Cada condición usa un índice (0003): trigramas por campo y texto
+    # completo en los campos largos; los campos relacionados se filtran con
+    # una subconsulta sobre su propia tabla
+    filtro = Q()
+    for campo, _ in indice.campos:
+        filtro |= Q(TrigramWordSimilar(F(campo), texto))
+    for relacion, campo, _ in indice.relacionados:
+        relacionado = indice.modelo._meta.get_field(relacion).related_model
+        filtro |= Q(**{f'{relacion}__in': relacionado.objects.filter(
+            TrigramWordSimilar(F(campo), texto)
+        ).values('pk')})
+
+    consulta = SearchQuery(texto, config=CONFIG_TEXTO, search_type='websearch')
+    for campo in indice.texto_completo:
+        filtro |= Q(SearchVectorExact(SearchVector(campo, config=CONFIG_TEXTO), consulta))
+
+    similitudes = [
+        TrigramWordSimilarity(texto, campo) * Value(peso)
+        for campo, peso in indice.campos
+    ] + [
+        TrigramWordSimilarity(texto, f'{relacion}__{campo}') * Value(peso)
+        for relacion, campo, peso in indice.relacionados
+    ]
+    relevancia = Greatest(*similitudes) if len(similitudes) > 1 else similitudes[0]
+    if indice.texto_completo:
+        vector = SearchVector(*indice.texto_completo, config=CONFIG_TEXTO)
+        relevancia = relevancia + Coalesce(SearchRank(vector, consulta), Value(0.0))
+    return queryset.filter(filtro).annotate(relevancia=relevancia)
+
+
+def busqueda_global(texto, limite=LIMITE_GLOBAL):
+    """Los mejores resultados de cada tipo para la caja de búsqueda global"""
+    return {
+        'cotizaciones': list(buscar(Cotizacion.objects.select_related('cliente'), texto)[:limite]),
+        'clientes': list(buscar(Cliente.objects.all(), texto)[:limite]),
+        'materiales': list(buscar(Material.objects.all(), texto)[:limite]),
+    }
+
+
+# Autocompletado
+
+def sugerir_materiales(texto, limite=LIMITE_SUGERENCIAS):
+    """
+    Materiales activos cuyo código, nombre o categoría empieza con el texto
+    (sin distinguir mayúsculas), como diccionarios. Primero el código exacto,
+    luego los que coinciden por código, por nombre y por categoría; a igual
+    relevancia, por nombre. Cada condición usa un índice de prefijo (0006),
+    así que el costo depende de la cantidad de resultados y no del catálogo.
+    """
+    texto = texto.strip()
+    if not texto:
+        return []
+    relevancia = Case(
+        When(codigo__iexact=texto, then=Value(0)),
+        When(codigo__istartswith=texto, then=Value(1)),
+        When(nombre__istartswith=texto, then=Value(2)),
+        default=Value(3),
+        output_field=IntegerField(),
+    )
+    materiales = (
+        Material.objects
+        .filter(Q(codigo__istartswith=texto) | Q(nombre__istartswith=texto) | Q(categoria__istartswith=texto),
+                activo=True)
+        .annotate(relevancia=relevancia)
+        .order_by('relevancia', 'nombre', 'id')
+    )
+    return list(materiales.values('id', 'codigo', 'nombre', 'precio_unitario', 'unidad', 'categoria')[:limite])
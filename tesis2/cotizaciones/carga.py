@@ -0,0 +1,41 @@
+# cotizaciones/carga.py
+"""Carga de una cotización completa (cabecera, items y parámetros) en consultas fijas"""
+from django.db.models import Prefetch, prefetch_related_objects
+from django.shortcuts import get_object_or_404
+
+from .models import Cotizacion, ItemMaterial, ItemServicio, ParametroItemServicio
+
+
+def _prefetch_items():
+    """Un Prefetch por relación: la cantidad de consultas no depende de los items"""
+    return [
+        Prefetch(
+            'items_servicio',
+            queryset=ItemServicio.objects.select_related('servicio').prefetch_related(
+                Prefetch(
+                    'parametros',
+                    queryset=ParametroItemServicio.objects.select_related('parametro').order_by('pk'),
+                )
+            ),
+        ),
+        Prefetch('items_material', queryset=ItemMaterial.objects.select_related('material')),
+        'items_mano_obra',
+    ]
+
+
+def cotizaciones_completas():
+    """Cotizaciones con cliente, tipo de trabajo, creador, items y parámetros"""
+    return Cotizacion.objects.select_related(
+        'cliente', 'tipo_trabajo', 'creado_por'
+    ).prefetch_related(*_prefetch_items())
+
+
+def cargar_cotizacion(pk):
+    """Cotización completa o 404 (5 consultas sin importar la cantidad de items)"""
+    return get_object_or_404(cotizaciones_completas(), pk=pk)
+
+
+def cargar_items(cotizacion):
+    """Carga los items y parámetros en una cotización ya obtenida"""
+    prefetch_related_objects([cotizacion], *_prefetch_items())
+    return cotizacion
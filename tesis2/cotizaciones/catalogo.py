@@ -0,0 +1,142 @@
+# cotizaciones/catalogo.py
+"""
+Caché versionada del catálogo de servicios que usa el formulario de
+cotización: categorías y servicios activos y los parámetros de cada servicio.
+Los materiales no forman parte: el editor los busca por prefijo
+(busqueda.sugerir_materiales), así que su peso no depende del catálogo.
+
+La versión es la marca de tiempo (en microsegundos) del último cambio y vive
+en la caché de Django sin expiración, así que solo cambia cuando cambia el
+catálogo; las señales la cambian al guardar o eliminar un
+ServicioBase, ParametroServicio o CategoriaServicio. El catálogo se
+guarda en la caché bajo su versión y además en memoria del proceso, así que
+una lectura cuesta una consulta a la caché (la de la versión). La versión
+también es el ETag y la fecha Last-Modified de las APIs del catálogo, y
+snapshot() entrega el catálogo completo como JSON (y comprimido con gzip)
+para que el navegador lo guarde y solo lo vuelva a pedir si cambia.
+
+La caché debe ser compartida por los procesos del servidor (ver CACHES):
+con una por proceso cada uno tendría su propia versión y no vería los
+cambios hechos en los demás. El catálogo guardado bajo cada versión sí
+expira (CATALOGO_CACHE_TTL).
+"""
+import json
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F
+from django.utils.text import compress_string
+
+from .models import CategoriaServicio, ParametroServicio, ServicioBase
+
+CLAVE_VERSION = 'cotizaciones:catalogo:version'
+
+# Copias en memoria del proceso: (versión, catálogo) y (versión, JSON, JSON comprimido)
+_local = (None, None)
+_snapshot = (None, None, None)
+
+
+def _clave(numero):
+    return f'cotizaciones:catalogo:{numero}'
+
+
+def version():
+    """Versión actual del catálogo; si la caché no la tiene, se crea una nueva"""
+    numero = cache.get(CLAVE_VERSION)
+    if numero is None:
+        # add() no pisa la de otro proceso que la haya creado primero
+        cache.add(CLAVE_VERSION, time.time_ns() // 1000, timeout=None)
+        numero = cache.get(CLAVE_VERSION)
+    return numero
+
+
+def invalidar():
+    """Publica una versión nueva, ahora y de nuevo al confirmarse la transacción"""
+    _nueva_version()
+    # Un proceso que lea entre el cambio y el commit guardaría el catálogo
+    # anterior bajo la versión nueva; la segunda versión lo descarta
+    transaction.on_commit(_nueva_version)
+
+
+def _nueva_version():
+    anterior = cache.get(CLAVE_VERSION) or 0
+    cache.set(CLAVE_VERSION, max(time.time_ns() // 1000, anterior + 1), timeout=None)
+
+
+def etag(request=None, *args, **kwargs):
+    """
+    ETag de las APIs del catálogo (firma de etag_func de @condition). Es
+    débil: la misma versión puede enviarse comprimida o no.
+    """
+    return f'W/"{version()}"'
+
+
+def ultima_modificacion(request=None, *args, **kwargs):
+    """Fecha del último cambio (firma de last_modified_func de @condition)"""
+    return datetime.fromtimestamp(version() / 1e6, tz=timezone.utc)
+
+
+def calcular():
+    """Lee el catálogo de la BD (tres consultas)"""
+    servicios = {}
+    for servicio in ServicioBase.objects.filter(activo=True).order_by('categoria', 'nombre').values(
+        'id', 'categoria_id', 'nombre', 'precio_base', 'unidad', 'es_parametrizable',
+    ):
+        servicios.setdefault(servicio.pop('categoria_id'), []).append(servicio)
+
+    parametros = {}
+    for parametro in ParametroServicio.objects.order_by('servicio', 'orden', 'nombre').values(
+        'id', 'servicio_id', 'nombre', 'tipo', 'requerido', 'opciones', 'valor_por_defecto',
+        opciones_list=F('opciones_lista'),
+    ):
+        parametros.setdefault(parametro.pop('servicio_id'), []).append(parametro)
+
+    return {
+        'categorias': list(CategoriaServicio.objects.filter(activo=True).values('id', 'nombre')),
+        'servicios': servicios,
+        'parametros': parametros,
+    }
+
+
+def obtener():
+    """Catálogo de la versión actual: de la memoria del proceso, de la caché o de la BD"""
+    global _local
+    numero = version()
+    if _local[0] == numero:
+        return _local[1]
+    catalogo = cache.get(_clave(numero))
+    if catalogo is None:
+        catalogo = calcular()
+        cache.set(_clave(numero), catalogo, settings.CATALOGO_CACHE_TTL)
+    _local = (numero, catalogo)
+    return catalogo
+
+
+def snapshot():
+    """
+    (versión, JSON, JSON comprimido con gzip) del catálogo completo, con los
+    servicios por categoría y los parámetros por servicio. Se serializa y se
+    comprime una vez por versión en cada proceso.
+    """
+    global _snapshot
+    numero = version()
+    if _snapshot[0] != numero:
+        cuerpo = json.dumps({'version': numero, **obtener()}, cls=DjangoJSONEncoder).encode('utf-8')
+        _snapshot = (numero, cuerpo, compress_string(cuerpo))
+    return _snapshot
+
+
+def categorias():
+    return obtener()['categorias']
+
+
+def servicios_de_categoria(categoria_id):
+    return obtener()['servicios'].get(categoria_id, [])
+
+
+def parametros_de_servicio(servicio_id):
+    return obtener()['parametros'].get(servicio_id, [])
@@ -0,0 +1,21 @@
+# cotizaciones/documentos.py
+"""Generación del documento de una cotización"""
+from django.template.loader import get_template
+
+from .models import ConfiguracionEmpresa
+
+
+def contexto_documento(cotizacion):
+    """Contexto de detalle.html; la cotización debe venir de carga.cargar_cotizacion"""
+    return {
+        'cotizacion': cotizacion,
+        'config_empresa': ConfiguracionEmpresa.get_config(),
+        'items_servicio': cotizacion.items_servicio.all(),
+        'items_material': cotizacion.items_material.all(),
+        'items_mano_obra': cotizacion.items_mano_obra.all(),
+    }
+
+
+def renderizar_html(cotizacion):
+    """HTML imprimible de la cotización (usa el template detalle.html)"""
+    return get_template('cotizaciones/detalle.html').render(contexto_documento(cotizacion))
@@ -0,0 +1,64 @@
+# cotizaciones/estadisticas.py
+"""
+Estadísticas del dashboard de cotizaciones. Se calculan con una sola consulta
+de agregación condicional (el mes es un rango sobre el índice de
+fecha_creacion) y se guardan en caché; las señales las invalidan cuando una
+cotización se crea, se elimina o cambia su estado o su total.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from .fechas import rango_mes
+from .models import Cotizacion
+
+# Campos cuyo cambio altera las estadísticas
+CAMPOS_ESTADISTICAS = {'estado', 'valor_total'}
+
+
+def _clave(inicio_mes):
+    # El mes va en la clave: al cambiar de mes no se lee el conteo anterior
+    return f'cotizaciones:dashboard:{inicio_mes:%Y-%m}'
+
+
+def calcular_estadisticas():
+    inicio_mes, fin_mes = rango_mes()
+    del_mes = Q(fecha_creacion__gte=inicio_mes, fecha_creacion__lt=fin_mes)
+    estados = [estado for estado, _ in Cotizacion.ESTADO_CHOICES]
+    totales = Cotizacion.objects.aggregate(
+        total=Count('id'),
+        mes=Count('id', filter=del_mes),
+        valor_mes=Sum('valor_total', filter=del_mes),
+        **{f'estado_{estado}': Count('id', filter=Q(estado=estado)) for estado in estados},
+    )
+    por_estado = [
+        {'estado': estado, 'total': totales[f'estado_{estado}']}
+        for estado in estados if totales[f'estado_{estado}']
+    ]
+    return {
+        'total_cotizaciones': totales['total'],
+        'cotizaciones_mes': totales['mes'],
+        'cotizaciones_pendientes': totales['estado_enviada'],
+        'valor_total_mes': totales['valor_mes'] or 0,
+        'estados_stats': sorted(por_estado, key=lambda fila: -fila['total']),
+    }
+
+
+def estadisticas_dashboard():
+    """Estadísticas del dashboard desde la caché o, si no están, desde la BD"""
+    clave = _clave(rango_mes()[0])
+    estadisticas = cache.get(clave)
+    if estadisticas is None:
+        estadisticas = calcular_estadisticas()
+        cache.set(clave, estadisticas, settings.DASHBOARD_CACHE_TTL)
+    return estadisticas
+
+
+def invalidar_estadisticas():
+    """Borra las estadísticas del mes, ahora y de nuevo al confirmarse la transacción"""
+    clave = _clave(rango_mes()[0])
+    cache.delete(clave)
+    # Un request que lea entre el cambio y el commit guardaría las
+    # estadísticas anteriores en la caché; se borran de nuevo al confirmar
+    transaction.on_commit(lambda: cache.delete(clave))
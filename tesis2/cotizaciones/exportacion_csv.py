@@ -0,0 +1,126 @@
+# cotizaciones/exportacion_csv.py
+"""
+Columnas de la exportación CSV de cotizaciones, clientes y materiales (ver
+home/exportacion.py). Con items, cada fila es un item de servicio, material o
+mano de obra junto a los datos de su cotización; las cotizaciones sin items
+salen en una fila con las columnas del item vacías.
+"""
+import heapq
+
+from django.db.models import Exists, OuterRef, TextField, Value
+from django.db.models.functions import Coalesce, NullIf
+
+from home.exportacion import (
+    TAMANO_LOTE, encabezados, exportar_csv, fecha, fecha_hora, filas, opciones, respuesta_csv, si_no,
+)
+
+from .models import Cotizacion, ItemManoObra, ItemMaterial, ItemServicio
+
+COLUMNAS_COTIZACIONES = [
+    ('Número', 'numero', None),
+    ('Fecha', 'fecha_creacion', fecha_hora),
+    ('Cliente', 'cliente__nombre', None),
+    ('RUT', 'cliente__rut', None),
+    ('Referencia', 'referencia', None),
+    ('Lugar', 'lugar', None),
+    ('Tipo de trabajo', 'tipo_trabajo__nombre', None),
+    ('Estado', 'estado', opciones(Cotizacion.ESTADO_CHOICES)),
+    ('Vencimiento', 'fecha_vencimiento', fecha),
+    ('Neto', 'valor_neto', None),
+    ('IVA', 'valor_iva', None),
+    ('Total', 'valor_total', None),
+    ('Creada por', 'creado_por__username', None),
+]
+
+COLUMNAS_ITEMS = ['Tipo de item', 'Descripción', 'Cantidad', 'Precio unitario', 'Subtotal']
+
+COLUMNAS_CLIENTES = [
+    ('Nombre', 'nombre', None),
+    ('Atención', 'atencion', None),
+    ('RUT', 'rut', None),
+    ('Dirección', 'direccion', None),
+    ('Teléfono', 'telefono', None),
+    ('Email', 'email', None),
+    ('Estado', 'activo', si_no('Activo', 'Inactivo')),
+    ('Fecha Creación', 'fecha_creacion', fecha_hora),
+]
+
+# Los mismos encabezados que acepta la importación de materiales
+COLUMNAS_MATERIALES = [
+    ('codigo', 'codigo', None),
+    ('nombre', 'nombre', None),
+    ('descripcion', 'descripcion', None),
+    ('precio_unitario', 'precio_unitario', None),
+    ('unidad', 'unidad', None),
+    ('categoria', 'categoria', None),
+    ('activo', 'activo', si_no('1', '0')),
+]
+
+
+def _descripcion(nombre):
+    """Descripción personalizada del item o, si no tiene, el nombre en el catálogo"""
+    return Coalesce(NullIf('descripcion_personalizada', Value('')), nombre, output_field=TextField())
+
+
+# Por tipo de item: modelo, etiqueta, columnas propias y orden dentro de la cotización
+_ITEMS = [
+    (ItemServicio, 'Servicio', [_descripcion('servicio__nombre'), 'cantidad', 'precio_unitario', 'subtotal'], 'orden'),
+    (ItemMaterial, 'Material', [_descripcion('material__nombre'), 'cantidad', 'precio_unitario', 'subtotal'], 'id'),
+    (ItemManoObra, 'Mano de obra', ['descripcion', 'horas', 'precio_hora', 'subtotal'], 'id'),
+]
+
+
+def _filas_items(cotizaciones, modelo, tipo, campos, orden, lote):
+    """Filas de un tipo de item, con la clave de orden de su cotización"""
+    items = modelo.objects.filter(cotizacion__in=cotizaciones.values('pk')).order_by(
+        '-cotizacion__fecha_creacion', 'cotizacion_id', orden,
+    )
+    columnas = (
+        [(None, 'cotizacion__fecha_creacion', None), (None, 'cotizacion_id', None)]
+        + [(encabezado, f'cotizacion__{campo}', formato) for encabezado, campo, formato in COLUMNAS_COTIZACIONES]
+        + [(None, campo, None) for campo in campos]
+    )
+    inicio_items = 2 + len(COLUMNAS_COTIZACIONES)
+    for fila in filas(items, columnas, lote):
+        yield (fila[0], -fila[1]), fila[2:inicio_items] + [tipo] + fila[inicio_items:]
+
+
+def _filas_sin_items(cotizaciones, lote):
+    """Una fila por cotización sin items, con las columnas del item vacías"""
+    sin_items = cotizaciones.order_by('-fecha_creacion', 'id')
+    for modelo, *_ in _ITEMS:
+        sin_items = sin_items.filter(~Exists(modelo.objects.filter(cotizacion=OuterRef('pk'))))
+    columnas = [(None, 'fecha_creacion', None), (None, 'id', None)] + COLUMNAS_COTIZACIONES
+    vacias = [''] * len(COLUMNAS_ITEMS)
+    for fila in filas(sin_items, columnas, lote):
+        yield (fila[0], -fila[1]), fila[2:] + vacias
+
+
+def filas_con_items(cotizaciones, lote=TAMANO_LOTE):
+    """
+    Una fila por item, ordenadas como la lista de cotizaciones. Cada tipo de
+    item (y las cotizaciones sin items) se lee con su propia consulta ya
+    ordenada y se intercalan con heapq.merge, sin cargar ninguna completa en
+    memoria.
+    """
+    tipos = [_filas_items(cotizaciones, *item, lote) for item in _ITEMS]
+    tipos.append(_filas_sin_items(cotizaciones, lote))
+    for _, fila in heapq.merge(*tipos, key=lambda par: par[0], reverse=True):
+        yield fila
+
+
+def exportar_cotizaciones(cotizaciones, items=False):
+    if items:
+        return respuesta_csv(
+            'cotizaciones_items.csv', encabezados(COLUMNAS_COTIZACIONES) + COLUMNAS_ITEMS,
+            filas_con_items(cotizaciones),
+        )
+    return exportar_csv('cotizaciones.csv', cotizaciones.order_by('-fecha_creacion', 'id'), COLUMNAS_COTIZACIONES)
+
+
+def exportar_clientes(clientes):
+    return exportar_csv('clientes.csv', clientes.order_by('nombre', 'id'), COLUMNAS_CLIENTES)
+
+
+def exportar_materiales(materiales):
+    return exportar_csv('materiales.csv', materiales.order_by('nombre', 'id'), COLUMNAS_MATERIALES)
@@ -0,0 +1,137 @@
+# cotizaciones/exportacion_pdf.py
+"""
+Exportación masiva de cotizaciones en PDF. Los PDF que no están en caché se
+generan en un pool de procesos y el ZIP se arma por partes, a medida que cada
+archivo está listo, sin mantenerlo completo en memoria.
+"""
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+from trabajos import proceso
+
+from .carga import cotizaciones_completas
+from .fechas import rango_dias
+from .models import ConfiguracionEmpresa, Cotizacion
+from .pdf import obtener_pdf, pdf_en_cache
+
+# Cotizaciones cargadas (con sus items) por consulta al recorrer la exportación
+TAMANO_LOTE = 100
+
+
+def filtrar_cotizaciones(estado='aprobada', cliente=None, desde=None, hasta=None):
+    """Cotizaciones a exportar; desde y hasta son fechas (inclusive) o texto ISO"""
+    cotizaciones = Cotizacion.objects.all()
+    if estado:
+        cotizaciones = cotizaciones.filter(estado=estado)
+    if cliente:
+        cotizaciones = cotizaciones.filter(cliente_id=cliente)
+    inicio, fin = rango_dias(desde and _fecha(desde), hasta and _fecha(hasta))
+    if inicio:
+        cotizaciones = cotizaciones.filter(fecha_creacion__gte=inicio)
+    if fin:
+        cotizaciones = cotizaciones.filter(fecha_creacion__lt=fin)
+    # El mismo orden de los índices de Cotizacion (recorridos hacia atrás)
+    return cotizaciones.order_by('fecha_creacion', '-pk')
+
+
+def _fecha(valor):
+    return valor if isinstance(valor, date) else date.fromisoformat(valor)
+
+
+def nombre_archivo(numero):
+    return f'cotizacion_{numero}.pdf'
+
+
+def pdf_en_proceso(cotizacion_id):
+    """Genera (o lee de la caché) un PDF dentro de un proceso del pool"""
+    from django.db import close_old_connections
+
+    close_old_connections()
+    cotizacion = cotizaciones_completas().get(pk=cotizacion_id)
+    return obtener_pdf(cotizacion)
+
+
+def _crear_pool(procesos):
+    return ProcessPoolExecutor(
+        max_workers=procesos,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=proceso.inicializar,
+        initargs=(os.environ['DJANGO_SETTINGS_MODULE'],),
+    )
+
+
+def generar_pdfs(cotizaciones, procesos=1, progreso=None):
+    """
+    Genera pares (nombre, bytes) en el orden en que cada PDF queda listo.
+    Los que ya están en caché se entregan de inmediato; el resto se genera en
+    'procesos' procesos (1 = en el proceso actual). progreso, si se indica, se
+    llama con (listos, total).
+    """
+    config = ConfiguracionEmpresa.get_config()
+    total = cotizaciones.count()
+    listos = 0
+    pool = None
+    en_curso = {}
+
+    def entregar(numero, contenido):
+        nonlocal listos
+        listos += 1
+        if progreso:
+            progreso(listos, total)
+        return nombre_archivo(numero), contenido
+
+    try:
+        completas = cotizaciones_completas().filter(pk__in=cotizaciones.values('pk')).order_by('fecha_creacion', '-pk')
+        for cotizacion in completas.iterator(chunk_size=TAMANO_LOTE):
+            contenido = pdf_en_cache(cotizacion, config)
+            if contenido is None and procesos <= 1:
+                contenido = obtener_pdf(cotizacion, config)
+            if contenido is not None:
+                yield entregar(cotizacion.numero, contenido)
+                continue
+
+            if pool is None:
+                pool = _crear_pool(procesos)
+            en_curso[pool.submit(pdf_en_proceso, cotizacion.pk)] = cotizacion.numero
+
+            # Entregar los que ya terminaron sin esperar al resto
+            for futuro in [f for f in en_curso if f.done()]:
+                yield entregar(en_curso.pop(futuro), futuro.result())
+
+        for futuro in as_completed(list(en_curso)):
+            yield entregar(en_curso.pop(futuro), futuro.result())
+    finally:
+        # Si el cliente corta la descarga se cancelan los pendientes
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _Salida:
+    """Destino de solo escritura para ZipFile; se vacía después de cada archivo"""
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+def zip_por_partes(archivos):
+    """Arma un ZIP con los pares (nombre, bytes) y lo entrega en fragmentos"""
+    salida = _Salida()
+    with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_DEFLATED) as archivo_zip:
+        for nombre, contenido in archivos:
+            archivo_zip.writestr(nombre, contenido)
+            yield salida.vaciar()
+    yield salida.vaciar()
@@ -0,0 +1,29 @@
+# cotizaciones/fechas.py
+"""
+Períodos como límites [inicio, fin) para filtrar columnas DateTimeField.
+Un filtro fecha_creacion__gte/__lt recorre el índice de la columna;
+__month, __year y __date aplican una función a cada fila y no pueden usarlo.
+"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+
+def inicio_del_dia(dia):
+    """Medianoche local del día, con zona horaria"""
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def rango_mes(momento=None):
+    """(inicio, fin) del mes local que contiene a momento (por defecto, ahora)"""
+    inicio = timezone.localdate(momento).replace(day=1)
+    siguiente = (inicio + timedelta(days=32)).replace(day=1)
+    return inicio_del_dia(inicio), inicio_del_dia(siguiente)
+
+
+def rango_dias(desde=None, hasta=None):
+    """(inicio, fin) entre dos fechas inclusive; None deja ese extremo abierto"""
+    return (
+        inicio_del_dia(desde) if desde else None,
+        inicio_del_dia(hasta + timedelta(days=1)) if hasta else None,
+    )
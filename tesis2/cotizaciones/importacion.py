@@ -0,0 +1,195 @@
+# cotizaciones/importacion.py
+"""Importación masiva de materiales desde CSV o XLSX, procesada por lotes"""
+import csv
+import io
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.db import transaction
+
+from . import busqueda
+from .models import CENTAVOS, Material
+
+CAMPOS_REQUERIDOS = ['codigo', 'nombre', 'precio_unitario']
+CAMPOS_ACTUALIZABLES = ['nombre', 'categoria', 'precio_unitario', 'unidad', 'descripcion', 'activo']
+TAMANO_LOTE = 1000
+# Máximo de errores detallados que se devuelven; el total siempre se informa
+MAX_ERRORES_REPORTE = 500
+
+_LARGOS = {
+    campo: Material._meta.get_field(campo).max_length
+    for campo in ('codigo', 'nombre', 'unidad', 'categoria')
+}
+
+
+class ArchivoInvalido(ValueError):
+    """El archivo no se puede procesar (formato o encabezados)"""
+
+
+def _filas_csv(archivo):
+    """Lee el CSV de forma incremental; retorna (encabezados, iterador de filas)"""
+    texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    lector = csv.reader(texto)
+    try:
+        encabezados = next(lector)
+    except StopIteration:
+        raise ArchivoInvalido('Archivo CSV vacío o sin datos')
+    return encabezados, lector
+
+
+def _filas_xlsx(archivo):
+    """Lee la primera hoja de un XLSX en modo de solo lectura (requiere openpyxl)"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ArchivoInvalido('Para importar archivos XLSX se requiere el paquete openpyxl')
+
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    filas = libro.worksheets[0].iter_rows(values_only=True)
+    try:
+        encabezados = next(filas)
+    except StopIteration:
+        raise ArchivoInvalido('Archivo XLSX vacío o sin datos')
+    encabezados = ['' if h is None else str(h) for h in encabezados]
+    return encabezados, (
+        ['' if v is None else str(v) for v in fila] for fila in filas
+    )
+
+
+def _validar_fila(datos):
+    """Convierte una fila en los valores del material; lanza ValueError si es inválida"""
+    codigo = datos.get('codigo', '').strip()
+    nombre = datos.get('nombre', '').strip()
+    if not codigo or not nombre:
+        raise ValueError('Código y nombre son obligatorios')
+
+    try:
+        precio = Decimal(datos.get('precio_unitario', '').strip())
+    except InvalidOperation:
+        raise ValueError('Precio unitario inválido')
+    if not precio.is_finite() or precio < 0:
+        raise ValueError('Precio unitario inválido')
+    try:
+        # Valores como 1e30 superan la precisión del contexto al redondear.
+        # Mismo redondeo que el resto de los montos (ver calcular_subtotal)
+        precio = precio.quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        raise ValueError('Precio unitario fuera de rango')
+    if len(precio.as_tuple().digits) > Material._meta.get_field('precio_unitario').max_digits:
+        raise ValueError('Precio unitario fuera de rango')
+
+    valores = {
+        'codigo': codigo,
+        'nombre': nombre,
+        'categoria': datos.get('categoria', '').strip(),
+        'precio_unitario': precio,
+        'unidad': datos.get('unidad', '').strip() or 'UND',
+        'descripcion': datos.get('descripcion', '').strip(),
+        'activo': True,
+    }
+    for campo, largo in _LARGOS.items():
+        if len(valores[campo]) > largo:
+            raise ValueError(f'El campo {campo} supera {largo} caracteres')
+    return valores
+
+
+def importar_materiales(archivo, formato='csv', actualizar_existentes=False,
+                        tamano_lote=TAMANO_LOTE, progreso=None):
+    """
+    Importa materiales desde un archivo binario abierto, sin cargarlo completo
+    en memoria. Cada lote consulta los códigos existentes una sola vez e
+    inserta o actualiza todas sus filas con un bulk_create (upsert por
+    'codigo'). Retorna un resumen con contadores y errores por fila.
+
+    progreso, si se indica, se llama con la cantidad de filas procesadas
+    después de cada lote.
+    """
+    if formato == 'xlsx':
+        encabezados, filas = _filas_xlsx(archivo)
+    else:
+        encabezados, filas = _filas_csv(archivo)
+
+    encabezados = [h.strip().lower() for h in encabezados]
+    for campo in CAMPOS_REQUERIDOS:
+        if campo not in encabezados:
+            raise ArchivoInvalido(f'Campo requerido faltante: {campo}')
+
+    resumen = {
+        'materiales_creados': 0,
+        'materiales_actualizados': 0,
+        'materiales_omitidos': 0,
+        'filas_procesadas': 0,
+        'total_errores': 0,
+        'errores': [],
+    }
+    vistos = set()
+    lote = []
+
+    def registrar_error(numero_fila, codigo, mensaje):
+        resumen['total_errores'] += 1
+        if len(resumen['errores']) < MAX_ERRORES_REPORTE:
+            resumen['errores'].append({'fila': numero_fila, 'codigo': codigo, 'error': mensaje})
+
+    # La fila 1 es el encabezado
+    for numero_fila, valores in enumerate(filas, 2):
+        if not any(v.strip() for v in valores):
+            continue
+        resumen['filas_procesadas'] += 1
+
+        if len(valores) != len(encabezados):
+            registrar_error(numero_fila, '', 'Cantidad de columnas incorrecta')
+            continue
+
+        datos = dict(zip(encabezados, valores))
+        try:
+            material = _validar_fila(datos)
+        except ValueError as e:
+            registrar_error(numero_fila, datos.get('codigo', '').strip(), str(e))
+            continue
+
+        if material['codigo'] in vistos:
+            registrar_error(numero_fila, material['codigo'], 'Código repetido en el archivo')
+            continue
+        vistos.add(material['codigo'])
+
+        lote.append(material)
+        if len(lote) >= tamano_lote:
+            _guardar_lote(lote, actualizar_existentes, resumen)
+            lote = []
+            if progreso:
+                progreso(resumen['filas_procesadas'])
+
+    if lote:
+        _guardar_lote(lote, actualizar_existentes, resumen)
+    if progreso:
+        progreso(resumen['filas_procesadas'])
+
+    return resumen
+
+
+def _guardar_lote(lote, actualizar_existentes, resumen):
+    codigos = [material['codigo'] for material in lote]
+    existentes = set(
+        Material.objects.filter(codigo__in=codigos).values_list('codigo', flat=True)
+    )
+    nuevos = [m for m in lote if m['codigo'] not in existentes]
+
+    with transaction.atomic():
+        if actualizar_existentes:
+            Material.objects.bulk_create(
+                [Material(**m) for m in lote],
+                update_conflicts=True,
+                unique_fields=['codigo'],
+                update_fields=CAMPOS_ACTUALIZABLES,
+            )
+            resumen['materiales_actualizados'] += len(lote) - len(nuevos)
+        else:
+            # Un material creado por otra importación concurrente se omite
+            Material.objects.bulk_create(
+                [Material(**m) for m in nuevos], ignore_conflicts=True
+            )
+            resumen['materiales_omitidos'] += len(lote) - len(nuevos)
+
+        # bulk_create no envía post_save: los tokens de búsqueda se arman aquí
+        busqueda.indexar(Material, Material.objects.filter(codigo__in=codigos).values('pk'))
+
+    resumen['materiales_creados'] += len(nuevos)
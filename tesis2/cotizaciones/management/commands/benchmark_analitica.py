@@ -0,0 +1,139 @@
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from cotizaciones import analitica
+from cotizaciones.models import (
+    CategoriaServicio, Cliente, Cotizacion, ItemServicio, ServicioBase, TipoTrabajo, calcular_subtotal,
+)
+
+ESTADOS = ['borrador', 'enviada', 'aprobada', 'aprobada', 'rechazada', 'vencida']
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _metricas_orm(lote):
+    """Cálculo con instancias de modelo: un objeto por item y acumuladores en diccionarios"""
+    grupos = {}
+    items = ItemServicio.objects.select_related('cotizacion', 'servicio').order_by()
+    for item in items.iterator(chunk_size=lote):
+        fecha = timezone.localtime(item.cotizacion.fecha_creacion)
+        clave = (item.servicio.categoria_id, fecha.year * 12 + fecha.month - 1)
+        grupo = grupos.setdefault(clave, {'ingresos': 0.0, 'base': 0.0, 'cotizaciones': {}})
+        grupo['ingresos'] += float(item.subtotal)
+        grupo['base'] += float(item.cantidad * item.servicio.precio_base)
+        grupo['cotizaciones'][item.cotizacion_id] = item.cotizacion.estado
+    resultado = {}
+    for clave, grupo in grupos.items():
+        estados = list(grupo['cotizaciones'].values())
+        aprobadas = estados.count('aprobada')
+        decididas = sum(estado in analitica.ESTADOS_DECIDIDOS for estado in estados)
+        resultado[clave] = (
+            len(estados), aprobadas, decididas, grupo['ingresos'],
+            (grupo['ingresos'] - grupo['base']) / grupo['ingresos'] if grupo['ingresos'] else None,
+        )
+    return resultado
+
+
+class Command(BaseCommand):
+    help = 'Compara la analítica por categoría (columnas NumPy) con la iteración de instancias del ORM'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1000000)
+        parser.add_argument('--items-por-cotizacion', type=int, default=10)
+        parser.add_argument('--lote', type=int, default=analitica.TAMANO_LOTE)
+        parser.add_argument('--sin-orm', action='store_true', help='Omite la medición con instancias del ORM')
+
+    def handle(self, *args, **options):
+        if not analitica.analitica_disponible():
+            raise CommandError('Para la analítica se requiere el paquete numpy')
+        try:
+            with transaction.atomic():
+                self._ejecutar(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _ejecutar(self, options):
+        azar = random.Random(19)
+        inicio = time.perf_counter()
+        self._generar(azar, options['items'], options['items_por_cotizacion'])
+        self.stdout.write(f"{options['items']} items generados en {time.perf_counter() - inicio:.1f} s")
+
+        inicio = time.perf_counter()
+        columnas = analitica.cargar_columnas(analitica.items_servicio(), options['lote'])
+        lectura = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        agregados = analitica.agregar_por_categoria(columnas)
+        calculo = time.perf_counter() - inicio
+        memoria = sum(columna.nbytes for columna in columnas.values()) / 2 ** 20
+        self.stdout.write(
+            f'NumPy: lectura {lectura:.2f} s, agregación {calculo * 1000:.1f} ms, '
+            f'{len(agregados["periodo"])} grupos, columnas {memoria:.1f} MB'
+        )
+
+        if options['sin_orm']:
+            return
+        inicio = time.perf_counter()
+        orm = _metricas_orm(options['lote'])
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(f'ORM (instancias): {duracion:.2f} s, {len(orm)} grupos')
+        self.stdout.write(f'Aceleración: {duracion / (lectura + calculo):.1f}x')
+        self._comparar(agregados, orm)
+
+    def _generar(self, azar, items, por_cotizacion):
+        usuario = User.objects.create(username='__benchmark_analitica__')
+        cliente = Cliente.objects.create(nombre='Cliente benchmark')
+        tipo = TipoTrabajo.objects.create(nombre='Tipo benchmark')
+        categorias = CategoriaServicio.objects.bulk_create(
+            CategoriaServicio(nombre=f'Categoría benchmark {i}') for i in range(20)
+        )
+        servicios = ServicioBase.objects.bulk_create(
+            ServicioBase(categoria=categorias[i % len(categorias)], nombre=f'Servicio {i}', descripcion='',
+                         precio_base=Decimal(azar.randrange(5000, 50000)))
+            for i in range(200)
+        )
+        ahora = timezone.now()
+        campo = Cotizacion._meta.get_field('fecha_creacion')
+        campo.auto_now_add = False
+        try:
+            cotizaciones = Cotizacion.objects.bulk_create(
+                (Cotizacion(numero=f'BENCH-A-{i}', cliente=cliente, referencia='benchmark', lugar='-',
+                            tipo_trabajo=tipo, creado_por=usuario, estado=azar.choice(ESTADOS),
+                            fecha_creacion=ahora - timezone.timedelta(days=azar.randrange(3 * 365)))
+                 for i in range(max(items // por_cotizacion, 1))),
+                batch_size=1000,
+            )
+        finally:
+            campo.auto_now_add = True
+
+        def items_generados():
+            for i in range(items):
+                servicio = azar.choice(servicios)
+                cantidad = Decimal(azar.randrange(1, 10))
+                precio = (servicio.precio_base * Decimal(azar.uniform(0.9, 1.5))).quantize(Decimal('0.01'))
+                yield ItemServicio(cotizacion=cotizaciones[i // por_cotizacion % len(cotizaciones)],
+                                   servicio=servicio, cantidad=cantidad, precio_unitario=precio,
+                                   subtotal=calcular_subtotal(cantidad, precio), orden=i % por_cotizacion)
+
+        ItemServicio.objects.bulk_create(items_generados(), batch_size=5000)
+
+    def _comparar(self, agregados, orm):
+        diferencias = 0
+        for i, clave in enumerate(zip(agregados['categoria_id'].tolist(), agregados['periodo'].tolist())):
+            cotizaciones, aprobadas, decididas, ingresos, _ = orm.get(clave, (None,) * 5)
+            if (cotizaciones, aprobadas, decididas) != (
+                agregados['cotizaciones'][i], agregados['aprobadas'][i], agregados['decididas'][i]
+            ) or abs(ingresos - agregados['ingresos'][i]) > 0.01 * max(1, abs(ingresos)):
+                diferencias += 1
+        if diferencias or len(orm) != len(agregados['periodo']):
+            self.stderr.write(f'{diferencias} grupos con diferencias entre ambos cálculos')
+        else:
+            self.stdout.write('Ambos cálculos coinciden')
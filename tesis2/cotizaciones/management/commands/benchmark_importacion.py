@@ -0,0 +1,92 @@
+import csv
+import io
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cotizaciones.importacion import importar_materiales
+from cotizaciones.models import Material
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _importar_legacy(archivo, actualizar_existentes):
+    """Importación anterior: archivo completo en memoria y una consulta por fila"""
+    lineas = archivo.read().decode('utf-8').strip().split('\n')
+    headers = [h.strip().lower() for h in lineas[0].split(',')]
+    for linea in lineas[1:]:
+        data = dict(zip(headers, [v.strip().strip('"') for v in linea.split(',')]))
+        material_data = {
+            'codigo': data['codigo'],
+            'nombre': data['nombre'],
+            'categoria': data.get('categoria', ''),
+            'precio_unitario': float(data['precio_unitario']),
+            'unidad': data.get('unidad', 'UND'),
+            'descripcion': data.get('descripcion', ''),
+            'activo': True
+        }
+        existente = Material.objects.filter(codigo=data['codigo']).first()
+        if existente:
+            if actualizar_existentes:
+                for key, value in material_data.items():
+                    setattr(existente, key, value)
+                existente.save()
+        else:
+            Material.objects.create(**material_data)
+
+
+class Command(BaseCommand):
+    help = 'Mide el rendimiento (filas/s) de la importación de materiales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=50000)
+        parser.add_argument('--filas-legacy', type=int, default=2000,
+                            help='Filas para medir la importación anterior (0 para omitir)')
+        parser.add_argument('--lote', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._ejecutar(options['filas'], options['filas_legacy'], options['lote'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _generar_csv(self, filas, prefijo):
+        archivo = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        texto = io.TextIOWrapper(archivo, encoding='utf-8', newline='', write_through=True)
+        escritor = csv.writer(texto)
+        escritor.writerow(['codigo', 'nombre', 'categoria', 'precio_unitario', 'unidad', 'descripcion'])
+        for i in range(filas):
+            escritor.writerow([
+                f'{prefijo}-{i:07d}', f'Material {i}', f'Categoria {i % 40}',
+                f'{1000 + i % 997}.50', 'UND', f'Descripción del material {i}',
+            ])
+        texto.detach()
+        archivo.seek(0)
+        return archivo
+
+    def _medir(self, etiqueta, filas, funcion):
+        inicio = time.perf_counter()
+        funcion()
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(f'{etiqueta:<32} {filas:>8} filas {duracion:>8.2f} s {filas / duracion:>10.0f} filas/s')
+
+    def _ejecutar(self, filas, filas_legacy, lote):
+        archivo = self._generar_csv(filas, 'BENCH')
+        self._medir('lotes: creación', filas, lambda: importar_materiales(archivo, tamano_lote=lote))
+
+        archivo = self._generar_csv(filas, 'BENCH')
+        self._medir('lotes: actualización (upsert)', filas, lambda: importar_materiales(
+            archivo, actualizar_existentes=True, tamano_lote=lote
+        ))
+
+        if filas_legacy:
+            archivo = self._generar_csv(filas_legacy, 'LEGACY')
+            self._medir('anterior: creación', filas_legacy, lambda: _importar_legacy(archivo, False))
+            archivo = self._generar_csv(filas_legacy, 'LEGACY')
+            self._medir('anterior: actualización', filas_legacy, lambda: _importar_legacy(archivo, True))
@@ -0,0 +1,228 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from cotizaciones.fechas import rango_mes
+from cotizaciones.models import (
+    CategoriaServicio, Cliente, Cotizacion, Material, ServicioBase, TipoTrabajo,
+)
+from home.models import PerfilEmpleado
+from home.paginacion import PaginadorCursor
+
+MODELOS = [Cliente, Material, ServicioBase, Cotizacion, PerfilEmpleado]
+
+# Distribución de estados: las enviadas son pocas, como en producción
+ESTADOS = ['borrador'] * 3 + ['enviada'] + ['aprobada'] * 4 + ['rechazada'] + ['vencida']
+CARGOS = ['empleado'] * 6 + ['supervisor'] * 2 + ['gerente', 'director']
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextmanager
+def _sin_auto_now_add(modelo, campo='fecha_creacion'):
+    """Permite fijar fechas de creación repartidas al crear datos sintéticos"""
+    field = modelo._meta.get_field(campo)
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el plan (EXPLAIN) y el tiempo de las consultas de las vistas '
+        'sin y con los índices de los modelos, sobre datos sintéticos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cotizaciones', type=int, default=200000)
+        parser.add_argument('--clientes', type=int, default=5000)
+        parser.add_argument('--materiales', type=int, default=50000)
+        parser.add_argument('--empleados', type=int, default=5000)
+        parser.add_argument('--repeticiones', type=int, default=10)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._ejecutar(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _ejecutar(self, options):
+        azar = random.Random(16)
+        self.stdout.write('Generando datos sintéticos...')
+        datos = self._generar(azar, options)
+        consultas = self._consultas(datos)
+
+        self._cambiar_indices(quitar=True)
+        antes = {nombre: self._medir(funcion, options['repeticiones']) for nombre, _, funcion in consultas}
+        self._cambiar_indices(quitar=False)
+        despues = {nombre: self._medir(funcion, options['repeticiones']) for nombre, _, funcion in consultas}
+
+        for nombre, indice, _ in consultas:
+            (ms_antes, planes_antes), (ms_despues, planes_despues) = antes[nombre], despues[nombre]
+            self.stdout.write('')
+            self.stdout.write(f'== {nombre} [{indice}]')
+            self.stdout.write(f'   sin índices: {ms_antes:9.3f} ms')
+            self._escribir_planes(planes_antes)
+            self.stdout.write(f'   con índices: {ms_despues:9.3f} ms')
+            self._escribir_planes(planes_despues)
+
+    def _generar(self, azar, options):
+        ahora = timezone.now()
+        # Dos años de historia; las fechas al azar dentro del período
+        def fecha():
+            return ahora - timedelta(seconds=azar.randrange(2 * 365 * 24 * 3600))
+
+        usuario = User.objects.create(username='__benchmark_indices__')
+        tipo = TipoTrabajo.objects.create(nombre='Tipo benchmark')
+        categorias = CategoriaServicio.objects.bulk_create(
+            CategoriaServicio(nombre=f'Categoría {i}') for i in range(20)
+        )
+        ServicioBase.objects.bulk_create(
+            (ServicioBase(categoria=azar.choice(categorias), nombre=f'Servicio {i}', descripcion='',
+                          precio_base=Decimal('1000'), activo=azar.random() < 0.9)
+             for i in range(2000)),
+            batch_size=1000,
+        )
+        with _sin_auto_now_add(Cliente):
+            clientes = Cliente.objects.bulk_create(
+                (Cliente(nombre=f'Cliente {azar.randrange(10 ** 6):06d}', fecha_creacion=fecha(),
+                         activo=azar.random() < 0.8)
+                 for _ in range(options['clientes'])),
+                batch_size=1000,
+            )
+        Material.objects.bulk_create(
+            (Material(codigo=f'__BENCH__{i}', nombre=f'Material {azar.randrange(10 ** 6):06d}',
+                      categoria=f'Categoría {azar.randrange(50)}', precio_unitario=Decimal('100'),
+                      activo=azar.random() < 0.9)
+             for i in range(options['materiales'])),
+            batch_size=1000,
+        )
+        with _sin_auto_now_add(Cotizacion):
+            Cotizacion.objects.bulk_create(
+                (Cotizacion(numero=f'BENCH-{i}', cliente=azar.choice(clientes), referencia='benchmark',
+                            lugar='-', tipo_trabajo=tipo, creado_por=usuario, fecha_creacion=fecha(),
+                            estado=azar.choice(ESTADOS), valor_total=Decimal(azar.randrange(10 ** 6)))
+                 for i in range(options['cotizaciones'])),
+                batch_size=1000,
+            )
+        usuarios = User.objects.bulk_create(
+            (User(username=f'__benchmark_indices__{i}') for i in range(options['empleados'])),
+            batch_size=1000,
+        )
+        with _sin_auto_now_add(PerfilEmpleado):
+            PerfilEmpleado.objects.bulk_create(
+                (PerfilEmpleado(user=u, cargo=azar.choice(CARGOS), fecha_ingreso=ahora.date(),
+                                fecha_creacion=fecha(), activo=azar.random() < 0.9)
+                 for u in usuarios),
+                batch_size=1000,
+            )
+        return {
+            'cliente': azar.choice(clientes).pk,
+            'categoria_servicio': azar.choice(categorias).pk,
+            'cursor_profundo': self._cursor_profundo(),
+        }
+
+    def _cursor_profundo(self):
+        """Cursor a la mitad de la lista de cotizaciones"""
+        paginador = PaginadorCursor(Cotizacion.objects.all(), ['-fecha_creacion', 'id'])
+        mitad = paginador.queryset[Cotizacion.objects.count() // 2]
+        return paginador._codificar('s', mitad)
+
+    def _consultas(self, datos):
+        """(nombre, índice que la resuelve, función que ejecuta la consulta de la vista)"""
+        inicio_mes, fin_mes = rango_mes()
+        del_mes = Cotizacion.objects.filter(fecha_creacion__gte=inicio_mes, fecha_creacion__lt=fin_mes)
+        cotizaciones = Cotizacion.objects.select_related('cliente', 'tipo_trabajo')
+        orden = ['-fecha_creacion', 'id']
+        empleados = PerfilEmpleado.objects.select_related('user')
+
+        def pagina(queryset, orden, cursor=None, por_pagina=20):
+            return lambda: PaginadorCursor(queryset, orden, por_pagina).pagina(cursor)
+
+        return [
+            ('Dashboard: cotizaciones del mes', 'cotizacion_fecha_idx', del_mes.count),
+            ('Dashboard: valor del mes', 'cotizacion_fecha_idx',
+             lambda: del_mes.aggregate(Sum('valor_total'))),
+            ('Dashboard: pendientes', 'cotizacion_estado_idx',
+             Cotizacion.objects.filter(estado='enviada').count),
+            ('Dashboard: últimas cotizaciones', 'cotizacion_fecha_idx',
+             lambda: list(Cotizacion.objects.select_related('cliente').order_by('-fecha_creacion', 'id')[:5])),
+            ('Dashboard: por estado', 'cotizacion_estado_idx',
+             lambda: list(Cotizacion.objects.values('estado').annotate(total=Count('id')).order_by('-total'))),
+            ('Lista de cotizaciones', 'cotizacion_fecha_idx', pagina(cotizaciones, orden)),
+            ('Lista de cotizaciones, página profunda', 'cotizacion_fecha_idx',
+             pagina(cotizaciones, orden, datos['cursor_profundo'])),
+            ('Lista por estado', 'cotizacion_estado_idx',
+             pagina(cotizaciones.filter(estado='enviada'), orden)),
+            ('Lista por cliente', 'cotizacion_cliente_idx',
+             pagina(cotizaciones.filter(cliente_id=datos['cliente']), orden)),
+            ('Exportación de aprobadas', 'cotizacion_estado_idx',
+             lambda: list(Cotizacion.objects.filter(estado='aprobada')
+                          .order_by('fecha_creacion', '-pk').values_list('pk', flat=True)[:100])),
+            ('Lista de clientes', 'cliente_nombre_idx', pagina(Cliente.objects.all(), ['nombre', 'id'])),
+            ('Clientes activos', 'cliente_activo_idx',
+             lambda: list(Cliente.objects.filter(activo=True).order_by('nombre').values_list('pk', 'nombre'))),
+            ('Lista de materiales', 'material_nombre_idx', pagina(Material.objects.all(), ['nombre', 'id'])),
+            ('Materiales por categoría', 'material_categoria_idx',
+             pagina(Material.objects.filter(categoria='Categoría 7'), ['nombre', 'id'])),
+            ('Categorías de materiales', 'material_categoria_idx',
+             lambda: list(Material.objects.values_list('categoria', flat=True).distinct().order_by('categoria'))),
+            ('Materiales activos del editor', 'material_activo_idx',
+             lambda: list(Material.objects.filter(activo=True).values_list('pk', 'categoria', 'nombre'))),
+            ('Servicios activos de una categoría', 'servicio_activo_idx',
+             lambda: list(ServicioBase.objects.filter(categoria_id=datos['categoria_servicio'], activo=True)
+                          .values('id', 'nombre', 'precio_base', 'unidad', 'es_parametrizable'))),
+            ('Gestión de usuarios', 'perfil_fecha_idx', pagina(empleados, orden, por_pagina=15)),
+            ('Usuarios por cargo', 'perfil_cargo_idx',
+             pagina(empleados.filter(cargo='gerente'), orden, por_pagina=15)),
+            ('Usuarios inactivos', 'perfil_fecha_idx',
+             pagina(empleados.filter(activo=False), orden, por_pagina=15)),
+        ]
+
+    def _cambiar_indices(self, quitar):
+        # Solo se usa para generar el SQL: en SQLite el editor no puede
+        # abrirse dentro de la transacción que luego se revierte
+        editor = connection.schema_editor()
+        editor.deferred_sql = []
+        with connection.cursor() as cursor:
+            for modelo in MODELOS:
+                for indice in modelo._meta.indexes:
+                    sql = indice.remove_sql(modelo, editor) if quitar else indice.create_sql(modelo, editor)
+                    cursor.execute(str(sql))
+            # Estadísticas al día para que el planificador considere los índices
+            cursor.execute('ANALYZE')
+
+    def _medir(self, funcion, repeticiones):
+        """Retorna (ms promedio por llamada, planes de cada consulta que ejecuta)"""
+        with CaptureQueriesContext(connection) as consultas:
+            funcion()
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            funcion()
+        duracion = time.perf_counter() - inicio
+        return duracion * 1000 / repeticiones, [self._plan(c['sql']) for c in consultas]
+
+    def _plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+            return [str(fila[-1]) for fila in cursor.fetchall()]
+
+    def _escribir_planes(self, planes):
+        for plan in planes:
+            for linea in plan:
+                self.stdout.write(f'      {linea}')
@@ -0,0 +1,107 @@
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from cotizaciones.models import (
+    CategoriaServicio, Cliente, Cotizacion, ItemManoObra, ItemMaterial,
+    ItemServicio, Material, ServicioBase, TipoTrabajo, calcular_subtotal,
+)
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _calcular_totales_legacy(cotizacion):
+    """Cálculo anterior: carga todos los items en Python y guarda todas las columnas"""
+    cotizacion.subtotal_servicios = sum(item.subtotal for item in cotizacion.items_servicio.all())
+    cotizacion.subtotal_materiales = sum(item.subtotal for item in cotizacion.items_material.all())
+    cotizacion.subtotal_mano_obra = sum(item.subtotal for item in cotizacion.items_mano_obra.all())
+    cotizacion.valor_neto = (
+        cotizacion.subtotal_servicios + cotizacion.subtotal_materiales +
+        cotizacion.subtotal_mano_obra + cotizacion.gastos_traslado
+    )
+    cotizacion.valor_iva = cotizacion.valor_neto * Decimal('0.19')
+    cotizacion.valor_total = cotizacion.valor_neto + cotizacion.valor_iva
+    cotizacion.save()
+
+
+class Command(BaseCommand):
+    help = 'Mide el costo por llamada del cálculo de totales según la cantidad de items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanos', type=int, nargs='+', default=[10, 100, 500, 2000])
+        parser.add_argument('--repeticiones', type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._ejecutar(options['tamanos'], options['repeticiones'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _ejecutar(self, tamanos, repeticiones):
+        usuario = User.objects.create(username='__benchmark_totales__')
+        cliente = Cliente.objects.create(nombre='Cliente benchmark')
+        tipo = TipoTrabajo.objects.create(nombre='Tipo benchmark')
+        categoria = CategoriaServicio.objects.create(nombre='Categoría benchmark')
+        servicio = ServicioBase.objects.create(
+            categoria=categoria, nombre='Servicio', descripcion='', precio_base=Decimal('1000')
+        )
+        material = Material.objects.create(
+            codigo='__BENCH__', nombre='Material', precio_unitario=Decimal('250.50')
+        )
+
+        self.stdout.write(f"{'items':>8} {'legacy ms':>10} {'q':>4} {'agregado ms':>12} {'q':>4} {'delta ms':>9} {'q':>4}")
+        for n in tamanos:
+            cotizacion = Cotizacion.objects.create(
+                numero=f'BENCH-{n}', cliente=cliente, referencia='benchmark', lugar='-',
+                tipo_trabajo=tipo, creado_por=usuario, gastos_traslado=Decimal('15000'),
+            )
+            tercio = max(n // 3, 1)
+            ItemServicio.objects.bulk_create(
+                ItemServicio(cotizacion=cotizacion, servicio=servicio, cantidad=Decimal('1.25'),
+                             precio_unitario=Decimal('1000.33'), orden=i,
+                             subtotal=calcular_subtotal(Decimal('1.25'), Decimal('1000.33')))
+                for i in range(tercio)
+            )
+            ItemMaterial.objects.bulk_create(
+                ItemMaterial(cotizacion=cotizacion, material=material, cantidad=Decimal('3'),
+                             precio_unitario=Decimal('250.50'),
+                             subtotal=calcular_subtotal(Decimal('3'), Decimal('250.50')))
+                for _ in range(tercio)
+            )
+            ItemManoObra.objects.bulk_create(
+                ItemManoObra(cotizacion=cotizacion, descripcion='-', horas=Decimal('2.5'),
+                             precio_hora=Decimal('8000'),
+                             subtotal=calcular_subtotal(Decimal('2.5'), Decimal('8000')))
+                for _ in range(tercio)
+            )
+
+            legacy = self._medir(lambda: _calcular_totales_legacy(cotizacion), repeticiones)
+            esperado = (cotizacion.valor_neto, cotizacion.valor_iva, cotizacion.valor_total)
+            agregado = self._medir(cotizacion.calcular_totales, repeticiones)
+            if (cotizacion.valor_neto, cotizacion.valor_iva, cotizacion.valor_total) != esperado:
+                self.stderr.write(f'Diferencia en totales con {n} items: {esperado} vs {(cotizacion.valor_neto, cotizacion.valor_iva, cotizacion.valor_total)}')
+            delta = self._medir(
+                lambda: cotizacion.aplicar_delta_totales(materiales=Decimal('0')), repeticiones
+            )
+
+            self.stdout.write(
+                f'{tercio * 3:>8} {legacy[0]:>10.3f} {legacy[1]:>4} '
+                f'{agregado[0]:>12.3f} {agregado[1]:>4} {delta[0]:>9.3f} {delta[1]:>4}'
+            )
+
+    def _medir(self, funcion, repeticiones):
+        """Retorna (ms promedio por llamada, consultas por llamada)"""
+        with CaptureQueriesContext(connection) as consultas:
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                funcion()
+            duracion = time.perf_counter() - inicio
+        return duracion * 1000 / repeticiones, len(consultas) // repeticiones
@@ -0,0 +1,51 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cotizaciones.exportacion_pdf import filtrar_cotizaciones, generar_pdfs, zip_por_partes
+from cotizaciones.pdf import pdf_disponible
+
+
+class Command(BaseCommand):
+    help = 'Exporta a un ZIP los PDF de las cotizaciones filtradas (por defecto, las aprobadas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('salida', help='Ruta del archivo ZIP a generar')
+        parser.add_argument('--estado', default='aprobada',
+                            help="Estado de las cotizaciones ('' para todas)")
+        parser.add_argument('--cliente', type=int, help='Id del cliente')
+        parser.add_argument('--desde', help='Fecha de creación inicial (AAAA-MM-DD)')
+        parser.add_argument('--hasta', help='Fecha de creación final (AAAA-MM-DD)')
+        parser.add_argument('--procesos', type=int, default=settings.EXPORTACION_PDF_PROCESOS,
+                            help='Procesos para generar los PDF que no están en caché')
+
+    def handle(self, *args, **options):
+        if not pdf_disponible():
+            raise CommandError('Para generar PDF se requiere el paquete reportlab')
+        try:
+            cotizaciones = filtrar_cotizaciones(
+                estado=options['estado'], cliente=options['cliente'],
+                desde=options['desde'], hasta=options['hasta'],
+            )
+            total = cotizaciones.count()
+        except ValueError as e:
+            raise CommandError(f'Filtros inválidos: {e}')
+
+        self.stdout.write(f'Exportando {total} cotizaciones con {options["procesos"]} procesos')
+        inicio = time.perf_counter()
+
+        def progreso(listos, total):
+            self.stdout.write(f'\r{listos}/{total}', ending='')
+            self.stdout.flush()
+
+        archivos = generar_pdfs(cotizaciones, procesos=options['procesos'], progreso=progreso)
+        with open(options['salida'], 'wb') as salida:
+            for parte in zip_por_partes(archivos):
+                salida.write(parte)
+
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} cotizaciones exportadas a {options["salida"]} '
+            f'en {time.perf_counter() - inicio:.1f} s'
+        ))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from cotizaciones import busqueda
+from cotizaciones.models import TokenBusqueda
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye la tabla de tokens de búsqueda (solo se usa sin PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('indices', nargs='*',
+                            help=f'Índices a reconstruir: {", ".join(sorted(busqueda.INDICES))} (por defecto, todos)')
+
+    def handle(self, *args, **options):
+        if not busqueda.usa_tokens():
+            self.stdout.write('PostgreSQL usa sus propios índices; no hay tokens que reconstruir')
+            return
+        desconocidos = set(options['indices']) - set(busqueda.INDICES)
+        if desconocidos:
+            raise CommandError(f'Índices desconocidos: {", ".join(sorted(desconocidos))}')
+        for clave in options['indices'] or sorted(busqueda.INDICES):
+            total = busqueda.reconstruir(busqueda.INDICES[clave].modelo)
+            self.stdout.write(self.style.SUCCESS(f'{clave}: {total} registros indexados'))
+        # Con estadísticas el planificador recorre la tabla por (indice, token)
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {connection.ops.quote_name(TokenBusqueda._meta.db_table)}')
@@ -0,0 +1,29 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from cotizaciones import ventas
+from cotizaciones.models import VentaDiaria
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el resumen diario de ventas (VentaDiaria) desde las cotizaciones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Primera fecha a recalcular (AAAA-MM-DD; por defecto, todas)')
+        parser.add_argument('--hasta', help='Última fecha a recalcular (AAAA-MM-DD; por defecto, todas)')
+
+    def handle(self, *args, **options):
+        try:
+            desde = date.fromisoformat(options['desde']) if options['desde'] else None
+            hasta = date.fromisoformat(options['hasta']) if options['hasta'] else None
+        except ValueError as e:
+            raise CommandError(f'Fecha inválida: {e}')
+        if desde and hasta and desde > hasta:
+            raise CommandError('--desde debe ser anterior a --hasta')
+
+        filas = ventas.reconstruir(desde, hasta)
+        self.stdout.write(self.style.SUCCESS(f'{filas} filas de resumen recalculadas'))
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {connection.ops.quote_name(VentaDiaria._meta.db_table)}')
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:01
+
+import re
+
+from django.db import migrations, models
+
+
+def inicializar_contadores(apps, schema_editor):
+    """Parte cada contador desde el mayor número ya usado en su año"""
+    Cotizacion = apps.get_model('cotizaciones', 'Cotizacion')
+    ContadorCotizacion = apps.get_model('cotizaciones', 'ContadorCotizacion')
+    ultimos = {}
+    for numero in Cotizacion.objects.values_list('numero', flat=True).iterator():
+        coincidencia = re.fullmatch(r'(\d{4})-(\d+)', numero)
+        if coincidencia:
+            anio, correlativo = int(coincidencia[1]), int(coincidencia[2])
+            ultimos[anio] = max(ultimos.get(anio, 0), correlativo)
+    ContadorCotizacion.objects.bulk_create([
+        ContadorCotizacion(anio=anio, ultimo=ultimo) for anio, ultimo in ultimos.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizaciones', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorCotizacion',
+            fields=[
+                ('anio', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('ultimo', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Contador de cotizaciones',
+                'verbose_name_plural': 'Contadores de cotizaciones',
+            },
+        ),
+        migrations.RunPython(inicializar_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,127 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:05
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+# Índices de busqueda.py en PostgreSQL: trigramas para cada campo buscable
+# y texto completo para los campos largos
+INDICES_TRIGRAMAS = [
+    ('cotizaciones_cotizacion', 'numero'),
+    ('cotizaciones_cotizacion', 'referencia'),
+    ('cotizaciones_cliente', 'nombre'),
+    ('cotizaciones_cliente', 'rut'),
+    ('cotizaciones_cliente', 'email'),
+    ('cotizaciones_material', 'codigo'),
+    ('cotizaciones_material', 'nombre'),
+    ('cotizaciones_material', 'descripcion'),
+]
+INDICES_TEXTO = [
+    ('cotizaciones_cotizacion', 'referencia'),
+    ('cotizaciones_material', 'descripcion'),
+]
+
+
+def crear_indices_postgres(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for tabla, campo in INDICES_TRIGRAMAS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {tabla}_{campo}_trgm ON {tabla} USING gin ({campo} gin_trgm_ops)'
+        )
+    for tabla, campo in INDICES_TEXTO:
+        # La misma expresión que genera SearchVector(campo, config='spanish')
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {tabla}_{campo}_fts ON {tabla} "
+            f"USING gin (to_tsvector('spanish'::regconfig, COALESCE({campo}, '')))"
+        )
+
+
+def borrar_indices_postgres(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for tabla, campo in INDICES_TRIGRAMAS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {tabla}_{campo}_trgm')
+    for tabla, campo in INDICES_TEXTO:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {tabla}_{campo}_fts')
+
+
+# Copia de los índices y el tokenizador de busqueda.py al crear la tabla: la
+# migración no debe cambiar si después cambia el módulo.
+# (clave, modelo, campos con su peso); los relacionados usan campo__subcampo
+INDICES_TOKENS = [
+    ('cotizacion', 'Cotizacion', [('numero', 1.0), ('referencia', 0.2), ('cliente__nombre', 0.4)]),
+    ('cliente', 'Cliente', [('nombre', 1.0), ('rut', 1.0), ('email', 0.4)]),
+    ('material', 'Material', [('codigo', 1.0), ('nombre', 1.0), ('descripcion', 0.2)]),
+]
+
+
+def palabras(texto):
+    texto = unicodedata.normalize('NFKD', str(texto or '')).encode('ascii', 'ignore').decode().lower()
+    resultado = []
+    for grupo in texto.split():
+        partes = re.findall(r'[a-z0-9]+', grupo)
+        resultado.extend(partes)
+        if len(partes) > 1:
+            resultado.append(''.join(partes))
+    return resultado
+
+
+def tokens_de(valores):
+    tokens = {}
+    for valor, peso in valores:
+        for palabra in palabras(valor):
+            relleno = f'  {palabra} '
+            for i in range(len(relleno) - 2):
+                trigrama = relleno[i:i + 3]
+                tokens[trigrama] = max(tokens.get(trigrama, 0), peso)
+    return tokens
+
+
+def indexar_existentes(apps, schema_editor):
+    """Sin PostgreSQL, llena la tabla de tokens con los registros existentes"""
+    if schema_editor.connection.vendor == 'postgresql':
+        return
+    TokenBusqueda = apps.get_model('cotizaciones', 'TokenBusqueda')
+    for clave, nombre_modelo, campos in INDICES_TOKENS:
+        modelo = apps.get_model('cotizaciones', nombre_modelo)
+        nombres = [campo for campo, _ in campos]
+        pesos = [peso for _, peso in campos]
+        tokens = []
+        for pk, *valores in modelo.objects.values_list('pk', *nombres).iterator():
+            tokens.extend(
+                TokenBusqueda(indice=clave, objeto_id=pk, token=token, peso=peso)
+                for token, peso in tokens_de(zip(valores, pesos)).items()
+            )
+            if len(tokens) >= 5000:
+                TokenBusqueda.objects.bulk_create(tokens)
+                tokens = []
+        TokenBusqueda.objects.bulk_create(tokens, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizaciones', '0002_contadorcotizacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenBusqueda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('indice', models.CharField(max_length=20)),
+                ('objeto_id', models.PositiveBigIntegerField()),
+                ('token', models.CharField(max_length=3)),
+                ('peso', models.FloatField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['indice', 'objeto_id'], name='token_busqueda_objeto_idx')],
+                'constraints': [models.UniqueConstraint(fields=('indice', 'token', 'objeto_id'), name='token_busqueda_unico')],
+            },
+        ),
+        migrations.RunPython(crear_indices_postgres, borrar_indices_postgres),
+        migrations.RunPython(indexar_existentes, migrations.RunPython.noop),
+    ]
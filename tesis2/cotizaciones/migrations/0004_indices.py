@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizaciones', '0003_busqueda'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['nombre', 'id'], name='cliente_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['nombre'], name='cliente_activo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cotizacion',
+            index=models.Index(fields=['-fecha_creacion', 'id'], name='cotizacion_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cotizacion',
+            index=models.Index(fields=['estado', '-fecha_creacion', 'id'], name='cotizacion_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cotizacion',
+            index=models.Index(fields=['cliente', '-fecha_creacion', 'id'], name='cotizacion_cliente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(fields=['nombre', 'id'], name='material_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(fields=['categoria', 'nombre', 'id'], name='material_categoria_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['categoria', 'nombre'], name='material_activo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='serviciobase',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['categoria', 'nombre'], name='servicio_activo_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def calcular_ventas(apps, schema_editor):
+    """Resumen inicial desde las cotizaciones existentes (como ventas.reconstruir)"""
+    Cotizacion = apps.get_model('cotizaciones', 'Cotizacion')
+    VentaDiaria = apps.get_model('cotizaciones', 'VentaDiaria')
+    grupos = (
+        Cotizacion.objects.order_by()
+        .annotate(dia=TruncDate('fecha_creacion'))
+        .values('dia', 'cliente_id', 'tipo_trabajo_id', 'estado')
+        .annotate(cantidad=Count('id'), neto=Sum('valor_neto'), iva=Sum('valor_iva'), total=Sum('valor_total'))
+    )
+    VentaDiaria.objects.bulk_create((
+        VentaDiaria(
+            fecha=grupo['dia'], cliente_id=grupo['cliente_id'], tipo_trabajo_id=grupo['tipo_trabajo_id'],
+            estado=grupo['estado'], cotizaciones=grupo['cantidad'],
+            valor_neto=grupo['neto'], valor_iva=grupo['iva'], valor_total=grupo['total'],
+        )
+        for grupo in grupos.iterator()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizaciones', '0004_indices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('estado', models.CharField(choices=[('borrador', 'Borrador'), ('enviada', 'Enviada'), ('aprobada', 'Aprobada'), ('rechazada', 'Rechazada'), ('vencida', 'Vencida')], max_length=20)),
+                ('cotizaciones', models.IntegerField(default=0)),
+                ('valor_neto', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('valor_iva', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('valor_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cotizaciones.cliente')),
+                ('tipo_trabajo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cotizaciones.tipotrabajo')),
+            ],
+            options={
+                'verbose_name': 'Venta diaria',
+                'verbose_name_plural': 'Ventas diarias',
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'cliente', 'tipo_trabajo', 'estado'), name='venta_diaria_unica')],
+            },
+        ),
+        migrations.RunPython(calcular_ventas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# Índices de prefijo para el autocompletado de materiales (sugerir_materiales
+# en busqueda.py). istartswith genera UPPER(campo::text) LIKE UPPER('texto%');
+# con text_pattern_ops el índice sirve para LIKE con cualquier collation. Son
+# parciales: solo se sugieren materiales activos. Sin PostgreSQL la tabla de
+# materiales se recorre completa.
+CAMPOS_PREFIJO = ['codigo', 'nombre', 'categoria']
+
+
+def crear_indices_postgres(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for campo in CAMPOS_PREFIJO:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS cotizaciones_material_{campo}_prefijo ON cotizaciones_material '
+            f'(UPPER(({campo})::text) text_pattern_ops) WHERE activo'
+        )
+
+
+def borrar_indices_postgres(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for campo in CAMPOS_PREFIJO:
+        schema_editor.execute(f'DROP INDEX IF EXISTS cotizaciones_material_{campo}_prefijo')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizaciones', '0005_ventadiaria'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices_postgres, borrar_indices_postgres),
+    ]
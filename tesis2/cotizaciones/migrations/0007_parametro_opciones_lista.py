@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:57
+
+from django.db import migrations, models
+
+
+def separar_existentes(apps, schema_editor):
+    """Opciones ya separadas para los parámetros select existentes (como ParametroServicio.save)"""
+    ParametroServicio = apps.get_model('cotizaciones', 'ParametroServicio')
+    parametros = list(ParametroServicio.objects.filter(tipo='select').exclude(opciones=None).only('opciones'))
+    for parametro in parametros:
+        parametro.opciones_lista = [opcion.strip() for opcion in parametro.opciones.split(',') if opcion.strip()]
+    ParametroServicio.objects.bulk_update(parametros, ['opciones_lista'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizaciones', '0006_material_prefijos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parametroservicio',
+            name='opciones_lista',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(separar_existentes, migrations.RunPython.noop),
+    ]
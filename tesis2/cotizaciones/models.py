@@ -1,9 +1,38 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from decimal import Decimal
+from django.db.models import F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from decimal import Decimal, ROUND_HALF_UP
 import uuid
 
+IVA = Decimal('0.19')
+CENTAVOS = Decimal('0.01')
+
+def calcular_subtotal(cantidad, precio):
+    """Subtotal de un item redondeado a 2 decimales, igual que lo guarda la BD"""
+    return (Decimal(cantidad) * Decimal(precio)).quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+
+def separar_opciones(texto):
+    """Opciones de un parámetro select a partir del texto 'opcion1,opcion2'"""
+    return [opcion.strip() for opcion in (texto or '').split(',') if opcion.strip()]
+
+def _suma_items(modelo):
+    """Subconsulta escalar con la suma de subtotales de un tipo de item"""
+    return Coalesce(
+        Subquery(
+            modelo.objects.filter(cotizacion=OuterRef('pk'))
+            .order_by()
+            .values('cotizacion')
+            .annotate(total=Sum('subtotal'))
+            .values('total')
+        ),
+        Value(Decimal('0')),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2),
+    )
+
 class Cliente(models.Model):
     nombre = models.CharField(max_length=200)
     atencion = models.CharField(max_length=200, blank=True, null=True)
@@ -16,6 +45,12 @@ class Cliente(models.Model):
 
     class Meta:
         ordering = ['nombre']
+        indexes = [
+            # Lista de clientes por cursor
+            models.Index(fields=['nombre', 'id'], name='cliente_nombre_idx'),
+            # Selectores de clientes activos
+            models.Index(fields=['nombre'], name='cliente_activo_idx', condition=Q(activo=True)),
+        ]
 
     def __str__(self):
         return self.nombre
@@ -54,6 +89,10 @@ class ServicioBase(models.Model):
 
     class Meta:
         ordering = ['categoria', 'nombre']
+        indexes = [
+            # Servicios activos de una categoría (AJAX del editor)
+            models.Index(fields=['categoria', 'nombre'], name='servicio_activo_idx', condition=Q(activo=True)),
+        ]
 
     def __str__(self):
         return f"{self.categoria.nombre} - {self.nombre}"
@@ -71,6 +110,9 @@ class ParametroServicio(models.Model):
     tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
     requerido = models.BooleanField(default=True)
     opciones = models.TextField(blank=True, null=True, help_text="Para tipo select: opcion1,opcion2,opcion3")
+    # Opciones ya separadas (solo tipo select); se calculan en save. update()
+    # y bulk_update no pasan por save: deben actualizarlas con separar_opciones
+    opciones_lista = models.JSONField(default=list, blank=True, editable=False)
     valor_por_defecto = models.CharField(max_length=200, blank=True, null=True)
     orden = models.IntegerField(default=0)
 
@@ -80,10 +122,29 @@ class ParametroServicio(models.Model):
     def __str__(self):
         return f"{self.servicio.nombre} - {self.nombre}"
 
+    def save(self, *args, **kwargs):
+        self.opciones_lista = separar_opciones(self.opciones) if self.tipo == 'select' else []
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'opciones', 'tipo'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'opciones_lista'}
+        super().save(*args, **kwargs)
+
     def get_opciones_list(self):
-        if self.opciones:
-            return [opt.strip() for opt in self.opciones.split(',')]
-        return []
+        return self.opciones_lista
+
+    def error_de_valor(self, valor):
+        """Motivo por el que el valor no sirve para este parámetro, o None si es válido"""
+        if self.tipo == 'select' and self.opciones_lista and valor not in self.opciones_lista:
+            return f'{self.nombre}: "{valor}" no es una de las opciones ({", ".join(self.opciones_lista)})'
+        if self.tipo == 'number':
+            try:
+                if not Decimal(valor).is_finite():
+                    raise ArithmeticError
+            except ArithmeticError:
+                return f'{self.nombre}: "{valor}" no es un número'
+        if self.tipo == 'boolean' and valor not in ('true', 'false'):
+            return f'{self.nombre}: "{valor}" no es true ni false'
+        return None
 
 class Material(models.Model):
     codigo = models.CharField(max_length=50, unique=True)
@@ -96,6 +157,14 @@ class Material(models.Model):
 
     class Meta:
         ordering = ['categoria', 'nombre']
+        indexes = [
+            # Lista de materiales por cursor, con y sin filtro de categoría;
+            # el segundo también da las categorías distintas
+            models.Index(fields=['nombre', 'id'], name='material_nombre_idx'),
+            models.Index(fields=['categoria', 'nombre', 'id'], name='material_categoria_idx'),
+            # Materiales activos en el editor, en el orden del modelo
+            models.Index(fields=['categoria', 'nombre'], name='material_activo_idx', condition=Q(activo=True)),
+        ]
 
     def __str__(self):
         return f"{self.codigo} - {self.nombre}"
@@ -133,26 +202,61 @@ class Cotizacion(models.Model):
 
     class Meta:
         ordering = ['-fecha_creacion']
+        indexes = [
+            # Lista por cursor, últimas cotizaciones y rango del mes
+            models.Index(fields=['-fecha_creacion', 'id'], name='cotizacion_fecha_idx'),
+            # Lista filtrada por estado, conteo por estado y exportación
+            models.Index(fields=['estado', '-fecha_creacion', 'id'], name='cotizacion_estado_idx'),
+            # Lista filtrada por cliente
+            models.Index(fields=['cliente', '-fecha_creacion', 'id'], name='cotizacion_cliente_idx'),
+        ]
 
     def __str__(self):
         return f"Cotización {self.numero} - {self.cliente.nombre}"
 
+    CAMPOS_TOTALES = [
+        'subtotal_servicios', 'subtotal_materiales', 'subtotal_mano_obra',
+        'gastos_traslado', 'valor_neto', 'valor_iva', 'valor_total',
+    ]
+
     def calcular_totales(self):
-        # Calcular subtotales de servicios
-        self.subtotal_servicios = sum(
-            item.subtotal for item in self.items_servicio.all()
-        )
-        
-        # Calcular subtotales de materiales
-        self.subtotal_materiales = sum(
-            item.subtotal for item in self.items_material.all()
-        )
-        
-        # Calcular subtotales de mano de obra
-        self.subtotal_mano_obra = sum(
-            item.subtotal for item in self.items_mano_obra.all()
-        )
-        
+        """Recalcula los subtotales sumando los items en la BD (una sola consulta)"""
+        subtotales = Cotizacion.objects.filter(pk=self.pk).annotate(
+            servicios=_suma_items(ItemServicio),
+            materiales=_suma_items(ItemMaterial),
+            mano_obra=_suma_items(ItemManoObra),
+        ).values('servicios', 'materiales', 'mano_obra').get()
+        # Las sumas de valores con 2 decimales son exactas; quantize elimina el
+        # ruido de punto flotante que agrega SQLite
+        self.subtotal_servicios = subtotales['servicios'].quantize(CENTAVOS)
+        self.subtotal_materiales = subtotales['materiales'].quantize(CENTAVOS)
+        self.subtotal_mano_obra = subtotales['mano_obra'].quantize(CENTAVOS)
+        self._guardar_totales()
+
+    def aplicar_delta_totales(self, servicios=0, materiales=0, mano_obra=0, gastos_traslado=None):
+        """
+        Aplica la variación de un item (o de los gastos de traslado) sin volver
+        a leer los items. Debe llamarse dentro de una transacción.
+        """
+        actuales = Cotizacion.objects.select_for_update().filter(pk=self.pk).values(
+            'subtotal_servicios', 'subtotal_materiales', 'subtotal_mano_obra', 'gastos_traslado'
+        ).get()
+        self.subtotal_servicios = actuales['subtotal_servicios'] + Decimal(servicios)
+        self.subtotal_materiales = actuales['subtotal_materiales'] + Decimal(materiales)
+        self.subtotal_mano_obra = actuales['subtotal_mano_obra'] + Decimal(mano_obra)
+        if gastos_traslado is None:
+            self.gastos_traslado = actuales['gastos_traslado']
+        else:
+            self.gastos_traslado = gastos_traslado
+        self._guardar_totales()
+
+    def _guardar_totales(self):
+        """Calcula neto, IVA y total y guarda solo las columnas de totales"""
+        self.calcular_valores()
+        self.save(update_fields=self.CAMPOS_TOTALES)
+
+    def calcular_valores(self):
+        """Neto, IVA y total a partir de los subtotales y los gastos de traslado (sin guardar)"""
         # Calcular valor neto
         self.valor_neto = (
             self.subtotal_servicios + 
@@ -161,27 +265,63 @@ class Cotizacion(models.Model):
             self.gastos_traslado
         )
         
-        # Calcular IVA (19%)
-        self.valor_iva = self.valor_neto * Decimal('0.19')
+        # Calcular IVA (19%), redondeado como lo guarda la BD: la instancia
+        # (y las respuestas JSON que la usan) tiene los mismos valores
+        self.valor_iva = (self.valor_neto * IVA).quantize(CENTAVOS, rounding=ROUND_HALF_UP)
         
         # Calcular total
         self.valor_total = self.valor_neto + self.valor_iva
-        
-        self.save()
+
+    def save(self, *args, **kwargs):
+        # El número se asigna en la misma transacción que inserta la fila: el
+        # contador queda bloqueado hasta el commit y se guarda una sola vez. La
+        # transacción también cubre el pre_save del resumen de ventas, que
+        # bloquea la fila anterior (ver ventas.leer_anterior). Sin savepoint:
+        # dentro de otra transacción no agrega consultas
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            if self.pk is None and not self.numero:
+                self.generar_numero()
+            super().save(*args, **kwargs)
 
     def generar_numero(self):
         if not self.numero:
-            ultimo_numero = Cotizacion.objects.filter(
-                numero__startswith=f"{self.fecha_creacion.year}"
-            ).order_by('-numero').first()
-            
-            if ultimo_numero:
-                ultimo_num = int(ultimo_numero.numero.split('-')[-1])
-                nuevo_num = ultimo_num + 1
-            else:
-                nuevo_num = 1
-                
-            self.numero = f"{self.fecha_creacion.year}-{nuevo_num:04d}"
+            anio = (self.fecha_creacion or timezone.now()).year
+            self.numero = f"{anio}-{ContadorCotizacion.siguiente(anio):04d}"
+
+class ContadorCotizacion(models.Model):
+    """Último correlativo de cotización usado en cada año"""
+    anio = models.PositiveIntegerField(primary_key=True)
+    ultimo = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Contador de cotizaciones"
+        verbose_name_plural = "Contadores de cotizaciones"
+
+    def __str__(self):
+        return f"{self.anio}: {self.ultimo}"
+
+    @classmethod
+    def siguiente(cls, anio):
+        """
+        Incrementa y devuelve el correlativo del año. El UPDATE bloquea la fila
+        hasta el fin de la transacción, así que debe llamarse dentro de una.
+        """
+        while True:
+            if cls.objects.filter(anio=anio).update(ultimo=F('ultimo') + 1):
+                return cls.objects.filter(anio=anio).values_list('ultimo', flat=True).get()
+            try:
+                # Primer número del año; si otra transacción crea la fila
+                # antes, se reintenta el UPDATE
+                with transaction.atomic():
+                    return cls.objects.create(anio=anio, ultimo=cls.ultimo_usado(anio) + 1).ultimo
+            except IntegrityError:
+                continue
+
+    @staticmethod
+    def ultimo_usado(anio):
+        """Mayor correlativo ya guardado en cotizaciones del año (formato AAAA-NNNN)"""
+        numeros = Cotizacion.objects.filter(numero__regex=rf'^{anio}-[0-9]+$').order_by().values_list('numero', flat=True)
+        return max((int(numero.split('-')[-1]) for numero in numeros), default=0)
 
 class ItemServicio(models.Model):
     cotizacion = models.ForeignKey(Cotizacion, on_delete=models.CASCADE, related_name='items_servicio')
@@ -196,7 +336,7 @@ class ItemServicio(models.Model):
         ordering = ['orden']
 
     def save(self, *args, **kwargs):
-        self.subtotal = self.cantidad * self.precio_unitario
+        self.subtotal = calcular_subtotal(self.cantidad, self.precio_unitario)
         super().save(*args, **kwargs)
 
 class ParametroItemServicio(models.Model):
@@ -216,7 +356,7 @@ class ItemMaterial(models.Model):
         ordering = ['material__categoria', 'material__nombre']
 
     def save(self, *args, **kwargs):
-        self.subtotal = self.cantidad * self.precio_unitario
+        self.subtotal = calcular_subtotal(self.cantidad, self.precio_unitario)
         super().save(*args, **kwargs)
 
 class ItemManoObra(models.Model):
@@ -227,7 +367,7 @@ class ItemManoObra(models.Model):
     subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     def save(self, *args, **kwargs):
-        self.subtotal = self.horas * self.precio_hora
+        self.subtotal = calcular_subtotal(self.horas, self.precio_hora)
         super().save(*args, **kwargs)
 
 class PlantillaCotizacion(models.Model):
@@ -269,4 +409,49 @@ class ConfiguracionEmpresa(models.Model):
     @classmethod
     def get_config(cls):
         config, created = cls.objects.get_or_create(pk=1)
-        return config
\ No newline at end of file
+        return config
+
+class TokenBusqueda(models.Model):
+    """
+    Trigramas de los campos buscables de cada registro, para buscar sin
+    PostgreSQL (ver busqueda.py). indice es la clave del modelo indexado.
+    """
+    indice = models.CharField(max_length=20)
+    objeto_id = models.PositiveBigIntegerField()
+    token = models.CharField(max_length=3)
+    peso = models.FloatField()
+
+    class Meta:
+        # La búsqueda recorre (indice, token); reindexar borra por (indice, objeto_id)
+        constraints = [
+            models.UniqueConstraint(fields=['indice', 'token', 'objeto_id'], name='token_busqueda_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['indice', 'objeto_id'], name='token_busqueda_objeto_idx'),
+        ]
+
+class VentaDiaria(models.Model):
+    """
+    Resumen de cotizaciones por día (fecha local de creación), cliente, tipo
+    de trabajo y estado, para los reportes. Lo mantienen las señales y se
+    reconstruye con manage.py reconstruir_ventas (ver ventas.py).
+    """
+    fecha = models.DateField()
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE)
+    tipo_trabajo = models.ForeignKey(TipoTrabajo, on_delete=models.CASCADE)
+    estado = models.CharField(max_length=20, choices=Cotizacion.ESTADO_CHOICES)
+    cotizaciones = models.IntegerField(default=0)
+    valor_neto = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    valor_iva = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    valor_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Venta diaria"
+        verbose_name_plural = "Ventas diarias"
+        # Los reportes leen rangos de fecha: la restricción empieza por fecha
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'cliente', 'tipo_trabajo', 'estado'], name='venta_diaria_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.cliente_id}/{self.tipo_trabajo_id}/{self.estado}: {self.cotizaciones}"
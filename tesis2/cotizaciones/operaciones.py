@@ -0,0 +1,277 @@
+# cotizaciones/operaciones.py
+"""Aplicación en lote de operaciones sobre los items de una cotización"""
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from . import ventas
+from .estadisticas import invalidar_estadisticas
+from .models import (
+    Cotizacion, ItemManoObra, ItemMaterial, ItemPlantillaServicio, ItemServicio, Material,
+    ParametroItemServicio, ServicioBase, calcular_subtotal,
+)
+from .parametros import ParametroInvalido, valores_de_items
+
+OPERACIONES = ('agregar', 'actualizar', 'eliminar', 'reordenar')
+
+# Configuración por tipo de item: modelo, campos editables y campos del subtotal
+TIPOS_ITEM = {
+    'servicio': {
+        'modelo': ItemServicio,
+        'campos': ('cantidad', 'precio_unitario', 'descripcion_personalizada'),
+        'subtotal': ('cantidad', 'precio_unitario'),
+    },
+    'material': {
+        'modelo': ItemMaterial,
+        'campos': ('cantidad', 'precio_unitario', 'descripcion_personalizada'),
+        'subtotal': ('cantidad', 'precio_unitario'),
+    },
+    'mano_obra': {
+        'modelo': ItemManoObra,
+        'campos': ('descripcion', 'horas', 'precio_hora'),
+        'subtotal': ('horas', 'precio_hora'),
+    },
+}
+
+CAMPOS_DECIMALES = {'cantidad', 'precio_unitario', 'horas', 'precio_hora'}
+
+
+class OperacionInvalida(ValueError):
+    """Error de validación de una operación; indica su posición en el lote"""
+    def __init__(self, indice, mensaje):
+        super().__init__(f'Operación {indice}: {mensaje}')
+        self.indice = indice
+
+
+def _decimal(indice, valor, campo):
+    try:
+        numero = Decimal(str(valor))
+    except (InvalidOperation, TypeError):
+        raise OperacionInvalida(indice, f'valor inválido para {campo}')
+    if not numero.is_finite() or numero < 0:
+        raise OperacionInvalida(indice, f'valor inválido para {campo}')
+    return numero
+
+
+def _id(indice, valor, campo='id de item'):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise OperacionInvalida(indice, f'{campo} inválido')
+
+
+def _valores(indice, tipo, op, parcial=False):
+    """Extrae y valida los campos editables de una operación"""
+    valores = {}
+    for campo in TIPOS_ITEM[tipo]['campos']:
+        if campo not in op:
+            continue
+        if campo in CAMPOS_DECIMALES:
+            valores[campo] = _decimal(indice, op[campo], campo)
+        else:
+            valores[campo] = op[campo] or ''
+    if not parcial:
+        faltantes = [c for c in TIPOS_ITEM[tipo]['subtotal'] if c not in valores]
+        if tipo == 'mano_obra' and not valores.get('descripcion'):
+            faltantes.append('descripcion')
+        if faltantes:
+            raise OperacionInvalida(indice, f'faltan campos: {", ".join(faltantes)}')
+    return valores
+
+
+def _tipo(indice, op):
+    tipo = op.get('tipo')
+    if tipo not in TIPOS_ITEM:
+        raise OperacionInvalida(indice, f'tipo de item inválido: {tipo}')
+    return tipo
+
+
+def aplicar_operaciones(cotizacion, operaciones):
+    """
+    Aplica una lista de operaciones (agregar, actualizar, eliminar, reordenar)
+    a los items de la cotización en una sola transacción y recalcula los
+    totales una vez. Retorna los items creados en el orden recibido.
+
+    Cada operación es un dict con 'op' y 'tipo' ('servicio', 'material' o
+    'mano_obra'); 'ref' es un identificador opcional del cliente que se
+    devuelve junto al id asignado.
+    """
+    if not isinstance(operaciones, list):
+        raise OperacionInvalida(0, 'se esperaba una lista de operaciones')
+
+    nuevos = {tipo: [] for tipo in TIPOS_ITEM}
+    items_servicio = {}
+    cambios = {tipo: {} for tipo in TIPOS_ITEM}
+    eliminar = {tipo: set() for tipo in TIPOS_ITEM}
+    orden = {}
+
+    # Validar y clasificar todas las operaciones antes de tocar la BD
+    for indice, op in enumerate(operaciones):
+        if not isinstance(op, dict) or op.get('op') not in OPERACIONES:
+            raise OperacionInvalida(indice, 'operación desconocida')
+        tipo = _tipo(indice, op)
+        accion = op['op']
+
+        if accion == 'agregar':
+            valores = _valores(indice, tipo, op)
+            parametros = {}
+            if tipo == 'servicio':
+                valores['servicio_id'] = _id(indice, op.get('servicio_id'), 'servicio')
+                parametros = op.get('parametros') or {}
+                if not isinstance(parametros, dict):
+                    raise OperacionInvalida(indice, 'parametros debe ser un objeto {id: valor}')
+            elif tipo == 'material':
+                valores['material_id'] = _id(indice, op.get('material_id'), 'material')
+            nuevos[tipo].append((indice, op.get('ref'), valores, parametros))
+        elif accion == 'actualizar':
+            item_id = _id(indice, op.get('id'))
+            cambios[tipo].setdefault(item_id, {}).update(_valores(indice, tipo, op, parcial=True))
+        elif accion == 'eliminar':
+            eliminar[tipo].add(_id(indice, op.get('id')))
+        else:
+            if tipo != 'servicio':
+                raise OperacionInvalida(indice, 'solo los servicios se pueden reordenar')
+            for posicion, item_id in enumerate(op.get('ids') or []):
+                orden[_id(indice, item_id)] = posicion
+
+    # Resolver servicios y materiales referenciados con una consulta por tabla
+    servicios = ServicioBase.objects.in_bulk(
+        {v['servicio_id'] for _, _, v, _ in nuevos['servicio']}
+    )
+    materiales = Material.objects.in_bulk(
+        {v['material_id'] for _, _, v, _ in nuevos['material']}
+    )
+    for indice, _, valores, _ in nuevos['servicio']:
+        if valores['servicio_id'] not in servicios:
+            raise OperacionInvalida(indice, 'servicio no encontrado')
+    for indice, _, valores, _ in nuevos['material']:
+        if valores['material_id'] not in materiales:
+            raise OperacionInvalida(indice, 'material no encontrado')
+
+    # Parámetros de todos los servicios nuevos (enviados y por defecto), con una consulta
+    try:
+        parametros_validados = valores_de_items(
+            (indice, valores['servicio_id'], parametros)
+            for indice, _, valores, parametros in nuevos['servicio']
+        )
+    except ParametroInvalido as e:
+        raise OperacionInvalida(e.clave, e.mensaje)
+
+    creados = []
+    with transaction.atomic():
+        for tipo, config in TIPOS_ITEM.items():
+            modelo = config['modelo']
+            a, b = config['subtotal']
+
+            if eliminar[tipo]:
+                modelo.objects.filter(cotizacion=cotizacion, pk__in=eliminar[tipo]).delete()
+
+            ids_editados = (set(cambios[tipo]) | (set(orden) if tipo == 'servicio' else set())) - eliminar[tipo]
+            if ids_editados:
+                existentes = list(modelo.objects.filter(cotizacion=cotizacion, pk__in=ids_editados))
+                campos = set()
+                for item in existentes:
+                    for campo, valor in cambios[tipo].get(item.pk, {}).items():
+                        setattr(item, campo, valor)
+                        campos.add(campo)
+                    if tipo == 'servicio' and item.pk in orden:
+                        item.orden = orden[item.pk]
+                        campos.add('orden')
+                    item.subtotal = calcular_subtotal(getattr(item, a), getattr(item, b))
+                if campos:
+                    campos.add('subtotal')
+                    modelo.objects.bulk_update(existentes, sorted(campos))
+
+            if not nuevos[tipo]:
+                continue
+
+            siguiente_orden = None
+            if tipo == 'servicio':
+                siguiente_orden = cotizacion.items_servicio.count()
+            items = []
+            for _, _, valores, _ in nuevos[tipo]:
+                item = modelo(cotizacion=cotizacion, **valores)
+                if siguiente_orden is not None:
+                    item.orden = siguiente_orden
+                    siguiente_orden += 1
+                # bulk_create no llama a save(); el subtotal se calcula aquí
+                item.subtotal = calcular_subtotal(getattr(item, a), getattr(item, b))
+                items.append(item)
+            modelo.objects.bulk_create(items)
+
+            for (indice, ref, _, _), item in zip(nuevos[tipo], items):
+                creados.append((indice, {'tipo': tipo, 'ref': ref, 'id': item.pk,
+                                         'subtotal': item.subtotal}))
+                if tipo == 'servicio':
+                    items_servicio[indice] = item
+
+        if parametros_validados:
+            ParametroItemServicio.objects.bulk_create([
+                ParametroItemServicio(item_servicio=items_servicio[indice], parametro=parametro, valor=valor)
+                for indice, parametro, valor in parametros_validados
+            ])
+
+        cotizacion.calcular_totales()
+
+    return [creado for _, creado in sorted(creados, key=lambda c: c[0])]
+
+
+def aplicar_plantillas(cotizaciones, plantillas):
+    """
+    Agrega los servicios de cada plantilla a cada cotización con un solo
+    bulk_create y actualiza los totales de todas las cotizaciones juntas
+    (ver _sumar_servicios). Retorna la cantidad de items creados.
+    """
+    items_plantilla = list(
+        ItemPlantillaServicio.objects.filter(plantilla__in=plantillas)
+        .select_related('servicio')
+        .order_by('plantilla_id', 'orden')
+    )
+    if not items_plantilla:
+        return 0
+
+    with transaction.atomic():
+        nuevos = []
+        deltas = {}
+        for cotizacion in cotizaciones:
+            for item_plantilla in items_plantilla:
+                cantidad = item_plantilla.cantidad_default
+                precio = item_plantilla.servicio.precio_base
+                # bulk_create no llama a save(); el subtotal se calcula aquí
+                subtotal = calcular_subtotal(cantidad, precio)
+                nuevos.append(ItemServicio(
+                    cotizacion=cotizacion,
+                    servicio=item_plantilla.servicio,
+                    cantidad=cantidad,
+                    precio_unitario=precio,
+                    subtotal=subtotal,
+                    orden=item_plantilla.orden,
+                ))
+                deltas[cotizacion.pk] = deltas.get(cotizacion.pk, 0) + subtotal
+
+        ItemServicio.objects.bulk_create(nuevos)
+        _sumar_servicios(deltas)
+
+    return len(nuevos)
+
+
+def _sumar_servicios(deltas):
+    """
+    Suma a cada cotización ({pk: delta}) la variación de sus servicios: una
+    lectura que bloquea las filas y un solo UPDATE para todas, sin importar
+    cuántas sean. bulk_update no envía señales, así que el resumen de ventas
+    y las estadísticas del dashboard se actualizan aquí.
+    """
+    cotizaciones = list(
+        Cotizacion.objects.select_for_update().filter(pk__in=deltas).order_by('pk')
+        .only('fecha_creacion', 'cliente', 'tipo_trabajo', 'estado', *Cotizacion.CAMPOS_TOTALES)
+    )
+    cambios = []
+    for cotizacion in cotizaciones:
+        anterior = ventas.registro(cotizacion)
+        cotizacion.subtotal_servicios += deltas[cotizacion.pk]
+        cotizacion.calcular_valores()
+        cambios.append((anterior, ventas.registro(cotizacion)))
+    Cotizacion.objects.bulk_update(cotizaciones, Cotizacion.CAMPOS_TOTALES)
+    ventas.actualizar_lote(cambios)
+    invalidar_estadisticas()
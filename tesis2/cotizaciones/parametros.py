@@ -0,0 +1,69 @@
+# cotizaciones/parametros.py
+"""Validación en lote de los valores de parámetros de los items de servicio"""
+from .models import ParametroServicio
+
+
+class ParametroInvalido(ValueError):
+    """Valor de parámetro inválido; clave identifica la entrada que lo trajo"""
+    def __init__(self, clave, mensaje):
+        super().__init__(mensaje)
+        self.clave = clave
+        self.mensaje = mensaje
+
+
+def normalizar_valor(valor):
+    """Texto que se guarda en ParametroItemServicio.valor (true/false para booleanos JSON)"""
+    if isinstance(valor, bool):
+        return 'true' if valor else 'false'
+    return str(valor)
+
+
+def valores_de_items(entradas):
+    """
+    Parámetros a guardar para una lista de items nuevos, dada como
+    (clave, servicio_id, {parametro_id: valor}). Lee los parámetros de todos
+    los servicios con una sola consulta y, por cada item:
+
+    - rechaza los ids que no son parámetros de su servicio;
+    - valida los valores enviados (los vacíos se omiten);
+    - usa valor_por_defecto para los parámetros sin valor, validado igual
+      que un valor enviado;
+    - rechaza los parámetros requeridos que quedan sin valor.
+
+    Retorna la lista de (clave, parámetro, valor) o lanza ParametroInvalido
+    con la clave del primer item inválido.
+    """
+    entradas = list(entradas)
+    por_servicio = {}
+    for parametro in ParametroServicio.objects.filter(servicio_id__in={s for _, s, _ in entradas}):
+        por_servicio.setdefault(parametro.servicio_id, {})[parametro.pk] = parametro
+
+    resultado = []
+    for clave, servicio_id, valores in entradas:
+        parametros = por_servicio.get(servicio_id, {})
+        enviados = {}
+        for parametro_id, valor in valores.items():
+            try:
+                parametro = parametros[int(parametro_id)]
+            except (KeyError, TypeError, ValueError):
+                raise ParametroInvalido(clave, f'el parámetro {parametro_id} no pertenece al servicio')
+            if valor is None or valor == '':
+                continue
+            valor = normalizar_valor(valor)
+            error = parametro.error_de_valor(valor)
+            if error:
+                raise ParametroInvalido(clave, error)
+            enviados[parametro.pk] = valor
+
+        for parametro in parametros.values():
+            valor = enviados.get(parametro.pk)
+            if valor is None and parametro.valor_por_defecto:
+                valor = parametro.valor_por_defecto
+                error = parametro.error_de_valor(valor)
+                if error:
+                    raise ParametroInvalido(clave, f'{error} (valor por defecto)')
+            if valor:
+                resultado.append((clave, parametro, valor))
+            elif parametro.requerido:
+                raise ParametroInvalido(clave, f'{parametro.nombre}: es requerido')
+    return resultado
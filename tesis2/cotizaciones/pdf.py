@@ -0,0 +1,306 @@
+# cotizaciones/pdf.py
+"""
+PDF de una cotización generado en el servidor con reportlab (Python puro),
+con caché en disco. La clave de la caché es el id de la cotización más una
+huella de su contenido (cabecera, items, parámetros y ConfiguracionEmpresa):
+cualquier cambio genera otra clave y la copia anterior se borra al escribir
+la nueva.
+"""
+import glob
+import hashlib
+import json
+import os
+import tempfile
+from importlib.util import find_spec
+from io import BytesIO
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.html import escape
+
+from .models import ConfiguracionEmpresa
+
+# Subir al cambiar el diseño del documento para invalidar toda la caché
+VERSION_FORMATO = 1
+
+
+class PdfNoDisponible(RuntimeError):
+    """reportlab no está instalado"""
+
+
+def _directorio():
+    return str(settings.PDF_CACHE_DIR)
+
+
+def _nombre(cotizacion_id, huella):
+    return os.path.join(_directorio(), f'cotizacion_{cotizacion_id}_{huella}.pdf')
+
+
+def huella_cotizacion(cotizacion, config):
+    """
+    Hash del contenido que se imprime. La cotización debe venir de
+    carga.cargar_cotizacion para no consultar items uno por uno.
+    """
+    cliente = cotizacion.cliente
+    datos = {
+        'formato': VERSION_FORMATO,
+        'empresa': [config.nombre, config.descripcion, config.direccion, config.telefono,
+                    config.email, config.logo.name if config.logo else ''],
+        'cotizacion': [
+            cotizacion.numero, cotizacion.referencia, cotizacion.lugar, cotizacion.observaciones,
+            cotizacion.fecha_creacion, cotizacion.fecha_vencimiento, cotizacion.tipo_trabajo.nombre,
+            cotizacion.creado_por.get_full_name() or cotizacion.creado_por.username,
+            cotizacion.gastos_traslado,
+        ] + [getattr(cotizacion, campo) for campo in cotizacion.CAMPOS_TOTALES],
+        'cliente': [cliente.nombre, cliente.atencion, cliente.rut, cliente.direccion],
+        'servicios': [
+            [item.servicio.nombre, item.servicio.descripcion, item.servicio.unidad,
+             item.descripcion_personalizada, item.cantidad, item.precio_unitario, item.subtotal,
+             [[p.parametro.nombre, p.valor] for p in item.parametros.all()]]
+            for item in cotizacion.items_servicio.all()
+        ],
+        'materiales': [
+            [item.material.codigo, item.material.nombre, item.material.descripcion,
+             item.material.unidad, item.descripcion_personalizada, item.cantidad,
+             item.precio_unitario, item.subtotal]
+            for item in cotizacion.items_material.all()
+        ],
+        'mano_obra': [
+            [item.descripcion, item.horas, item.precio_hora, item.subtotal]
+            for item in cotizacion.items_mano_obra.all()
+        ],
+    }
+    contenido = json.dumps(datos, default=str, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()[:32]
+
+
+def pdf_disponible():
+    return find_spec('reportlab') is not None
+
+
+def pdf_en_cache(cotizacion, config=None):
+    """Bytes del PDF si la versión actual ya está en caché; si no, None"""
+    config = config or ConfiguracionEmpresa.get_config()
+    return _leer(_nombre(cotizacion.pk, huella_cotizacion(cotizacion, config)))
+
+
+def obtener_pdf(cotizacion, config=None):
+    """
+    Retorna los bytes del PDF. Si la cotización no cambió desde la última
+    descarga es una lectura de archivo; si no, se genera y se guarda.
+    """
+    config = config or ConfiguracionEmpresa.get_config()
+    ruta = _nombre(cotizacion.pk, huella_cotizacion(cotizacion, config))
+    contenido = _leer(ruta)
+    if contenido is None:
+        contenido = renderizar_pdf(cotizacion, config)
+        _guardar(cotizacion.pk, ruta, contenido)
+    return contenido
+
+
+def _leer(ruta):
+    try:
+        with open(ruta, 'rb') as archivo:
+            return archivo.read()
+    except FileNotFoundError:
+        return None
+
+
+def _guardar(cotizacion_id, ruta, contenido):
+    """Escritura atómica; borra las versiones anteriores de la misma cotización"""
+    os.makedirs(_directorio(), exist_ok=True)
+    anteriores = set(glob.glob(_nombre(cotizacion_id, '*')))
+    descriptor, temporal = tempfile.mkstemp(dir=_directorio(), suffix='.tmp')
+    with os.fdopen(descriptor, 'wb') as archivo:
+        archivo.write(contenido)
+    os.replace(temporal, ruta)
+    for anterior in anteriores - {ruta}:
+        try:
+            os.remove(anterior)
+        except FileNotFoundError:
+            pass
+
+
+def invalidar_pdf(cotizacion_id):
+    """Borra los PDF en caché de una cotización"""
+    for ruta in glob.glob(_nombre(cotizacion_id, '*')):
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+
+
+def _pesos(valor):
+    return '$' + f'{valor:,.0f}'.replace(',', '.')
+
+
+def _cantidad(valor):
+    return format(valor.normalize(), 'f')
+
+
+def renderizar_pdf(cotizacion, config):
+    """Genera el PDF con el mismo contenido que detalle.html"""
+    try:
+        from reportlab.lib import colors
+        from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+        from reportlab.lib.pagesizes import LETTER
+        from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+        from reportlab.lib.units import mm
+        from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+    except ImportError:
+        raise PdfNoDisponible('Para generar PDF se requiere el paquete reportlab')
+
+    azul = colors.HexColor('#174678')
+    estilos = getSampleStyleSheet()
+    normal = ParagraphStyle('normal', parent=estilos['Normal'], fontSize=9, leading=11)
+    pequeno = ParagraphStyle('pequeno', parent=normal, fontSize=8, leading=10, textColor=colors.HexColor('#4b5563'))
+    titulo = ParagraphStyle('titulo', parent=estilos['Title'], fontSize=16, textColor=azul, spaceAfter=2)
+    centrado = ParagraphStyle('centrado', parent=normal, alignment=TA_CENTER)
+    seccion = ParagraphStyle('seccion', parent=estilos['Heading4'], textColor=azul, spaceBefore=8, spaceAfter=4)
+    derecha = ParagraphStyle('derecha', parent=normal, alignment=TA_RIGHT)
+
+    def texto(valor, estilo=normal):
+        return Paragraph(escape(valor or '').replace('\n', '<br/>'), estilo)
+
+    elementos = []
+
+    # Cabecera de la empresa
+    if config.logo:
+        try:
+            elementos.append(Image(config.logo.path, width=30 * mm, height=30 * mm, kind='proportional'))
+        except (OSError, ValueError):
+            pass
+    elementos += [
+        Paragraph(escape(config.nombre), titulo),
+        texto(config.descripcion, centrado),
+        texto(f'{config.direccion}\nTELÉFONOS {config.telefono} / EMAIL {config.email}', centrado),
+        Spacer(1, 6 * mm),
+    ]
+
+    # Cliente y número
+    cliente = cotizacion.cliente
+    lineas = [f'<b>SEÑOR(ES): {escape(cliente.nombre.upper())}</b>']
+    if cliente.atencion:
+        lineas.append(f'<b>ATENCIÓN:</b> {escape(cliente.atencion.upper())}')
+    if cliente.rut:
+        lineas.append(f'<b>RUT:</b> {escape(cliente.rut)}')
+    if cliente.direccion:
+        lineas.append(f'<b>DIRECCIÓN:</b> {escape(cliente.direccion)}')
+    lineas.append(f'<b>REFERENCIA:</b> {escape(cotizacion.referencia.upper())}')
+    lineas.append(f'<b>LUGAR:</b> {escape(cotizacion.lugar.upper())}')
+    numero = Paragraph(
+        f'<b>N° {escape(cotizacion.numero)}</b><br/>'
+        f'{timezone.localtime(cotizacion.fecha_creacion):%d/%m/%Y}', derecha
+    )
+    cabecera = Table([[Paragraph('<br/>'.join(lineas), normal), numero]], colWidths=['70%', '30%'])
+    cabecera.setStyle(TableStyle([('VALIGN', (0, 0), (-1, -1), 'TOP')]))
+    elementos.append(cabecera)
+
+    estilo_tabla = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#eaf3ff')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), azul),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+        ('LINEBELOW', (0, 0), (-1, -1), 0.25, colors.HexColor('#e2e8f0')),
+    ])
+    anchos = ['55%', '15%', '15%', '15%']
+
+    def tabla(titulo_seccion, encabezados, filas):
+        elementos.append(Paragraph(titulo_seccion, seccion))
+        t = Table([encabezados] + filas, colWidths=anchos, repeatRows=1)
+        t.setStyle(estilo_tabla)
+        elementos.append(t)
+
+    items_servicio = cotizacion.items_servicio.all()
+    if items_servicio:
+        filas = []
+        for item in items_servicio:
+            descripcion = [f'<b>{escape(item.servicio.nombre.upper())}</b>',
+                           escape((item.descripcion_personalizada or item.servicio.descripcion).upper())]
+            descripcion += [f'• {escape(p.parametro.nombre)}: {escape(p.valor)}' for p in item.parametros.all()]
+            filas.append([
+                Paragraph('<br/>'.join(descripcion), normal),
+                f'{_cantidad(item.cantidad)} {item.servicio.unidad}',
+                _pesos(item.precio_unitario),
+                _pesos(item.subtotal),
+            ])
+        tabla('DESCRIPCIÓN DE TRABAJOS, DETALLE Y VALORIZACIÓN',
+              ['DESCRIPCIÓN DEL TRABAJO', 'CANTIDAD', 'PRECIO UNIT.', 'SUBTOTAL'], filas)
+
+    items_material = cotizacion.items_material.all()
+    if items_material:
+        filas = []
+        for item in items_material:
+            descripcion = [f'<b>{escape(item.material.codigo)} - {escape(item.material.nombre.upper())}</b>']
+            extra = item.descripcion_personalizada or item.material.descripcion
+            if extra:
+                descripcion.append(escape(extra.upper()))
+            filas.append([
+                Paragraph('<br/>'.join(descripcion), normal),
+                f'{_cantidad(item.cantidad)} {item.material.unidad}',
+                _pesos(item.precio_unitario),
+                _pesos(item.subtotal),
+            ])
+        tabla('MATERIALES', ['MATERIAL', 'CANTIDAD', 'PRECIO UNIT.', 'SUBTOTAL'], filas)
+
+    items_mano_obra = cotizacion.items_mano_obra.all()
+    if items_mano_obra:
+        filas = [
+            [texto(item.descripcion.upper()), _cantidad(item.horas),
+             _pesos(item.precio_hora), _pesos(item.subtotal)]
+            for item in items_mano_obra
+        ]
+        tabla('MANO DE OBRA', ['DESCRIPCIÓN', 'HORAS', 'PRECIO/HORA', 'SUBTOTAL'], filas)
+
+    # Resumen financiero
+    resumen = []
+    for etiqueta, valor in (
+        ('TOTAL TRABAJOS:', cotizacion.subtotal_servicios),
+        ('MATERIALES:', cotizacion.subtotal_materiales),
+        ('MANO DE OBRA:', cotizacion.subtotal_mano_obra),
+        ('GASTOS DE TRASLADO:', cotizacion.gastos_traslado),
+    ):
+        if valor > 0:
+            resumen.append([etiqueta, _pesos(valor)])
+    resumen += [
+        ['VALOR NETO:', _pesos(cotizacion.valor_neto)],
+        ['VALOR IVA (19%):', _pesos(cotizacion.valor_iva)],
+        ['VALOR TOTAL:', _pesos(cotizacion.valor_total)],
+    ]
+    elementos.append(Paragraph('RESUMEN FINANCIERO', seccion))
+    totales = Table(resumen, colWidths=['80%', '20%'])
+    totales.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('TEXTCOLOR', (0, -1), (-1, -1), azul),
+        ('LINEABOVE', (0, -1), (-1, -1), 0.75, azul),
+    ]))
+    elementos.append(totales)
+
+    if cotizacion.observaciones:
+        elementos.append(Paragraph('OBSERVACIONES', seccion))
+        elementos.append(texto(cotizacion.observaciones))
+
+    creado_por = cotizacion.creado_por.get_full_name() or cotizacion.creado_por.username
+    adicional = [
+        f'<b>Tipo de Trabajo:</b> {escape(cotizacion.tipo_trabajo.nombre)}',
+        f'<b>Fecha de Creación:</b> {timezone.localtime(cotizacion.fecha_creacion):%d/%m/%Y %H:%M}',
+    ]
+    if cotizacion.fecha_vencimiento:
+        adicional.append(f'<b>Válida hasta:</b> {cotizacion.fecha_vencimiento:%d/%m/%Y}')
+    adicional.append(f'<b>Creada por:</b> {escape(creado_por)}')
+    elementos += [Spacer(1, 6 * mm), Paragraph('<br/>'.join(adicional), pequeno)]
+
+    salida = BytesIO()
+    documento = SimpleDocTemplate(
+        salida, pagesize=LETTER, title=f'Cotización {cotizacion.numero}',
+        author=config.nombre, leftMargin=15 * mm, rightMargin=15 * mm,
+        topMargin=15 * mm, bottomMargin=15 * mm,
+        # Sin fecha de creación variable: el mismo contenido produce los mismos bytes
+        invariant=1,
+    )
+    documento.build(elementos)
+    return salida.getvalue()
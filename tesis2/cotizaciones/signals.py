@@ -0,0 +1,93 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import busqueda, catalogo, ventas
+from .estadisticas import CAMPOS_ESTADISTICAS, invalidar_estadisticas
+from .models import CategoriaServicio, Cliente, Cotizacion, Material, ParametroServicio, ServicioBase
+from .pdf import invalidar_pdf
+
+
+@receiver(post_delete, sender=Cotizacion)
+def borrar_pdf_cotizacion(sender, instance, **kwargs):
+    """Los cambios de contenido cambian la clave del PDF; al eliminar se borra la caché"""
+    invalidar_pdf(instance.pk)
+
+
+def _cambia_busqueda(sender, update_fields):
+    """Un save(update_fields=...) que no toca campos buscables no reindexa"""
+    if update_fields is None:
+        return True
+    indice = busqueda.indice_de(sender)
+    campos = {campo for campo, _ in indice.campos} | {relacion for relacion, _, _ in indice.relacionados}
+    return bool(campos & set(update_fields))
+
+
+@receiver(post_save, sender=Cotizacion)
+@receiver(post_save, sender=Material)
+def indexar_busqueda(sender, instance, update_fields=None, **kwargs):
+    if busqueda.usa_tokens() and _cambia_busqueda(sender, update_fields):
+        busqueda.indexar_objeto(instance)
+
+
+@receiver(post_save, sender=Cliente)
+def indexar_cliente(sender, instance, created, update_fields=None, **kwargs):
+    if busqueda.usa_tokens() and _cambia_busqueda(sender, update_fields):
+        busqueda.indexar_objeto(instance)
+        if not created:
+            # El nombre del cliente también se busca en sus cotizaciones
+            busqueda.indexar(Cotizacion, instance.cotizacion_set.values('pk'))
+
+
+@receiver(post_delete, sender=Cotizacion)
+@receiver(post_delete, sender=Cliente)
+@receiver(post_delete, sender=Material)
+def desindexar_busqueda(sender, instance, **kwargs):
+    busqueda.desindexar(sender, [instance.pk])
+
+
+@receiver(post_save, sender=Cotizacion)
+def invalidar_dashboard(sender, instance, created, update_fields=None, **kwargs):
+    """Solo las altas y los cambios de estado o total alteran el dashboard"""
+    if created or update_fields is None or CAMPOS_ESTADISTICAS & set(update_fields):
+        invalidar_estadisticas()
+
+
+@receiver(post_delete, sender=Cotizacion)
+def invalidar_dashboard_eliminada(sender, instance, **kwargs):
+    invalidar_estadisticas()
+
+
+def _cambia_venta(update_fields):
+    return update_fields is None or bool(ventas.CAMPOS_VENTA & set(update_fields))
+
+
+@receiver(pre_save, sender=Cotizacion)
+def leer_venta_anterior(sender, instance, update_fields=None, **kwargs):
+    if not instance._state.adding and _cambia_venta(update_fields):
+        ventas.leer_anterior(instance)
+
+
+@receiver(pre_delete, sender=Cotizacion)
+def leer_venta_eliminada(sender, instance, **kwargs):
+    ventas.leer_anterior(instance)
+
+
+@receiver(post_save, sender=Cotizacion)
+def actualizar_ventas(sender, instance, created, update_fields=None, **kwargs):
+    if created or _cambia_venta(update_fields):
+        ventas.actualizar(instance, creada=created)
+
+
+@receiver(post_delete, sender=Cotizacion)
+def quitar_venta(sender, instance, **kwargs):
+    ventas.quitar(instance)
+
+
+@receiver(post_save, sender=CategoriaServicio)
+@receiver(post_save, sender=ServicioBase)
+@receiver(post_save, sender=ParametroServicio)
+@receiver(post_delete, sender=CategoriaServicio)
+@receiver(post_delete, sender=ServicioBase)
+@receiver(post_delete, sender=ParametroServicio)
+def invalidar_catalogo(sender, **kwargs):
+    catalogo.invalidar()
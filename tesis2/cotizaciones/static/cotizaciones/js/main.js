@@ -66,6 +66,241 @@ async function hacerPeticionAjax(url, method = 'GET', data = null) {
     }
 }
 
+// Consultar el estado de un trabajo en segundo plano hasta que termine
+async function esperarTrabajo(trabajoId, alProgresar = null, intervalo = 1500) {
+    while (true) {
+        const trabajo = await hacerPeticionAjax(`/trabajos/${trabajoId}/`);
+        if (alProgresar) alProgresar(trabajo);
+        if (trabajo.estado === 'completado' || trabajo.estado === 'error') {
+            return trabajo;
+        }
+        await new Promise(resolve => setTimeout(resolve, intervalo));
+    }
+}
+
+// Cola de cambios del editor: se envían todos juntos en una sola petición
+const colaOperaciones = [];
+let contadorReferencias = 0;
+
+function encolarOperacion(operacion) {
+    colaOperaciones.push(operacion);
+    actualizarIndicadorPendientes();
+}
+
+function actualizarIndicadorPendientes() {
+    const boton = document.getElementById('btn-aplicar-cambios');
+    if (!boton) return;
+    boton.style.display = colaOperaciones.length ? '' : 'none';
+    boton.textContent = `⏳ Aplicar cambios (${colaOperaciones.length})`;
+}
+
+// Enviar la cola completa; retorna true si no quedan cambios pendientes
+async function enviarOperaciones() {
+    if (colaOperaciones.length === 0) return true;
+    
+    const cotizacionId = window.cotizacionId;
+    if (!cotizacionId) {
+        alert('Error: No se encontró ID de cotización');
+        return false;
+    }
+    
+    const operaciones = colaOperaciones.splice(0);
+    try {
+        const result = await hacerPeticionAjax(`/cotizaciones/${cotizacionId}/items/`, 'POST', {
+            operaciones: operaciones
+        });
+        
+        if (result.success) {
+            actualizarIndicadorPendientes();
+            return true;
+        }
+        alert('Error: ' + result.error);
+    } catch (error) {
+        console.error('Error aplicando cambios:', error);
+        alert('Error al aplicar los cambios');
+    }
+    
+    // Devolver las operaciones a la cola para reintentar
+    colaOperaciones.unshift(...operaciones);
+    actualizarIndicadorPendientes();
+    return false;
+}
+
+async function aplicarCambios() {
+    if (await enviarOperaciones()) {
+        location.reload();
+    }
+}
+
+// Agregar a la tabla una fila para un item aún no guardado
+function agregarFilaPendiente(tablaId, vacioId, celdas, ref) {
+    const vacio = document.getElementById(vacioId);
+    if (vacio) vacio.remove();
+    
+    const fila = document.createElement('tr');
+    fila.className = 'pendiente';
+    fila.dataset.ref = ref;
+    celdas.forEach(valor => {
+        const celda = document.createElement('td');
+        celda.textContent = valor;
+        fila.appendChild(celda);
+    });
+    
+    const acciones = document.createElement('td');
+    const boton = document.createElement('button');
+    boton.type = 'button';
+    boton.className = 'btn small danger';
+    boton.textContent = '🗑️';
+    boton.onclick = () => descartarPendiente(ref);
+    acciones.appendChild(boton);
+    fila.appendChild(acciones);
+    
+    document.querySelector(`#${tablaId} tbody`).appendChild(fila);
+}
+
+// Quitar de la cola un item agregado que todavía no se ha guardado
+function descartarPendiente(ref) {
+    const indice = colaOperaciones.findIndex(op => op.ref === ref);
+    if (indice !== -1) colaOperaciones.splice(indice, 1);
+    
+    const fila = document.querySelector(`tr[data-ref="${ref}"]`);
+    if (fila) fila.remove();
+    actualizarIndicadorPendientes();
+}
+
+function nuevaReferencia() {
+    contadorReferencias += 1;
+    return `nuevo-${contadorReferencias}`;
+}
+
+function formatearSubtotal(a, b) {
+    return `$${Math.round(parseFloat(a) * parseFloat(b)).toLocaleString()}`;
+}
+
+// Avisar si se intenta salir con cambios sin guardar
+window.addEventListener('beforeunload', function(event) {
+    if (colaOperaciones.length > 0) {
+        event.preventDefault();
+        event.returnValue = '';
+    }
+});
+
+// Catálogo (categorías, servicios y parámetros) guardado en el
+// navegador: en IndexedDB o, si no está disponible, en localStorage. La página
+// trae la versión vigente (window.catalogoVersion) y solo se descarga de nuevo
+// si cambió, así que elegir servicios no necesita peticiones al servidor.
+const CLAVE_CATALOGO = 'cotizaciones:catalogo';
+let catalogoEnMemoria = null;
+
+function abrirBaseCatalogo() {
+    return new Promise((resolve, reject) => {
+        if (!window.indexedDB) {
+            reject(new Error('IndexedDB no disponible'));
+            return;
+        }
+        const peticion = indexedDB.open('cotizaciones', 1);
+        peticion.onupgradeneeded = () => peticion.result.createObjectStore('catalogo');
+        peticion.onsuccess = () => resolve(peticion.result);
+        peticion.onerror = () => reject(peticion.error);
+    });
+}
+
+async function leerCatalogoGuardado() {
+    try {
+        const db = await abrirBaseCatalogo();
+        return await new Promise((resolve, reject) => {
+            const peticion = db.transaction('catalogo').objectStore('catalogo').get(CLAVE_CATALOGO);
+            peticion.onsuccess = () => resolve(peticion.result || null);
+            peticion.onerror = () => reject(peticion.error);
+        });
+    } catch (error) {
+        try {
+            const texto = localStorage.getItem(CLAVE_CATALOGO);
+            return texto ? JSON.parse(texto) : null;
+        } catch (e) {
+            return null;
+        }
+    }
+}
+
+async function guardarCatalogo(catalogo) {
+    try {
+        const db = await abrirBaseCatalogo();
+        db.transaction('catalogo', 'readwrite').objectStore('catalogo').put(catalogo, CLAVE_CATALOGO);
+    } catch (error) {
+        try {
+            localStorage.setItem(CLAVE_CATALOGO, JSON.stringify(catalogo));
+        } catch (e) {
+            // Sin espacio: el catálogo queda solo en memoria
+        }
+    }
+}
+
+// Las versiones crecen: una copia igual o más nueva que la de la página
+// sirve. Después de descargarlo se adopta la versión recibida, que puede ser
+// más nueva que la de la página, para no volver a pedirlo en cada selección.
+async function obtenerCatalogo() {
+    if (catalogoEnMemoria && catalogoEnMemoria.version >= window.catalogoVersion) {
+        return catalogoEnMemoria;
+    }
+    let catalogo = await leerCatalogoGuardado();
+    if (!catalogo || catalogo.version < window.catalogoVersion) {
+        catalogo = await hacerPeticionAjax('/cotizaciones/api/catalogo/');
+        await guardarCatalogo(catalogo);
+    }
+    window.catalogoVersion = catalogo.version;
+    catalogoEnMemoria = catalogo;
+    return catalogo;
+}
+
+// Autocompletado de materiales: consulta al servidor cuando se deja de
+// escribir y cancela la petición anterior si sigue en curso
+const ESPERA_BUSQUEDA_MATERIALES = 250;
+let temporizadorMateriales = null;
+let busquedaMaterialesEnCurso = null;
+
+function buscarMateriales() {
+    clearTimeout(temporizadorMateriales);
+    temporizadorMateriales = setTimeout(sugerirMateriales, ESPERA_BUSQUEDA_MATERIALES);
+}
+
+async function sugerirMateriales() {
+    const texto = document.getElementById('material-busqueda').value.trim();
+    const materialSelect = document.getElementById('material-select');
+    
+    if (busquedaMaterialesEnCurso) busquedaMaterialesEnCurso.abort();
+    materialSelect.innerHTML = '<option value="">Seleccionar material</option>';
+    document.getElementById('precio-material').value = '';
+    if (!texto) return;
+    
+    busquedaMaterialesEnCurso = new AbortController();
+    try {
+        const response = await fetch(`/cotizaciones/api/materiales/sugerir/?q=${encodeURIComponent(texto)}`, {
+            signal: busquedaMaterialesEnCurso.signal
+        });
+        const materiales = await response.json();
+        
+        if (materiales.length === 0) {
+            materialSelect.innerHTML = '<option value="">Sin resultados</option>';
+            return;
+        }
+        materiales.forEach(material => {
+            const option = document.createElement('option');
+            option.value = material.id;
+            option.textContent = `${material.codigo} - ${material.nombre}`;
+            option.dataset.precio = material.precio_unitario;
+            materialSelect.appendChild(option);
+        });
+        // El más relevante queda seleccionado
+        materialSelect.selectedIndex = 1;
+        cargarPrecioMaterial();
+    } catch (error) {
+        if (error.name !== 'AbortError') {
+            console.error('Error buscando materiales:', error);
+        }
+    }
+}
+
 // Cargar servicios por categoría
 async function cargarServicios() {
     const categoriaId = document.getElementById('categoria-servicio').value;
@@ -81,7 +316,8 @@ async function cargarServicios() {
     if (!categoriaId) return;
     
     try {
-        const servicios = await hacerPeticionAjax(`/cotizaciones/api/categoria/${categoriaId}/servicios/`);
+        const catalogo = await obtenerCatalogo();
+        const servicios = catalogo.servicios[categoriaId] || [];
         
         servicios.forEach(servicio => {
             const option = document.createElement('option');
@@ -120,7 +356,8 @@ async function cargarParametrosServicio() {
     if (!servicioId || selectedOption.dataset.parametrizable === 'false') return;
     
     try {
-        const parametros = await hacerPeticionAjax(`/cotizaciones/api/servicio/${servicioId}/parametros/`);
+        const catalogo = await obtenerCatalogo();
+        const parametros = catalogo.parametros[servicioId] || [];
         
         if (parametros.length > 0) {
             parametrosContainer.innerHTML = '<h4 style="margin: 0 0 12px; color: var(--azul-700);">Parámetros del Servicio</h4>';
@@ -172,7 +409,7 @@ function cargarPrecioMaterial() {
 }
 
 // Agregar servicio
-async function agregarServicio() {
+function agregarServicio() {
     const cotizacionId = window.cotizacionId;
     if (!cotizacionId) {
         alert('Error: No se encontró ID de cotización');
@@ -202,28 +439,31 @@ async function agregarServicio() {
         });
     }
     
-    try {
-        const result = await hacerPeticionAjax(`/cotizaciones/${cotizacionId}/item-servicio/`, 'POST', {
-            servicio_id: servicioId,
-            cantidad: cantidad,
-            precio_unitario: precioUnitario,
-            descripcion_personalizada: descripcionPersonalizada,
-            parametros: parametros
-        });
-        
-        if (result.success) {
-            location.reload();
-        } else {
-            alert('Error: ' + result.error);
-        }
-    } catch (error) {
-        console.error('Error agregando servicio:', error);
-        alert('Error al agregar el servicio');
-    }
+    const servicioSelect = document.getElementById('servicio-select');
+    const ref = nuevaReferencia();
+    encolarOperacion({
+        op: 'agregar',
+        tipo: 'servicio',
+        ref: ref,
+        servicio_id: servicioId,
+        cantidad: cantidad,
+        precio_unitario: precioUnitario,
+        descripcion_personalizada: descripcionPersonalizada,
+        parametros: parametros
+    });
+    
+    agregarFilaPendiente('tabla-servicios', 'no-servicios', [
+        servicioSelect.selectedOptions[0].textContent,
+        descripcionPersonalizada,
+        cantidad,
+        `$${Math.round(parseFloat(precioUnitario)).toLocaleString()}`,
+        formatearSubtotal(cantidad, precioUnitario)
+    ], ref);
+    cerrarModal('modal-servicio');
 }
 
 // Agregar material
-async function agregarMaterial() {
+function agregarMaterial() {
     const cotizacionId = window.cotizacionId;
     if (!cotizacionId) {
         alert('Error: No se encontró ID de cotización');
@@ -240,27 +480,30 @@ async function agregarMaterial() {
         return;
     }
     
-    try {
-        const result = await hacerPeticionAjax(`/cotizaciones/${cotizacionId}/item-material/`, 'POST', {
-            material_id: materialId,
-            cantidad: cantidad,
-            precio_unitario: precioUnitario,
-            descripcion_personalizada: descripcionPersonalizada
-        });
-        
-        if (result.success) {
-            location.reload();
-        } else {
-            alert('Error: ' + result.error);
-        }
-    } catch (error) {
-        console.error('Error agregando material:', error);
-        alert('Error al agregar el material');
-    }
+    const materialSelect = document.getElementById('material-select');
+    const ref = nuevaReferencia();
+    encolarOperacion({
+        op: 'agregar',
+        tipo: 'material',
+        ref: ref,
+        material_id: materialId,
+        cantidad: cantidad,
+        precio_unitario: precioUnitario,
+        descripcion_personalizada: descripcionPersonalizada
+    });
+    
+    agregarFilaPendiente('tabla-materiales', 'no-materiales', [
+        materialSelect.selectedOptions[0].textContent.trim(),
+        descripcionPersonalizada,
+        cantidad,
+        `$${Math.round(parseFloat(precioUnitario)).toLocaleString()}`,
+        formatearSubtotal(cantidad, precioUnitario)
+    ], ref);
+    cerrarModal('modal-material');
 }
 
 // Agregar mano de obra
-async function agregarManoObra() {
+function agregarManoObra() {
     const cotizacionId = window.cotizacionId;
     if (!cotizacionId) {
         alert('Error: No se encontró ID de cotización');
@@ -276,32 +519,27 @@ async function agregarManoObra() {
         return;
     }
     
-    try {
-        const result = await hacerPeticionAjax(`/cotizaciones/${cotizacionId}/item-mano-obra/`, 'POST', {
-            descripcion: descripcion,
-            horas: horas,
-            precio_hora: precioHora
-        });
-        
-        if (result.success) {
-            location.reload();
-        } else {
-            alert('Error: ' + result.error);
-        }
-    } catch (error) {
-        console.error('Error agregando mano de obra:', error);
-        alert('Error al agregar la mano de obra');
-    }
+    const ref = nuevaReferencia();
+    encolarOperacion({
+        op: 'agregar',
+        tipo: 'mano_obra',
+        ref: ref,
+        descripcion: descripcion,
+        horas: horas,
+        precio_hora: precioHora
+    });
+    
+    agregarFilaPendiente('tabla-mano-obra', 'no-mano-obra', [
+        descripcion,
+        horas,
+        `$${Math.round(parseFloat(precioHora)).toLocaleString()}`,
+        formatearSubtotal(horas, precioHora)
+    ], ref);
+    cerrarModal('modal-mano-obra');
 }
 
-// Eliminar items
-async function eliminarItem(tipo, itemId) {
-    const cotizacionId = window.cotizacionId;
-    if (!cotizacionId) {
-        alert('Error: No se encontró ID de cotización');
-        return;
-    }
-    
+// Eliminar items (se marcan y se eliminan al aplicar los cambios)
+function eliminarItem(tipo, itemId) {
     const tipoTexto = {
         'servicio': 'servicio',
         'material': 'material',
@@ -310,20 +548,21 @@ async function eliminarItem(tipo, itemId) {
     
     if (!confirm(`¿Estás seguro de eliminar este ${tipoTexto[tipo]}?`)) return;
     
-    try {
-        const result = await hacerPeticionAjax(
-            `/cotizaciones/${cotizacionId}/item-${tipo}/${itemId}/eliminar/`, 
-            'DELETE'
-        );
-        
-        if (result.success) {
-            location.reload();
-        } else {
-            alert(`Error al eliminar el ${tipoTexto[tipo]}`);
-        }
-    } catch (error) {
-        console.error(`Error eliminando ${tipo}:`, error);
-        alert(`Error al eliminar el ${tipoTexto[tipo]}`);
+    encolarOperacion({
+        op: 'eliminar',
+        tipo: tipo.replace('-', '_'),
+        id: itemId
+    });
+    
+    const tablas = {
+        'servicio': 'tabla-servicios',
+        'material': 'tabla-materiales',
+        'mano-obra': 'tabla-mano-obra'
+    };
+    const fila = document.querySelector(`#${tablas[tipo]} tr[data-item-id="${itemId}"]`);
+    if (fila) {
+        fila.classList.add('por-eliminar');
+        fila.querySelectorAll('button').forEach(boton => boton.disabled = true);
     }
 }
 
@@ -419,7 +658,10 @@ document.addEventListener('click', function(event) {
 });
 
 // Función para guardar cotización (modo editar)
-function guardarCotizacion() {
+async function guardarCotizacion() {
+    // Guardar primero los cambios de items pendientes
+    if (!(await enviarOperaciones())) return;
+    
     const form = document.getElementById('cotizacion-form');
     if (form) {
         form.submit();
@@ -1,3 +1,1646 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import Future
+from decimal import ROUND_HALF_UP, Decimal
+from functools import partial
+from importlib import import_module
+from importlib.util import find_spec
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+
+from home.tests import PresupuestoConsultasMixin, crear_empleado, descargar, leer_csv
+
+from . import analitica, busqueda, catalogo, estadisticas, ventas
+from .estadisticas import calcular_estadisticas, estadisticas_dashboard
+from .exportacion_pdf import filtrar_cotizaciones, generar_pdfs
+from .operaciones import aplicar_plantillas
+from .fechas import rango_dias, rango_mes
+from .importacion import importar_materiales
+from .models import (
+    CategoriaServicio, Cliente, ConfiguracionEmpresa, ContadorCotizacion, Cotizacion, ItemManoObra,
+    ItemMaterial, ItemPlantillaServicio, ItemServicio, Material, ParametroItemServicio,
+    ParametroServicio, PlantillaCotizacion, ServicioBase, TipoTrabajo, TokenBusqueda, VentaDiaria,
+    calcular_subtotal, separar_opciones,
+)
+from .parametros import ParametroInvalido, valores_de_items
+
+
+# Fábricas
+
+_secuencia = itertools.count(1)
+
+
+def crear_catalogo(categorias=2, servicios_por_categoria=5, parametros=2):
+    """Crea categorías con servicios parametrizables; retorna los servicios"""
+    servicios = []
+    for _ in range(categorias):
+        n = next(_secuencia)
+        categoria = CategoriaServicio.objects.create(nombre=f'Categoría {n}', orden=n)
+        servicios += ServicioBase.objects.bulk_create([
+            ServicioBase(
+                categoria=categoria,
+                nombre=f'Servicio {n}-{i}',
+                descripcion='Instalación y mantención de bombas',
+                precio_base=Decimal('15000') + i,
+                es_parametrizable=parametros > 0,
+            )
+            for i in range(servicios_por_categoria)
+        ])
+    ParametroServicio.objects.bulk_create([
+        ParametroServicio(
+            servicio=servicio,
+            nombre=f'Parámetro {i}',
+            tipo='select' if i % 2 else 'texto',
+            opciones='1 HP,2 HP,3 HP' if i % 2 else None,
+            # bulk_create no llama a save(); las opciones se separan aquí
+            opciones_lista=['1 HP', '2 HP', '3 HP'] if i % 2 else [],
+            orden=i,
+            requerido=False,
+        )
+        for servicio in servicios
+        for i in range(parametros)
+    ])
+    return servicios
+
+
+def crear_clientes(cantidad):
+    n = next(_secuencia)
+    return Cliente.objects.bulk_create([
+        Cliente(
+            nombre=f'Cliente {n}-{i}',
+            rut=f'{n}{i:05d}-K',
+            email=f'cliente{n}-{i}@example.com',
+            activo=i % 10 != 0,
+        )
+        for i in range(cantidad)
+    ])
+
+
+def crear_materiales(cantidad):
+    n = next(_secuencia)
+    return Material.objects.bulk_create([
+        Material(
+            codigo=f'MAT-{n}-{i:05d}',
+            nombre=f'Material {n}-{i}',
+            precio_unitario=Decimal('990') + i,
+            categoria=f'Categoría {i % 8}',
+        )
+        for i in range(cantidad)
+    ])
+
+
+def crear_cotizacion(usuario, cliente, tipo_trabajo, servicios=(), materiales=(), mano_obra=0):
+    """Crea una cotización con un item por servicio y material, con parámetros"""
+    cotizacion = Cotizacion.objects.create(
+        numero=f'T-{next(_secuencia):06d}',
+        cliente=cliente,
+        referencia='Mantención de bombas',
+        lugar='Osorno',
+        tipo_trabajo=tipo_trabajo,
+        creado_por=usuario,
+    )
+    agregar_items(cotizacion, servicios, materiales, mano_obra)
+    return cotizacion
+
+
+def agregar_items(cotizacion, servicios=(), materiales=(), mano_obra=0):
+    """Agrega items en bloque (bulk_create no calcula subtotales) y recalcula totales"""
+    items = ItemServicio.objects.bulk_create([
+        ItemServicio(
+            cotizacion=cotizacion, servicio=servicio, cantidad=2,
+            precio_unitario=servicio.precio_base,
+            subtotal=calcular_subtotal(2, servicio.precio_base), orden=i,
+        )
+        for i, servicio in enumerate(servicios)
+    ])
+    parametros = {}
+    for parametro in ParametroServicio.objects.filter(servicio__in=servicios):
+        parametros.setdefault(parametro.servicio_id, []).append(parametro)
+    ParametroItemServicio.objects.bulk_create([
+        ParametroItemServicio(item_servicio=item, parametro=parametro, valor='2 HP')
+        for item in items
+        for parametro in parametros.get(item.servicio_id, [])
+    ])
+    ItemMaterial.objects.bulk_create([
+        ItemMaterial(
+            cotizacion=cotizacion, material=material, cantidad=3,
+            precio_unitario=material.precio_unitario,
+            subtotal=calcular_subtotal(3, material.precio_unitario),
+        )
+        for material in materiales
+    ])
+    ItemManoObra.objects.bulk_create([
+        ItemManoObra(
+            cotizacion=cotizacion, descripcion=f'Mano de obra {i}', horas=4,
+            precio_hora=Decimal('8000'), subtotal=calcular_subtotal(4, Decimal('8000')),
+        )
+        for i in range(mano_obra)
+    ])
+    cotizacion.calcular_totales()
+
+
+# Los PDF generados en los tests no deben quedar en el proyecto
+PDF_CACHE_TEST = tempfile.mkdtemp(prefix='pdf-cache-')
+
+
+@override_settings(PDF_CACHE_DIR=PDF_CACHE_TEST)
+class CotizacionesBaseTest(PresupuestoConsultasMixin, TestCase):
+    """Datos realistas: catálogo, cientos de clientes y materiales, cotizaciones con items"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = crear_empleado('admin', cargo='admin')
+        cls.tipo_trabajo = TipoTrabajo.objects.create(nombre='Mantención')
+        ConfiguracionEmpresa.get_config()
+        # Año ya iniciado: el contador existe, como en producción
+        ContadorCotizacion.objects.create(anio=timezone.now().year, ultimo=1)
+        cls.servicios = crear_catalogo()
+        cls.clientes = crear_clientes(200)
+        cls.materiales = crear_materiales(200)
+        cls.cotizacion = crear_cotizacion(
+            cls.usuario, cls.clientes[0], cls.tipo_trabajo,
+            cls.servicios, cls.materiales[:20], mano_obra=10,
+        )
+        for cliente in cls.clientes[1:30]:
+            crear_cotizacion(cls.usuario, cliente, cls.tipo_trabajo,
+                             cls.servicios[:3], cls.materiales[:3], mano_obra=1)
+        cls.plantilla = PlantillaCotizacion.objects.create(nombre='Básica', tipo_trabajo=cls.tipo_trabajo)
+        ItemPlantillaServicio.objects.bulk_create([
+            ItemPlantillaServicio(plantilla=cls.plantilla, servicio=servicio, orden=i)
+            for i, servicio in enumerate(cls.servicios[:5])
+        ])
+        # Las fábricas usan bulk_create, que no indexa para la búsqueda
+        for modelo in (Cliente, Material, Cotizacion):
+            busqueda.reconstruir(modelo)
+
+    def setUp(self):
+        # La caché (catálogo, estadísticas) no se revierte con la transacción de cada test
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def crecer(self):
+        """Duplica el catálogo, los clientes, los materiales y los items de la cotización"""
+        servicios = crear_catalogo()
+        clientes = crear_clientes(200)
+        materiales = crear_materiales(200)
+        agregar_items(self.cotizacion, servicios, materiales[:20], mano_obra=10)
+        for cliente in clientes[:30]:
+            crear_cotizacion(self.usuario, cliente, self.tipo_trabajo,
+                             servicios[:3], materiales[:3], mano_obra=1)
+
+    def get(self, nombre, *args, **kwargs):
+        url = reverse(f'cotizaciones:{nombre}', args=args)
+        return lambda: self.client.get(url, kwargs)
+
+    def json(self, metodo, nombre, *args, datos=None):
+        url = reverse(f'cotizaciones:{nombre}', args=args)
+        return getattr(self.client, metodo)(url, json.dumps(datos or {}), content_type='application/json')
+
+
+class PresupuestoPaginasTests(CotizacionesBaseTest):
+    """Páginas HTML de cotizaciones/urls.py"""
+
+    def test_dashboard(self):
+        self.assertPresupuesto(5, self.get('dashboard'))
+
+    def test_lista(self):
+        self.assertPresupuesto(6, self.get('lista'))
+
+    def test_lista_filtrada(self):
+        self.assertPresupuesto(7, self.get('lista', busqueda='Cliente', estado='borrador',
+                                           cliente=self.clientes[1].pk))
+
+    def test_crear_formulario(self):
+        self.assertPresupuesto(5, self.get('crear'))
+
+    def test_crear(self):
+        datos = {
+            'cliente': self.clientes[1].pk,
+            'referencia': 'Nueva',
+            'lugar': 'Osorno',
+            'tipo_trabajo': self.tipo_trabajo.pk,
+        }
+        # Incluye los tokens de búsqueda de SQLite (2 consultas) y el resumen de ventas (1)
+        self.assertPresupuesto(
+            15, lambda: self.client.post(reverse('cotizaciones:crear'), datos), estado=302
+        )
+
+    def test_detalle(self):
+        self.assertPresupuesto(9, self.get('detalle', self.cotizacion.pk))
+
+    def test_editar(self):
+        # Con la caché vacía incluye las 3 consultas que arman el catálogo
+        self.assertPresupuesto(13, self.get('editar', self.cotizacion.pk))
+
+    def test_generar_pdf(self):
+        self.assertPresupuesto(9, self.get('generar_pdf', self.cotizacion.pk))
+
+    def test_editar_guardar(self):
+        datos = {
+            'cliente': self.clientes[1].pk,
+            'referencia': 'Editada',
+            'lugar': 'Osorno',
+            'tipo_trabajo': self.tipo_trabajo.pk,
+        }
+        url = reverse('cotizaciones:editar', args=[self.cotizacion.pk])
+
+        def preparar():
+            # Cada medición cambia el cliente (y mueve la cotización en el resumen de ventas)
+            self.cotizacion.cliente = self.clientes[0]
+            self.cotizacion.save()
+
+        self.assertPresupuesto(14, lambda: self.client.post(url, datos), estado=302, preparar=preparar)
+
+    def test_generar_pdf_segundo_plano(self):
+        self.assertPresupuesto(5, self.get('generar_pdf', self.cotizacion.pk, segundo_plano=1))
+
+    def test_gestionar_clientes(self):
+        self.assertPresupuesto(6, self.get('gestionar_clientes'))
+
+    def test_gestionar_clientes_busqueda(self):
+        self.assertPresupuesto(6, self.get('gestionar_clientes', busqueda='Cliente'))
+
+    def test_gestionar_servicios(self):
+        self.assertPresupuesto(7, self.get('gestionar_servicios'))
+
+    def test_gestionar_materiales(self):
+        self.assertPresupuesto(8, self.get('gestionar_materiales'))
+
+    def test_gestionar_materiales_filtrado(self):
+        self.assertPresupuesto(8, self.get('gestionar_materiales', busqueda='Material',
+                                           categoria='Categoría 1'))
+
+    def test_exportar_csv(self):
+        # Sesión, usuario y perfil más una consulta por exportación (tres con items)
+        for nombre, filtros, consultas in (
+            ('exportar_csv', {'estado': 'borrador', 'busqueda': 'Cliente'}, 4),
+            ('exportar_csv', {'items': 1}, 7),
+            ('exportar_clientes_csv', {'busqueda': 'Cliente'}, 4),
+            ('exportar_materiales_csv', {'categoria': 'Categoría 1'}, 4),
+        ):
+            peticion = self.get(nombre, **filtros)
+            with self.subTest(nombre=nombre, filtros=filtros):
+                self.assertPresupuesto(consultas, lambda: descargar(peticion()))
+
+
+class PresupuestoItemsTests(CotizacionesBaseTest):
+    """APIs de items, totales, estado y plantillas"""
+
+    def test_agregar_item_servicio(self):
+        servicio = self.servicios[0]
+        parametros = {p.pk: (p.opciones_lista or ['valor'])[0] for p in servicio.parametros.all()}
+        # Una consulta valida todos los parámetros y una los inserta
+        respuesta = self.assertPresupuesto(15, lambda: self.json(
+            'post', 'agregar_item_servicio', self.cotizacion.pk,
+            datos={'servicio_id': servicio.pk, 'cantidad': 1, 'precio_unitario': 1000,
+                   'parametros': parametros},
+        ))
+        self.assertTrue(respuesta.json()['success'])
+
+    def test_agregar_item_material(self):
+        respuesta = self.assertPresupuesto(12, lambda: self.json(
+            'post', 'agregar_item_material', self.cotizacion.pk,
+            datos={'material_id': self.materiales[0].pk, 'cantidad': 1, 'precio_unitario': 500},
+        ))
+        self.assertTrue(respuesta.json()['success'])
+
+    def test_agregar_item_mano_obra(self):
+        respuesta = self.assertPresupuesto(11, lambda: self.json(
+            'post', 'agregar_item_mano_obra', self.cotizacion.pk,
+            datos={'descripcion': 'Instalación', 'horas': 2, 'precio_hora': 8000},
+        ))
+        self.assertTrue(respuesta.json()['success'])
+
+    def test_operaciones_items(self):
+        def peticion():
+            servicio_item, material_item = (
+                self.cotizacion.items_servicio.first(), self.cotizacion.items_material.first()
+            )
+            return self.json('post', 'operaciones_items', self.cotizacion.pk, datos={'operaciones': [
+                {'op': 'agregar', 'tipo': 'servicio', 'servicio_id': self.servicios[1].pk,
+                 'cantidad': 1, 'precio_unitario': 100},
+                {'op': 'agregar', 'tipo': 'material', 'material_id': self.materiales[1].pk,
+                 'cantidad': 1, 'precio_unitario': 100},
+                {'op': 'agregar', 'tipo': 'mano_obra', 'descripcion': 'Extra', 'horas': 1, 'precio_hora': 100},
+                {'op': 'actualizar', 'tipo': 'servicio', 'id': servicio_item.pk, 'cantidad': 5},
+                {'op': 'eliminar', 'tipo': 'material', 'id': material_item.pk},
+            ]})
+        # El presupuesto incluye las dos lecturas de first() de la petición y
+        # la de los parámetros del servicio nuevo (por sus valores por defecto)
+        respuesta = self.assertPresupuesto(22, peticion)
+        self.assertTrue(respuesta.json()['success'])
+
+    def test_actualizar_gastos_traslado(self):
+        respuesta = self.assertPresupuesto(10, lambda: self.json(
+            'post', 'actualizar_gastos_traslado', self.cotizacion.pk, datos={'gastos_traslado': 15000}
+        ))
+        self.assertTrue(respuesta.json()['success'])
+
+    def test_eliminar_items(self):
+        for tipo, relacionados in (('servicio', 'items_servicio'), ('material', 'items_material'),
+                                   ('mano_obra', 'items_mano_obra')):
+            with self.subTest(tipo=tipo):
+                ids = iter(getattr(self.cotizacion, relacionados).values_list('pk', flat=True)[:2])
+                nombre = f'eliminar_item_{tipo}'
+                respuesta = self.assertPresupuesto(13, lambda: self.json(
+                    'delete', nombre, self.cotizacion.pk, next(ids)
+                ))
+                self.assertTrue(respuesta.json()['success'])
+
+    def test_cambiar_estado(self):
+        def preparar():
+            # Parte de borrador con la fila de 'enviada' ya creada en el resumen de ventas
+            for estado in ('enviada', 'borrador'):
+                self.cotizacion.estado = estado
+                self.cotizacion.save(update_fields=['estado'])
+
+        respuesta = self.assertPresupuesto(8, lambda: self.json(
+            'post', 'cambiar_estado', self.cotizacion.pk, datos={'estado': 'enviada'}
+        ), preparar=preparar)
+        self.assertTrue(respuesta.json()['success'])
+
+    def test_aplicar_plantilla(self):
+        url = reverse('cotizaciones:aplicar_plantilla', args=[self.cotizacion.pk, self.plantilla.pk])
+        self.assertPresupuesto(13, lambda: self.client.get(url), estado=302)
+
+    def test_aplicar_plantillas_lote(self):
+        # Costo fijo: los totales de todas las cotizaciones (y su resumen de
+        # ventas) se leen y escriben con una consulta cada uno
+        for cantidad in (10, 20):
+            with self.subTest(cotizaciones=cantidad):
+                cotizaciones = list(Cotizacion.objects.values_list('pk', flat=True)[:cantidad])
+                respuesta = self.assertPresupuesto(13, lambda: self.json(
+                    'post', 'aplicar_plantillas_lote',
+                    datos={'cotizaciones': cotizaciones, 'plantillas': [self.plantilla.pk]},
+                ))
+                self.assertEqual(respuesta.json()['items_creados'], 5 * cantidad)
+
+    def test_aplicar_plantillas_lote_totales(self):
+        antes = Cotizacion.objects.get(pk=self.cotizacion.pk)
+        self.json('post', 'aplicar_plantillas_lote', datos={
+            'cotizaciones': [self.cotizacion.pk, self.clientes[1].cotizacion_set.get().pk],
+            'plantillas': [self.plantilla.pk],
+        })
+        cotizacion = Cotizacion.objects.get(pk=self.cotizacion.pk)
+        agregado = sum(calcular_subtotal(1, servicio.precio_base) for servicio in self.servicios[:5])
+        self.assertEqual(cotizacion.subtotal_servicios, antes.subtotal_servicios + agregado)
+        self.assertEqual(
+            cotizacion.subtotal_servicios, cotizacion.items_servicio.aggregate(total=Sum('subtotal'))['total']
+        )
+        self.assertEqual(cotizacion.subtotal_materiales, antes.subtotal_materiales)
+        neto = antes.valor_neto + agregado
+        self.assertEqual(cotizacion.valor_neto, neto)
+        self.assertEqual(
+            cotizacion.valor_total, neto + (neto * Decimal('0.19')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        )
+
+    def test_servicios_categoria(self):
+        # Con la caché vacía incluye las 3 consultas que arman el catálogo
+        categoria = self.servicios[0].categoria_id
+        self.assertPresupuesto(6, self.get('servicios_categoria', categoria))
+
+    def test_parametros_servicio(self):
+        self.assertPresupuesto(6, self.get('parametros_servicio', self.servicios[0].pk))
+
+    def test_catalogo(self):
+        self.assertPresupuesto(6, self.get('catalogo'))
+
+
+class PresupuestoCatalogosTests(CotizacionesBaseTest):
+    """APIs CRUD de clientes, servicios, categorías y materiales"""
+
+    # Sin PostgreSQL, guardar un cliente, material o cotización también
+    # reescribe sus tokens de búsqueda (borrar e insertar: 2 consultas)
+
+    def test_crear_cliente(self):
+        self.assertPresupuesto(6, lambda: self.json('post', 'crear_cliente', datos={'nombre': 'Nuevo'}))
+
+    def test_obtener_cliente(self):
+        self.assertPresupuesto(4, self.get('obtener_cliente', self.clientes[0].pk))
+
+    def test_editar_cliente(self):
+        # Más las cotizaciones del cliente, que se buscan por su nombre
+        self.assertPresupuesto(10, lambda: self.json(
+            'put', 'editar_cliente', self.clientes[0].pk, datos={'telefono': '912345678'}
+        ))
+
+    def test_eliminar_cliente(self):
+        # Clientes sin cotizaciones
+        ids = iter([c.pk for c in self.clientes[-2:]])
+        respuesta = self.assertPresupuesto(12, lambda: self.json('delete', 'eliminar_cliente', next(ids)))
+        self.assertTrue(respuesta.json()['success'])
+
+    def test_crear_servicio(self):
+        categoria = self.servicios[0].categoria_id
+        self.assertPresupuesto(5, lambda: self.json('post', 'crear_servicio', datos={
+            'categoria_id': categoria, 'nombre': 'Nuevo', 'descripcion': 'd', 'precio_base': 1000,
+        }))
+
+    def test_obtener_servicio(self):
+        self.assertPresupuesto(5, self.get('obtener_servicio', self.servicios[0].pk))
+
+    def test_editar_servicio(self):
+        servicio = self.servicios[0]
+        self.assertPresupuesto(6, lambda: self.json(
+            'put', 'editar_servicio', servicio.pk,
+            datos={'categoria_id': servicio.categoria_id, 'precio_base': 20000},
+        ))
+
+    def test_eliminar_servicio(self):
+        # Servicios sin items ni parámetros
+        nuevos = ServicioBase.objects.bulk_create([
+            ServicioBase(categoria_id=self.servicios[0].categoria_id, nombre=f'Suelto {i}',
+                         descripcion='d', precio_base=1)
+            for i in range(2)
+        ])
+        ids = iter([s.pk for s in nuevos])
+        respuesta = self.assertPresupuesto(14, lambda: self.json('delete', 'eliminar_servicio', next(ids)))
+        self.assertTrue(respuesta.json()['success'])
+
+    def test_crear_categoria_servicio(self):
+        self.assertPresupuesto(4, lambda: self.json('post', 'crear_categoria_servicio', datos={'nombre': 'Nueva'}))
+
+    def test_crear_material(self):
+        codigos = iter(['NUEVO-1', 'NUEVO-2'])
+        self.assertPresupuesto(6, lambda: self.json('post', 'crear_material', datos={
+            'codigo': next(codigos), 'nombre': 'Nuevo', 'precio_unitario': 100,
+        }))
+
+    def test_obtener_material(self):
+        self.assertPresupuesto(4, self.get('obtener_material', self.materiales[0].pk))
+
+    def test_editar_material(self):
+        self.assertPresupuesto(7, lambda: self.json(
+            'put', 'editar_material', self.materiales[0].pk, datos={'precio_unitario': 1500}
+        ))
+
+    def test_eliminar_material(self):
+        ids = iter([m.pk for m in self.materiales[-2:]])
+        respuesta = self.assertPresupuesto(10, lambda: self.json('delete', 'eliminar_material', next(ids)))
+        self.assertTrue(respuesta.json()['success'])
+
+    def test_validar_codigo_material(self):
+        self.assertPresupuesto(4, self.get('validar_codigo_material', codigo='MAT-1-00001'))
+
+    def test_importar_materiales_csv(self):
+        lote = itertools.count()
+
+        def peticion():
+            n = next(lote)
+            filas = ''.join(f'IMP-{n}-{i},Importado {i},{100 + i}\n' for i in range(300))
+            archivo = SimpleUploadedFile(
+                'materiales.csv', ('codigo,nombre,precio_unitario\n' + filas).encode()
+            )
+            return self.client.post(reverse('cotizaciones:importar_materiales_csv'), {'archivo': archivo})
+        # Los tokens de búsqueda de SQLite se insertan en lotes limitados por
+        # su máximo de parámetros (unas 25 consultas para 300 materiales)
+        respuesta = self.assertPresupuesto(35, peticion)
+        self.assertEqual(respuesta.json()['materiales_creados'], 300)
+
+
+class OperacionesItemsTests(CotizacionesBaseTest):
+    """Operaciones en lote sobre los items de una cotización"""
+
+    def operaciones(self, *operaciones):
+        return self.json('post', 'operaciones_items', self.cotizacion.pk, datos={'operaciones': list(operaciones)})
+
+    def estado(self):
+        """Items y totales guardados de la cotización"""
+        cotizacion = Cotizacion.objects.get(pk=self.cotizacion.pk)
+        return (
+            list(ItemServicio.objects.filter(cotizacion=cotizacion).values_list('pk', 'cantidad', 'subtotal', 'orden')),
+            list(ItemMaterial.objects.filter(cotizacion=cotizacion).values_list('pk', 'subtotal')),
+            list(ItemManoObra.objects.filter(cotizacion=cotizacion).values_list('pk', 'subtotal')),
+            [getattr(cotizacion, campo) for campo in Cotizacion.CAMPOS_TOTALES],
+        )
+
+    def test_aplica_cada_operacion(self):
+        servicio_item = self.cotizacion.items_servicio.first()
+        material_item = self.cotizacion.items_material.first()
+        servicios_antes = self.cotizacion.items_servicio.count()
+        respuesta = self.operaciones(
+            {'op': 'agregar', 'tipo': 'servicio', 'ref': 's', 'servicio_id': self.servicios[1].pk,
+             'cantidad': 2, 'precio_unitario': '150.25'},
+            {'op': 'agregar', 'tipo': 'material', 'ref': 'm', 'material_id': self.materiales[1].pk,
+             'cantidad': '1.5', 'precio_unitario': '333.33'},
+            {'op': 'agregar', 'tipo': 'mano_obra', 'ref': 'o', 'descripcion': 'Extra', 'horas': 3, 'precio_hora': 100},
+            {'op': 'actualizar', 'tipo': 'servicio', 'id': servicio_item.pk, 'cantidad': 5},
+            {'op': 'eliminar', 'tipo': 'material', 'id': material_item.pk},
+        ).json()
+        self.assertTrue(respuesta['success'])
+
+        creados = {creado['ref']: creado for creado in respuesta['creados']}
+        servicio = ItemServicio.objects.get(pk=creados['s']['id'], cotizacion=self.cotizacion)
+        self.assertEqual((servicio.servicio_id, servicio.subtotal, servicio.orden),
+                         (self.servicios[1].pk, Decimal('300.50'), servicios_antes))
+        self.assertEqual(ItemMaterial.objects.get(pk=creados['m']['id']).subtotal, Decimal('500.00'))
+        self.assertEqual(ItemManoObra.objects.get(pk=creados['o']['id']).subtotal, Decimal('300.00'))
+        self.assertEqual(creados['m']['subtotal'], 500.0)
+
+        servicio_item.refresh_from_db()
+        self.assertEqual(servicio_item.cantidad, 5)
+        self.assertEqual(servicio_item.subtotal, calcular_subtotal(5, servicio_item.precio_unitario))
+        self.assertFalse(ItemMaterial.objects.filter(pk=material_item.pk).exists())
+
+        # Totales recalculados una vez, iguales a la suma de los items guardados
+        cotizacion = Cotizacion.objects.get(pk=self.cotizacion.pk)
+        for campo, relacion in (('subtotal_servicios', 'items_servicio'), ('subtotal_materiales', 'items_material'),
+                                ('subtotal_mano_obra', 'items_mano_obra')):
+            self.assertEqual(getattr(cotizacion, campo), getattr(cotizacion, relacion).aggregate(s=Sum('subtotal'))['s'])
+        neto = (cotizacion.subtotal_servicios + cotizacion.subtotal_materiales
+                + cotizacion.subtotal_mano_obra + cotizacion.gastos_traslado)
+        self.assertEqual(cotizacion.valor_neto, neto)
+        iva = (neto * Decimal('0.19')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        self.assertEqual((cotizacion.valor_iva, cotizacion.valor_total), (iva, neto + iva))
+        self.assertEqual(respuesta['valor_total'], float(cotizacion.valor_total))
+
+    def test_reordenar(self):
+        ids = list(self.cotizacion.items_servicio.order_by('orden').values_list('pk', flat=True))
+        respuesta = self.operaciones({'op': 'reordenar', 'tipo': 'servicio', 'ids': ids[::-1]})
+        self.assertTrue(respuesta.json()['success'])
+        self.assertEqual(list(self.cotizacion.items_servicio.order_by('orden').values_list('pk', flat=True)), ids[::-1])
+        self.assertEqual(list(self.cotizacion.items_servicio.values_list('orden', flat=True)), list(range(len(ids))))
+
+        respuesta = self.operaciones({'op': 'reordenar', 'tipo': 'material', 'ids': []})
+        self.assertEqual(respuesta.json()['error'], 'Operación 0: solo los servicios se pueden reordenar')
+
+    def test_operacion_invalida_al_final_revierte_el_lote(self):
+        antes = self.estado()
+        respuesta = self.operaciones(
+            {'op': 'agregar', 'tipo': 'mano_obra', 'descripcion': 'Extra', 'horas': 1, 'precio_hora': 100},
+            {'op': 'actualizar', 'tipo': 'servicio', 'id': antes[0][0][0], 'cantidad': 9},
+            {'op': 'eliminar', 'tipo': 'material', 'id': antes[1][0][0]},
+            {'op': 'reordenar', 'tipo': 'servicio', 'ids': [fila[0] for fila in antes[0]][::-1]},
+            {'op': 'agregar', 'tipo': 'material', 'material_id': 0, 'cantidad': 1, 'precio_unitario': 1},
+        ).json()
+        self.assertEqual((respuesta['success'], respuesta['error']), (False, 'Operación 4: material no encontrado'))
+        self.assertEqual(self.estado(), antes)
+
+    def test_error_al_guardar_revierte_el_lote(self):
+        # Un error dentro de la transacción (después de escribir los items)
+        antes = self.estado()
+        with mock.patch.object(Cotizacion, 'calcular_totales', side_effect=DatabaseError('sin conexión')):
+            respuesta = self.operaciones(
+                {'op': 'agregar', 'tipo': 'mano_obra', 'descripcion': 'Extra', 'horas': 1, 'precio_hora': 100},
+                {'op': 'actualizar', 'tipo': 'servicio', 'id': antes[0][0][0], 'cantidad': 9},
+                {'op': 'eliminar', 'tipo': 'material', 'id': antes[1][0][0]},
+            ).json()
+        self.assertFalse(respuesta['success'])
+        self.assertEqual(self.estado(), antes)
+
+
+class TotalesCotizacionTests(CotizacionesBaseTest):
+    """Totales en SQL y por variación iguales a la suma anterior en Python"""
+
+    # Productos con más de 2 decimales (se redondean hacia arriba en .5)
+    ITEMS = [
+        (ItemServicio, 'servicios', {'cantidad': Decimal('1.5'), 'precio_unitario': Decimal('333.33')}),
+        (ItemMaterial, 'materiales', {'cantidad': Decimal('2.25'), 'precio_unitario': Decimal('10.01')}),
+        (ItemManoObra, 'mano_obra', {'horas': Decimal('0.75'), 'precio_hora': Decimal('1234.57')}),
+    ]
+    GASTOS = Decimal('15000.57')
+    ESPERADOS = {
+        'subtotal_servicios': Decimal('500.00'),  # 499.995
+        'subtotal_materiales': Decimal('22.52'),  # 22.5225
+        'subtotal_mano_obra': Decimal('925.93'),  # 925.9275
+        'gastos_traslado': Decimal('15000.57'),
+        'valor_neto': Decimal('16449.02'),
+        'valor_iva': Decimal('3125.31'),  # 3125.3138
+        'valor_total': Decimal('19574.33'),
+    }
+
+    def item(self, cotizacion, modelo, valores):
+        if modelo is ItemServicio:
+            valores = {'servicio': self.servicios[0], **valores}
+        elif modelo is ItemMaterial:
+            valores = {'material': self.materiales[0], **valores}
+        else:
+            valores = {'descripcion': 'Instalación', **valores}
+        return modelo.objects.create(cotizacion=cotizacion, **valores)
+
+    def totales(self, cotizacion):
+        return Cotizacion.objects.filter(pk=cotizacion.pk).values(*Cotizacion.CAMPOS_TOTALES).get()
+
+    def test_sql_delta_y_suma_en_python_coinciden(self):
+        from .management.commands.benchmark_totales import _calcular_totales_legacy
+
+        # Camino de las vistas: cada alta, baja y gasto aplica su variación
+        cotizacion = crear_cotizacion(self.usuario, self.clientes[0], self.tipo_trabajo)
+        for modelo, tipo, valores in self.ITEMS:
+            with transaction.atomic():
+                item = self.item(cotizacion, modelo, valores)
+                cotizacion.aplicar_delta_totales(**{tipo: item.subtotal})
+        with transaction.atomic():
+            extra = self.item(cotizacion, ItemMaterial, {'cantidad': 3, 'precio_unitario': Decimal('0.07')})
+            cotizacion.aplicar_delta_totales(materiales=extra.subtotal)
+        with transaction.atomic():
+            extra.delete()
+            cotizacion.aplicar_delta_totales(materiales=-extra.subtotal)
+        with transaction.atomic():
+            cotizacion.aplicar_delta_totales(gastos_traslado=self.GASTOS)
+        delta = self.totales(cotizacion)
+
+        Cotizacion.objects.get(pk=cotizacion.pk).calcular_totales()
+        sql = self.totales(cotizacion)
+
+        _calcular_totales_legacy(Cotizacion.objects.get(pk=cotizacion.pk))
+        python = self.totales(cotizacion)
+
+        self.assertEqual(delta, self.ESPERADOS)
+        self.assertEqual(sql, self.ESPERADOS)
+        self.assertEqual(python, self.ESPERADOS)
+
+    def test_subtotal_redondeado_como_la_bd(self):
+        self.assertEqual(calcular_subtotal(Decimal('1.5'), Decimal('333.33')), Decimal('500.00'))
+        self.assertEqual(calcular_subtotal(Decimal('0.5'), Decimal('0.01')), Decimal('0.01'))
+        self.assertEqual(calcular_subtotal(Decimal('0.25'), Decimal('0.02')), Decimal('0.01'))
+
+
+class ImportacionMaterialesTests(CotizacionesBaseTest):
+    """Validación por fila de la importación de materiales"""
+
+    def test_precio_fuera_de_rango(self):
+        contenido = (
+            'codigo,nombre,precio_unitario\n'
+            'IMP-1,Primero,100\n'
+            'IMP-2,Enorme,1e30\n'
+            'IMP-3,Grande,123456789\n'
+            'IMP-4,Último,50.005\n'
+        )
+        resumen = importar_materiales(io.BytesIO(contenido.encode('utf-8')), tamano_lote=1)
+        self.assertEqual(resumen['materiales_creados'], 2)
+        self.assertEqual(
+            [(error['fila'], error['error']) for error in resumen['errores']],
+            [(3, 'Precio unitario fuera de rango'), (4, 'Precio unitario fuera de rango')],
+        )
+        # Redondeo hacia arriba en .5, igual que los montos del editor
+        self.assertEqual(Material.objects.get(codigo='IMP-4').precio_unitario, Decimal('50.01'))
+
+
+class PdfCotizacionTests(CotizacionesBaseTest):
+    """PDF generado en el servidor y su caché en disco"""
+
+    def setUp(self):
+        super().setUp()
+        shutil.rmtree(PDF_CACHE_TEST, ignore_errors=True)
+        self.url = reverse('cotizaciones:generar_pdf', args=[self.cotizacion.pk])
+
+    def archivos(self):
+        return sorted(os.listdir(PDF_CACHE_TEST)) if os.path.isdir(PDF_CACHE_TEST) else []
+
+    def test_pdf_se_genera_y_reutiliza(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta['Content-Type'], 'application/pdf')
+        self.assertTrue(respuesta.content.startswith(b'%PDF'))
+        self.assertEqual(len(self.archivos()), 1)
+
+        # Sin cambios: se lee el archivo, no se vuelve a generar
+        with mock.patch('cotizaciones.pdf.renderizar_pdf') as renderizar:
+            segunda = self.client.get(self.url)
+        renderizar.assert_not_called()
+        self.assertEqual(segunda.content, respuesta.content)
+
+    def test_cambios_invalidan_la_cache(self):
+        self.client.get(self.url)
+        anterior = self.archivos()
+
+        item = self.cotizacion.items_servicio.first()
+        item.cantidad = 7
+        item.save()
+        self.client.get(self.url)
+        despues_item = self.archivos()
+        self.assertEqual(len(despues_item), 1)
+        self.assertNotEqual(despues_item, anterior)
+
+        config = ConfiguracionEmpresa.get_config()
+        config.telefono = '9-11111111'
+        config.save()
+        self.client.get(self.url)
+        self.assertNotEqual(self.archivos(), despues_item)
+
+    def test_eliminar_cotizacion_borra_el_pdf(self):
+        self.client.get(self.url)
+        self.cotizacion.delete()
+        self.assertEqual(self.archivos(), [])
+
+    def test_formato_html(self):
+        respuesta = self.client.get(self.url, {'formato': 'html'})
+        self.assertEqual(respuesta['Content-Type'], 'text/html')
+
+
+class PoolSincronico:
+    """Reemplazo del pool de procesos que genera cada PDF al enviarlo"""
+    def __init__(self):
+        self.enviados = []
+
+    def submit(self, funcion, *args):
+        self.enviados.append(args)
+        futuro = Future()
+        # Dentro del test no se cierran las conexiones (los hijos reales sí)
+        with mock.patch('django.db.close_old_connections'):
+            futuro.set_result(funcion(*args))
+        return futuro
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+@skipUnless(find_spec('reportlab'), 'requiere reportlab')
+class ExportacionPdfTests(CotizacionesBaseTest):
+    """ZIP con los PDF de varias cotizaciones"""
+
+    def setUp(self):
+        super().setUp()
+        shutil.rmtree(PDF_CACHE_TEST, ignore_errors=True)
+
+    def descargar(self, **filtros):
+        respuesta = self.client.get(reverse('cotizaciones:exportar_pdfs'), filtros)
+        self.assertTrue(respuesta.streaming)
+        return respuesta, zipfile.ZipFile(io.BytesIO(b''.join(respuesta.streaming_content)))
+
+    def test_exporta_las_aprobadas(self):
+        Cotizacion.objects.filter(pk__in=[c.pk for c in Cotizacion.objects.all()[:3]]).update(estado='aprobada')
+        respuesta, archivo = self.descargar()
+        self.assertEqual(respuesta['X-Total-Cotizaciones'], '3')
+        self.assertEqual(len(archivo.namelist()), 3)
+        self.assertIsNone(archivo.testzip())
+
+    def test_reutiliza_la_cache(self):
+        self.client.get(reverse('cotizaciones:generar_pdf', args=[self.cotizacion.pk]))
+        with mock.patch('cotizaciones.pdf.renderizar_pdf') as renderizar:
+            _, archivo = self.descargar(estado='', cliente=self.cotizacion.cliente_id)
+        renderizar.assert_not_called()
+        self.assertEqual(archivo.namelist(), [f'cotizacion_{self.cotizacion.numero}.pdf'])
+
+    @override_settings(EXPORTACION_PDF_PROCESOS=4)
+    def test_descarga_sin_pool(self):
+        Cotizacion.objects.filter(pk=self.cotizacion.pk).update(estado='aprobada')
+        with mock.patch('cotizaciones.exportacion_pdf._crear_pool') as crear_pool:
+            _, archivo = self.descargar()
+        crear_pool.assert_not_called()
+        self.assertEqual(archivo.namelist(), [f'cotizacion_{self.cotizacion.numero}.pdf'])
+
+    def test_pool_de_procesos(self):
+        # Una en caché se entrega sin pasar por el pool; el resto va al pool
+        self.client.get(reverse('cotizaciones:generar_pdf', args=[self.cotizacion.pk]))
+        cotizaciones = filtrar_cotizaciones(estado='')
+        pool = PoolSincronico()
+        avance = []
+        with mock.patch('cotizaciones.exportacion_pdf._crear_pool', return_value=pool) as crear_pool:
+            archivos = dict(generar_pdfs(cotizaciones, procesos=3, progreso=lambda *a: avance.append(a)))
+        crear_pool.assert_called_once_with(3)
+        total = cotizaciones.count()
+        self.assertEqual(len(archivos), total)
+        self.assertTrue(all(contenido.startswith(b'%PDF') for contenido in archivos.values()))
+        self.assertEqual(len(pool.enviados), total - 1)
+        self.assertNotIn((self.cotizacion.pk,), pool.enviados)
+        self.assertEqual(avance[-1], (total, total))
+
+    def test_presupuesto(self):
+        def peticion():
+            respuesta = self.client.get(reverse('cotizaciones:exportar_pdfs'), {'estado': 'borrador'})
+            b''.join(respuesta.streaming_content)
+            return respuesta
+        # Las cotizaciones se cargan con sus items en lotes de TAMANO_LOTE
+        self.assertPresupuesto(11, peticion)
+
+
+class RangoFechasTests(CotizacionesBaseTest):
+    """Filtros por período como rangos [inicio, fin) en hora local"""
+
+    def mover(self, cotizacion, *fecha):
+        Cotizacion.objects.filter(pk=cotizacion.pk).update(
+            fecha_creacion=timezone.make_aware(timezone.datetime(*fecha))
+        )
+
+    def test_dashboard_cuenta_solo_el_mes_actual(self):
+        inicio_mes, _ = rango_mes()
+        anterior = Cotizacion.objects.exclude(pk=self.cotizacion.pk).first()
+        Cotizacion.objects.filter(pk=anterior.pk).update(fecha_creacion=inicio_mes - timezone.timedelta(seconds=1))
+        respuesta = self.client.get(reverse('cotizaciones:dashboard'))
+        self.assertEqual(respuesta.context['cotizaciones_mes'], Cotizacion.objects.count() - 1)
+
+    def test_exportacion_incluye_los_dias_limite(self):
+        primera, ultima, fuera = Cotizacion.objects.all()[:3]
+        self.mover(primera, 2025, 3, 1, 0, 0)
+        self.mover(ultima, 2025, 3, 31, 23, 59, 59)
+        self.mover(fuera, 2025, 4, 1, 0, 0)
+        cotizaciones = filtrar_cotizaciones(estado='', desde='2025-03-01', hasta='2025-03-31')
+        self.assertEqual(set(cotizaciones), {primera, ultima})
+
+
+class EstadisticasDashboardTests(CotizacionesBaseTest):
+    """Estadísticas del dashboard: una consulta, en caché e invalidadas por señales"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_una_consulta_con_los_mismos_valores(self):
+        Cotizacion.objects.filter(pk__in=[c.pk for c in Cotizacion.objects.all()[:4]]).update(estado='enviada')
+        with self.assertNumQueries(1):
+            estadisticas = calcular_estadisticas()
+        self.assertEqual(estadisticas['total_cotizaciones'], Cotizacion.objects.count())
+        self.assertEqual(estadisticas['cotizaciones_mes'], Cotizacion.objects.count())
+        self.assertEqual(estadisticas['cotizaciones_pendientes'], 4)
+        self.assertEqual(
+            estadisticas['valor_total_mes'],
+            Cotizacion.objects.aggregate(total=Sum('valor_total'))['total'],
+        )
+        self.assertEqual(estadisticas['estados_stats'], [
+            {'estado': 'borrador', 'total': Cotizacion.objects.count() - 4},
+            {'estado': 'enviada', 'total': 4},
+        ])
+
+    def test_se_guardan_en_cache(self):
+        estadisticas_dashboard()
+        with self.assertNumQueries(0):
+            estadisticas_dashboard()
+
+    def test_cambio_de_estado_invalida(self):
+        estadisticas_dashboard()
+        respuesta = self.json('post', 'cambiar_estado', self.cotizacion.pk, datos={'estado': 'enviada'})
+        self.assertTrue(respuesta.json()['success'])
+        self.assertEqual(estadisticas_dashboard()['cotizaciones_pendientes'], 1)
+
+    def test_cambio_de_total_invalida(self):
+        antes = estadisticas_dashboard()['valor_total_mes']
+        agregar_items(self.cotizacion, mano_obra=1)
+        self.assertGreater(estadisticas_dashboard()['valor_total_mes'], antes)
+
+    def test_otros_cambios_no_invalidan(self):
+        estadisticas_dashboard()
+        self.cotizacion.referencia = 'Otra referencia'
+        self.cotizacion.save(update_fields=['referencia'])
+        with self.assertNumQueries(0):
+            estadisticas_dashboard()
+
+    def test_alta_y_eliminacion_invalidan(self):
+        total = estadisticas_dashboard()['total_cotizaciones']
+        nueva = crear_cotizacion(self.usuario, self.clientes[0], self.tipo_trabajo)
+        self.assertEqual(estadisticas_dashboard()['total_cotizaciones'], total + 1)
+        nueva.delete()
+        self.assertEqual(estadisticas_dashboard()['total_cotizaciones'], total)
+
+    def test_lectura_antes_del_commit(self):
+        # Otro request que recalcula (con los datos anteriores) antes del
+        # commit no deja esas estadísticas en la caché
+        anteriores = estadisticas_dashboard()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cotizacion.estado = 'enviada'
+            self.cotizacion.save(update_fields=['estado'])
+            cache.set(estadisticas._clave(rango_mes()[0]), anteriores)
+        self.assertEqual(estadisticas_dashboard()['cotizaciones_pendientes'], anteriores['cotizaciones_pendientes'] + 1)
+
+
+class VentaDiariaTests(CotizacionesBaseTest):
+    """Resumen diario de ventas mantenido por señales"""
+
+    def resumen(self):
+        """Filas no vacías del resumen, comparables entre sí"""
+        return {
+            (v.fecha, v.cliente_id, v.tipo_trabajo_id, v.estado, v.cotizaciones,
+             v.valor_neto.quantize(Decimal('0.01')), v.valor_total.quantize(Decimal('0.01')))
+            for v in VentaDiaria.objects.exclude(cotizaciones=0)
+        }
+
+    def assertResumenAlDia(self):
+        mantenido = self.resumen()
+        ventas.reconstruir()
+        self.assertEqual(mantenido, self.resumen())
+
+    def test_senales_mantienen_el_resumen(self):
+        self.assertTrue(VentaDiaria.objects.exists())
+        self.json('post', 'cambiar_estado', self.cotizacion.pk, datos={'estado': 'aprobada'})
+        otra = Cotizacion.objects.exclude(pk=self.cotizacion.pk).first()
+        otra.cliente = self.clientes[50]
+        otra.save()
+        agregar_items(otra, mano_obra=2)
+        Cotizacion.objects.exclude(pk__in=[self.cotizacion.pk, otra.pk]).first().delete()
+        crear_cotizacion(self.usuario, self.clientes[60], self.tipo_trabajo, mano_obra=1)
+        self.assertResumenAlDia()
+
+    def test_plantillas_en_lote_mantienen_el_resumen(self):
+        # Dos cotizaciones con la misma clave (día, cliente, tipo y estado)
+        crear_cotizacion(self.usuario, self.clientes[1], self.tipo_trabajo, mano_obra=1)
+        cotizaciones = list(Cotizacion.objects.filter(cliente__in=self.clientes[:5]))
+        aplicar_plantillas(cotizaciones, [self.plantilla])
+        self.assertResumenAlDia()
+
+    def test_cotizacion_con_campos_diferidos(self):
+        cotizacion = Cotizacion.objects.only('estado').get(pk=self.cotizacion.pk)
+        cotizacion.estado = 'rechazada'
+        cotizacion.save()
+        self.assertResumenAlDia()
+
+    def test_instancias_desactualizadas(self):
+        # Dos instancias de la misma cotización leídas antes de cualquier cambio
+        primera = Cotizacion.objects.get(pk=self.cotizacion.pk)
+        segunda = Cotizacion.objects.get(pk=self.cotizacion.pk)
+        primera.estado = 'enviada'
+        primera.save()
+        segunda.estado = 'aprobada'
+        segunda.save()
+        clave = {'fecha': timezone.localdate(segunda.fecha_creacion), 'cliente': segunda.cliente_id,
+                 'tipo_trabajo': segunda.tipo_trabajo_id}
+        self.assertFalse(VentaDiaria.objects.filter(cotizaciones__lt=0).exists())
+        self.assertFalse(VentaDiaria.objects.filter(estado='enviada', cotizaciones__gt=0, **clave).exists())
+        self.assertResumenAlDia()
+
+        # Los totales aplicados con delta parten de los valores guardados,
+        # no de los que la instancia leyó al cargarse
+        desactualizada = Cotizacion.objects.get(pk=self.cotizacion.pk)
+        with transaction.atomic():
+            Cotizacion.objects.get(pk=self.cotizacion.pk).aplicar_delta_totales(mano_obra=1000)
+        with transaction.atomic():
+            desactualizada.aplicar_delta_totales(materiales=500)
+        self.assertResumenAlDia()
+
+        desactualizada = Cotizacion.objects.get(pk=self.cotizacion.pk)
+        otra = Cotizacion.objects.get(pk=self.cotizacion.pk)
+        otra.estado = 'rechazada'
+        otra.save()
+        desactualizada.delete()
+        self.assertResumenAlDia()
+
+    def test_eliminar_cliente(self):
+        cliente = self.cotizacion.cliente
+        cliente.delete()
+        self.assertFalse(VentaDiaria.objects.filter(cliente=cliente.pk).exists())
+        self.assertResumenAlDia()
+
+    def test_comando_reconstruir(self):
+        # update() no envía señales: el resumen queda desactualizado
+        Cotizacion.objects.update(estado='vencida')
+        call_command('reconstruir_ventas', stdout=io.StringIO())
+        self.assertEqual(
+            set(VentaDiaria.objects.exclude(cotizaciones=0).values_list('estado', flat=True)), {'vencida'}
+        )
+
+    def test_reconstruir_un_periodo(self):
+        hoy = timezone.localdate()
+        ayer = hoy - timezone.timedelta(days=1)
+        VentaDiaria.objects.create(fecha=ayer, cliente=self.clientes[0], tipo_trabajo=self.tipo_trabajo,
+                                   estado='borrador', cotizaciones=5)
+        ventas.reconstruir(desde=hoy, hasta=hoy)
+        self.assertTrue(VentaDiaria.objects.filter(fecha=ayer).exists())
+        with self.assertRaises(CommandError):
+            call_command('reconstruir_ventas', desde=str(hoy), hasta=str(ayer))
+
+    def test_reportes(self):
+        total = Cotizacion.objects.count()
+        respuesta = self.client.get(reverse('home:reportes_ventas'))
+        self.assertEqual(dict(respuesta.context['kpis'])['Cotizaciones'], str(total))
+        for nombre in ('reportes', 'estadisticas'):
+            respuesta = self.client.get(reverse(f'home:{nombre}'))
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertEqual(dict(respuesta.context['kpis'])['Cotizaciones'], str(total))
+
+
+@skipUnless(find_spec('numpy'), 'requiere numpy')
+class AnaliticaTests(CotizacionesBaseTest):
+    """Métricas por categoría de servicio calculadas con columnas NumPy"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i, cotizacion in enumerate(Cotizacion.objects.exclude(pk=cls.cotizacion.pk)[:12]):
+            cotizacion.estado = ('aprobada', 'rechazada', 'vencida', 'enviada')[i % 4]
+            cotizacion.save(update_fields=['estado'])
+
+    def esperado(self):
+        """Mismas métricas recorriendo las instancias"""
+        grupos = {}
+        for item in ItemServicio.objects.select_related('cotizacion', 'servicio'):
+            grupo = grupos.setdefault(item.servicio.categoria_id, {'ingresos': 0, 'base': 0, 'estados': {}})
+            grupo['ingresos'] += item.subtotal
+            grupo['base'] += item.cantidad * item.servicio.precio_base
+            grupo['estados'][item.cotizacion_id] = item.cotizacion.estado
+        return grupos
+
+    def test_metricas_por_categoria(self):
+        metricas = analitica.metricas_por_categoria()
+        esperado = self.esperado()
+        self.assertEqual({m['categoria_id'] for m in metricas}, set(esperado))
+        for fila in metricas:
+            grupo = esperado[fila['categoria_id']]
+            estados = list(grupo['estados'].values())
+            decididas = sum(estado in analitica.ESTADOS_DECIDIDOS for estado in estados)
+            self.assertEqual(fila['periodo'], timezone.localdate().strftime('%Y-%m'))
+            self.assertEqual(fila['cotizaciones'], len(estados))
+            self.assertEqual(fila['aprobadas'], estados.count('aprobada'))
+            self.assertEqual(fila['decididas'], decididas)
+            if decididas:
+                self.assertAlmostEqual(fila['tasa_aprobacion'], estados.count('aprobada') / decididas, places=4)
+            self.assertAlmostEqual(fila['ingresos'], float(grupo['ingresos']), places=2)
+            self.assertAlmostEqual(fila['ticket_promedio'], float(grupo['ingresos']) / len(estados), places=2)
+            self.assertAlmostEqual(
+                fila['margen'], float((grupo['ingresos'] - grupo['base']) / grupo['ingresos']), places=4
+            )
+
+    def test_periodo_sin_items(self):
+        manana = timezone.localdate() + timezone.timedelta(days=1)
+        self.assertEqual(analitica.metricas_por_categoria(*rango_dias(manana, manana)), [])
+        respuesta = self.get('analitica_categorias', desde=str(manana))()
+        self.assertEqual(respuesta.json(), {'success': True, 'metricas': []})
+
+    def test_formatos(self):
+        metricas = self.get('analitica_categorias')().json()['metricas']
+        self.assertEqual(metricas, analitica.metricas_por_categoria())
+
+        respuesta = self.get('analitica_categorias', formato='csv')()
+        self.assertEqual(respuesta['Content-Type'], 'text/csv; charset=utf-8')
+        filas = list(csv.DictReader(io.StringIO(respuesta.content.decode())))
+        self.assertEqual(len(filas), len(metricas))
+        self.assertEqual(list(filas[0]), analitica.COLUMNAS_METRICAS)
+
+        respuesta = self.get('analitica_categorias', formato='parquet')()
+        if analitica.parquet_disponible():
+            import pyarrow.parquet
+            tabla = pyarrow.parquet.read_table(io.BytesIO(respuesta.content))
+            self.assertEqual(tabla.num_rows, len(metricas))
+            self.assertEqual(tabla.column_names, analitica.COLUMNAS_METRICAS)
+        else:
+            self.assertFalse(respuesta.json()['success'])
+
+    def test_filtros_invalidos(self):
+        self.assertEqual(self.get('analitica_categorias', formato='xlsx')().status_code, 400)
+        self.assertEqual(self.get('analitica_categorias', desde='ayer')().status_code, 400)
+
+    def test_requiere_gerente(self):
+        self.client.force_login(crear_empleado('supervisor', cargo='supervisor'))
+        respuesta = self.get('analitica_categorias')()
+        self.assertEqual(respuesta.status_code, 403)
+        self.assertTemplateUsed(respuesta, 'home/error.html')
+        self.assertEqual(self.client.get(reverse('home:estadisticas')).status_code, 403)
+
+    def test_descargas_en_estadisticas(self):
+        descargas = dict(self.client.get(reverse('home:estadisticas')).context['descargas'])
+        self.assertIn('Analítica por categoría (CSV)', descargas)
+
+
+class ExportacionCsvTests(CotizacionesBaseTest):
+    """Exportación CSV en streaming de cotizaciones, clientes y materiales"""
+
+    def test_cotizaciones(self):
+        filas = leer_csv(self.get('exportar_csv')())
+        self.assertEqual(filas[0][:3], ['Número', 'Fecha', 'Cliente'])
+        esperado = list(Cotizacion.objects.order_by('-fecha_creacion', 'id').values_list('numero', flat=True))
+        self.assertEqual([fila[0] for fila in filas[1:]], esperado)
+        primera = filas[esperado.index(self.cotizacion.numero) + 1]
+        self.assertEqual(primera[7], 'Borrador')
+        self.assertEqual(primera[1], timezone.localtime(self.cotizacion.fecha_creacion).strftime('%d/%m/%Y %H:%M'))
+
+    def test_cotizaciones_filtradas(self):
+        filas = leer_csv(self.get('exportar_csv', cliente=self.clientes[0].pk)())
+        self.assertEqual([fila[0] for fila in filas[1:]], [self.cotizacion.numero])
+
+    def test_cotizaciones_con_items(self):
+        ItemServicio.objects.filter(pk=self.cotizacion.items_servicio.first().pk).update(
+            descripcion_personalizada='Descripción propia'
+        )
+        filas = leer_csv(self.get('exportar_csv', items=1)())
+        encabezados = filas[0]
+        self.assertEqual(encabezados[-5:], ['Tipo de item', 'Descripción', 'Cantidad', 'Precio unitario', 'Subtotal'])
+        tipo = encabezados.index('Tipo de item')
+        total = sum(
+            modelo.objects.count() for modelo in (ItemServicio, ItemMaterial, ItemManoObra)
+        )
+        self.assertEqual(len(filas) - 1, total)
+
+        # Agrupadas por cotización en el orden de la lista; dentro, servicios, materiales y mano de obra
+        numeros = list(Cotizacion.objects.order_by('-fecha_creacion', 'id').values_list('numero', flat=True))
+        grupos = [numero for numero, _ in itertools.groupby(fila[0] for fila in filas[1:])]
+        self.assertEqual(grupos, numeros)
+        propias = [fila for fila in filas[1:] if fila[0] == self.cotizacion.numero]
+        self.assertEqual(
+            [t for t, _ in itertools.groupby(fila[tipo] for fila in propias)], ['Servicio', 'Material', 'Mano de obra']
+        )
+        self.assertEqual(propias[0][tipo + 1], 'Descripción propia')
+        self.assertEqual(propias[1][tipo + 1], self.servicios[1].nombre)
+
+    def test_cotizaciones_sin_items(self):
+        vacia = crear_cotizacion(self.usuario, self.clientes[0], self.tipo_trabajo)
+        filas = leer_csv(self.get('exportar_csv', items=1)())
+        tipo = filas[0].index('Tipo de item')
+        propias = [fila for fila in filas[1:] if fila[0] == vacia.numero]
+        self.assertEqual(len(propias), 1)
+        self.assertEqual(propias[0][tipo:], [''] * 5)
+        self.assertEqual(propias[0][2], self.clientes[0].nombre)
+        # Sigue el orden de la lista de cotizaciones
+        numeros = list(Cotizacion.objects.order_by('-fecha_creacion', 'id').values_list('numero', flat=True))
+        self.assertEqual([numero for numero, _ in itertools.groupby(fila[0] for fila in filas[1:])], numeros)
+
+    def test_clientes(self):
+        filas = leer_csv(self.get('exportar_clientes_csv')())
+        self.assertEqual(len(filas) - 1, Cliente.objects.count())
+        self.assertEqual({fila[6] for fila in filas[1:]}, {'Activo', 'Inactivo'})
+
+    def test_materiales_se_pueden_reimportar(self):
+        Material.objects.filter(pk=self.materiales[0].pk).update(descripcion='Con "comillas", y coma')
+        contenido = descargar(self.get('exportar_materiales_csv')()).contenido
+        Material.objects.filter(pk=self.materiales[0].pk).update(descripcion='', nombre='Otro')
+        resumen = importar_materiales(io.BytesIO(contenido), actualizar_existentes=True)
+        self.assertEqual(resumen['materiales_actualizados'], Material.objects.count())
+        material = Material.objects.get(pk=self.materiales[0].pk)
+        self.assertEqual((material.nombre, material.descripcion), (self.materiales[0].nombre, 'Con "comillas", y coma'))
+
+
+class CatalogoTests(CotizacionesBaseTest):
+    """Caché versionada del catálogo y revalidación de sus APIs"""
+
+    def servicios_de(self, categoria_id):
+        return self.get('servicios_categoria', categoria_id)().json()
+
+    def test_mismos_datos_que_la_bd(self):
+        categoria = self.servicios[0].categoria_id
+        esperado = list(ServicioBase.objects.filter(categoria_id=categoria, activo=True).values(
+            'id', 'nombre', 'precio_base', 'unidad', 'es_parametrizable',
+        ))
+        self.assertEqual(self.servicios_de(categoria), json.loads(json.dumps(esperado, cls=DjangoJSONEncoder)))
+        parametros = self.get('parametros_servicio', self.servicios[0].pk)().json()
+        self.assertEqual([p['nombre'] for p in parametros], ['Parámetro 0', 'Parámetro 1'])
+        self.assertEqual(parametros[1]['opciones_list'], ['1 HP', '2 HP', '3 HP'])
+        self.assertEqual(self.get('servicios_categoria', 0)().json(), [])
+
+    def test_lecturas_sin_consultas(self):
+        self.get('editar', self.cotizacion.pk)()
+        # Solo sesión y usuario: el perfil y el catálogo ya están en caché
+        with self.assertNumQueries(2):
+            self.get('servicios_categoria', self.servicios[0].categoria_id)()
+        with self.assertNumQueries(2):
+            self.get('parametros_servicio', self.servicios[0].pk)()
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.get('editar', self.cotizacion.pk)()
+        self.assertFalse([q for q in consultas.captured_queries if 'cotizaciones_material' in q['sql']
+                          and 'itemmaterial' not in q['sql']])
+        self.assertEqual(respuesta.context['catalogo_version'], catalogo.version())
+        # Los materiales ya no van en el HTML: el navegador los toma del catálogo
+        self.assertNotContains(respuesta, f'value="{self.materiales[0].pk}" data-precio')
+
+    def test_revalidacion(self):
+        categoria = self.servicios[0].categoria_id
+        url = reverse('cotizaciones:servicios_categoria', args=[categoria])
+        respuesta = self.client.get(url)
+        self.assertIn('no-cache', respuesta['Cache-Control'])
+        etag, modificado = respuesta['ETag'], respuesta['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=modificado).status_code, 304)
+
+        servicio = self.servicios[0]
+        servicio.nombre = 'Renombrado'
+        servicio.save()
+        respuesta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        self.assertIn('Renombrado', [s['nombre'] for s in respuesta.json()])
+
+    def test_etag_estable_hasta_un_cambio(self):
+        url = reverse('cotizaciones:catalogo')
+        etag = self.client.get(url)['ETag']
+        # Pasado el TTL del catálogo la versión sigue igual
+        despues = time.time() + settings.CATALOGO_CACHE_TTL + 1
+        with mock.patch('time.time', return_value=despues):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Material.objects.create(codigo='SIN-EFECTO', nombre='Material', precio_unitario=1)
+        self.assertEqual(self.client.get(url)['ETag'], etag)
+
+        CategoriaServicio.objects.create(nombre='Nueva')
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+
+    def test_senales_invalidan(self):
+        categoria = self.servicios[0].categoria_id
+        antes = len(self.servicios_de(categoria))
+        ServicioBase.objects.create(categoria_id=categoria, nombre='Nuevo', descripcion='', precio_base=1)
+        self.assertEqual(len(self.servicios_de(categoria)), antes + 1)
+
+        parametro = ParametroServicio.objects.filter(servicio=self.servicios[0]).first()
+        parametro.delete()
+        parametros = self.get('parametros_servicio', self.servicios[0].pk)().json()
+        self.assertNotIn(parametro.pk, [p['id'] for p in parametros])
+
+        CategoriaServicio.objects.get(pk=categoria).delete()
+        self.assertEqual(self.servicios_de(categoria), [])
+        self.assertNotIn(categoria, [c['id'] for c in catalogo.categorias()])
+
+    def test_catalogo_completo(self):
+        respuesta = self.get('catalogo')()
+        self.assertNotIn('Content-Encoding', respuesta)
+        self.assertIn('Accept-Encoding', respuesta['Vary'])
+        datos = respuesta.json()
+        self.assertEqual(datos['version'], catalogo.version())
+        self.assertEqual(set(datos), {'version', 'categorias', 'servicios', 'parametros'})
+        categoria = str(self.servicios[0].categoria_id)
+        self.assertEqual(datos['servicios'][categoria], self.servicios_de(categoria))
+        self.assertEqual(
+            datos['parametros'][str(self.servicios[0].pk)],
+            self.get('parametros_servicio', self.servicios[0].pk)().json(),
+        )
+
+    def test_catalogo_comprimido(self):
+        url = reverse('cotizaciones:catalogo')
+        respuesta = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(respuesta['Content-Encoding'], 'gzip')
+        comprimido = json.loads(gzip.decompress(respuesta.content))
+        self.assertEqual(comprimido, self.client.get(url).json())
+
+    def test_catalogo_revalidacion(self):
+        url = reverse('cotizaciones:catalogo')
+        respuesta = self.client.get(url)
+        etag = respuesta['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        # El mismo ETag vale para la versión comprimida
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT_ENCODING='gzip').status_code, 304)
+
+        servicio = self.servicios[0]
+        servicio.nombre = 'Renombrado'
+        servicio.save()
+        respuesta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertGreater(respuesta.json()['version'], int(json.loads(etag[2:])))
+        servicios = respuesta.json()['servicios'][str(servicio.categoria_id)]
+        self.assertIn('Renombrado', [s['nombre'] for s in servicios])
+
+    def test_materiales_no_cambian_la_version(self):
+        numero = catalogo.version()
+        self.materiales[0].save()
+        importar_materiales(io.BytesIO('codigo,nombre,precio_unitario\nIMP-1,Importado,100\n'.encode('utf-8')))
+        self.assertEqual(catalogo.version(), numero)
+
+
+class ParametrosTests(CotizacionesBaseTest):
+    """Opciones precalculadas y validación en lote de los valores de parámetros"""
+
+    def setUp(self):
+        super().setUp()
+        servicio = self.servicios[0]
+        crear = partial(ParametroServicio.objects.create, servicio=servicio, requerido=False)
+        self.potencia = crear(nombre='Potencia', tipo='select', opciones=' 1 HP, 2 HP,,3 HP ')
+        self.metros = crear(nombre='Metros', tipo='number')
+        self.bomba = crear(nombre='Con bomba', tipo='boolean')
+        self.nota = crear(nombre='Nota', tipo='text', opciones='a,b')
+
+    def test_opciones_al_guardar(self):
+        self.assertEqual(self.potencia.opciones_lista, ['1 HP', '2 HP', '3 HP'])
+        self.assertEqual(self.nota.opciones_lista, [])
+        self.potencia.opciones = '5 HP'
+        self.potencia.save()
+        self.potencia.refresh_from_db()
+        self.assertEqual(self.potencia.get_opciones_list(), ['5 HP'])
+        self.assertEqual(separar_opciones(None), [])
+
+    def test_opciones_con_update_fields(self):
+        self.potencia.opciones = '5 HP,7 HP'
+        self.potencia.save(update_fields=['opciones'])
+        self.potencia.refresh_from_db()
+        self.assertEqual(self.potencia.opciones_lista, ['5 HP', '7 HP'])
+        self.potencia.tipo = 'text'
+        self.potencia.save(update_fields=('tipo',))
+        self.potencia.refresh_from_db()
+        self.assertEqual(self.potencia.opciones_lista, [])
+
+    def test_api_sin_separar(self):
+        parametros = {p['id']: p for p in catalogo.parametros_de_servicio(self.servicios[0].pk)}
+        self.assertEqual(parametros[self.potencia.pk]['opciones_list'], ['1 HP', '2 HP', '3 HP'])
+        self.assertEqual(parametros[self.metros.pk]['opciones_list'], [])
+
+    def valores(self, *entradas):
+        return [(clave, parametro.pk, valor) for clave, parametro, valor in valores_de_items(entradas)]
+
+    def test_valores_de_items(self):
+        servicio = self.servicios[0].pk
+        with self.assertNumQueries(1):
+            valores = self.valores(
+                (0, servicio, {self.potencia.pk: '2 HP', str(self.metros.pk): 12.5}),
+                (1, servicio, {self.bomba.pk: True, self.nota.pk: 'libre', self.metros.pk: ''}),
+                (2, self.servicios[1].pk, {}),
+            )
+        self.assertEqual(
+            [valor for valor in valores if valor[1] in (self.potencia.pk, self.metros.pk, self.bomba.pk, self.nota.pk)],
+            [(0, self.metros.pk, '12.5'), (0, self.potencia.pk, '2 HP'),
+             (1, self.bomba.pk, 'true'), (1, self.nota.pk, 'libre')],
+        )
+
+    def test_valores_por_defecto(self):
+        self.metros.valor_por_defecto = '10'
+        self.metros.save()
+        servicio = self.servicios[0].pk
+        self.assertIn((0, self.metros.pk, '10'), self.valores((0, servicio, {})))
+        self.assertIn((0, self.metros.pk, '10'), self.valores((0, servicio, {self.metros.pk: ''})))
+        self.assertIn((0, self.metros.pk, '25'), self.valores((0, servicio, {self.metros.pk: '25'})))
+
+    def test_valor_por_defecto_invalido(self):
+        servicio = self.servicios[0].pk
+        for parametro, defecto, valido in [(self.potencia, '4 HP', '1 HP'), (self.metros, 'diez', '5')]:
+            parametro.valor_por_defecto = defecto
+            parametro.save()
+            with self.subTest(parametro=parametro.nombre), self.assertRaises(ParametroInvalido) as error:
+                self.valores((3, servicio, {}))
+            self.assertEqual(error.exception.clave, 3)
+            self.assertIn('valor por defecto', error.exception.mensaje)
+            # Un valor enviado reemplaza al defecto inválido
+            self.assertIn((3, parametro.pk, valido), self.valores((3, servicio, {parametro.pk: valido})))
+            parametro.valor_por_defecto = None
+            parametro.save()
+
+    def test_parametro_requerido(self):
+        self.potencia.requerido = True
+        self.potencia.save()
+        servicio = self.servicios[0].pk
+        for enviados in ({}, {self.potencia.pk: ''}):
+            with self.subTest(enviados=enviados), self.assertRaises(ParametroInvalido) as error:
+                self.valores((0, servicio, {self.metros.pk: '3'}), (4, servicio, enviados))
+            self.assertEqual(error.exception.clave, 0)
+            self.assertEqual(error.exception.mensaje, 'Potencia: es requerido')
+        # Un valor por defecto válido cumple el requisito
+        self.potencia.valor_por_defecto = '2 HP'
+        self.potencia.save()
+        self.assertIn((4, self.potencia.pk, '2 HP'), self.valores((4, servicio, {})))
+
+    def test_valores_invalidos(self):
+        ajeno = self.servicios[1].parametros.first().pk
+        for parametro_id, valor in [
+            (self.potencia.pk, '4 HP'), (self.metros.pk, 'diez'), (self.metros.pk, 'NaN'),
+            (self.bomba.pk, 'si'), (ajeno, 'x'), (0, 'x'), ('abc', 'x'),
+        ]:
+            with self.subTest(parametro=parametro_id, valor=valor), self.assertRaises(ParametroInvalido) as error:
+                valores_de_items([
+                    (0, self.servicios[0].pk, {self.nota.pk: 'ok'}),
+                    (7, self.servicios[0].pk, {parametro_id: valor}),
+                ])
+            self.assertEqual(error.exception.clave, 7)
+
+    def test_agregar_item_rechaza_valor(self):
+        items = self.cotizacion.items_servicio.count()
+        respuesta = self.json('post', 'agregar_item_servicio', self.cotizacion.pk, datos={
+            'servicio_id': self.servicios[0].pk, 'cantidad': 1, 'precio_unitario': 1000,
+            'parametros': {self.potencia.pk: '9 HP'},
+        })
+        self.assertFalse(respuesta.json()['success'])
+        self.assertIn('9 HP', respuesta.json()['error'])
+        self.assertEqual(self.cotizacion.items_servicio.count(), items)
+
+    def test_agregar_item_rechaza_parametro_ajeno(self):
+        respuesta = self.json('post', 'agregar_item_servicio', self.cotizacion.pk, datos={
+            'servicio_id': self.servicios[0].pk, 'cantidad': 1, 'precio_unitario': 1000,
+            'parametros': {self.servicios[1].parametros.first().pk: '1 HP'},
+        })
+        self.assertFalse(respuesta.json()['success'])
+        self.assertIn('no pertenece al servicio', respuesta.json()['error'])
+
+    def test_agregar_item_consultas_constantes(self):
+        # Un servicio con 20 parámetros cuesta lo mismo que uno con 2
+        servicio = crear_catalogo(categorias=1, servicios_por_categoria=1, parametros=20)[0]
+        parametros = {p.pk: (p.opciones_lista or ['valor'])[0] for p in servicio.parametros.all()}
+        respuesta = self.assertPresupuesto(15, lambda: self.json(
+            'post', 'agregar_item_servicio', self.cotizacion.pk,
+            datos={'servicio_id': servicio.pk, 'cantidad': 1, 'precio_unitario': 1000, 'parametros': parametros},
+        ))
+        item = ItemServicio.objects.get(pk=respuesta.json()['item_id'])
+        self.assertEqual(item.parametros.count(), 20)
+
+    def test_operaciones_rechazan_valor(self):
+        respuesta = self.json('post', 'operaciones_items', self.cotizacion.pk, datos={'operaciones': [
+            {'op': 'agregar', 'tipo': 'mano_obra', 'descripcion': 'Extra', 'horas': 1, 'precio_hora': 100},
+            {'op': 'agregar', 'tipo': 'servicio', 'servicio_id': self.servicios[0].pk,
+             'cantidad': 1, 'precio_unitario': 100, 'parametros': {self.metros.pk: 'diez'}},
+        ]})
+        self.assertFalse(respuesta.json()['success'])
+        self.assertIn('Operación 1', respuesta.json()['error'])
+        # La mano de obra de la operación 0 tampoco se crea
+        self.assertFalse(self.cotizacion.items_mano_obra.filter(descripcion='Extra').exists())
+
+    def test_operaciones_guardan_parametros(self):
+        respuesta = self.json('post', 'operaciones_items', self.cotizacion.pk, datos={'operaciones': [
+            {'op': 'agregar', 'tipo': 'servicio', 'servicio_id': self.servicios[0].pk, 'ref': 'a',
+             'cantidad': 1, 'precio_unitario': 100, 'parametros': {self.potencia.pk: '1 HP'}},
+            {'op': 'agregar', 'tipo': 'servicio', 'servicio_id': self.servicios[0].pk, 'ref': 'b',
+             'cantidad': 1, 'precio_unitario': 100, 'parametros': {self.bomba.pk: 'false'}},
+        ]})
+        ids = {creado['ref']: creado['id'] for creado in respuesta.json()['creados']}
+        self.assertEqual(
+            list(ParametroItemServicio.objects.filter(item_servicio_id=ids['a']).values_list('parametro', 'valor')),
+            [(self.potencia.pk, '1 HP')],
+        )
+        self.assertEqual(
+            list(ParametroItemServicio.objects.filter(item_servicio_id=ids['b']).values_list('parametro', 'valor')),
+            [(self.bomba.pk, 'false')],
+        )
+
+
+class NumeroCotizacionTests(TransactionTestCase):
+    """Asignación del número correlativo por año"""
+
+    HILOS = 8
+    POR_HILO = 5
+
+    def setUp(self):
+        self.usuario = crear_empleado('admin')
+        self.cliente = crear_clientes(1)[0]
+        self.tipo_trabajo = TipoTrabajo.objects.create(nombre='Mantención')
+        self.anio = timezone.now().year
+
+    def nueva(self, **kwargs):
+        return Cotizacion.objects.create(
+            cliente=self.cliente, referencia='-', lugar='-',
+            tipo_trabajo=self.tipo_trabajo, creado_por=self.usuario, **kwargs
+        )
+
+    def test_correlativo_del_anio(self):
+        numeros = [self.nueva().numero for _ in range(3)]
+        self.assertEqual(numeros, [f'{self.anio}-0001', f'{self.anio}-0002', f'{self.anio}-0003'])
+        self.assertEqual(ContadorCotizacion.objects.get(anio=self.anio).ultimo, 3)
+
+    def test_continua_desde_numeros_existentes(self):
+        self.nueva(numero=f'{self.anio}-0041')
+        self.assertEqual(self.nueva().numero, f'{self.anio}-0042')
+
+    def test_se_inserta_una_sola_vez(self):
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as consultas:
+                self.nueva()
+            escrituras = [
+                q['sql'].split()[0] for q in consultas.captured_queries
+                if '"cotizaciones_cotizacion"' in q['sql'] and not q['sql'].startswith('SELECT')
+            ]
+            self.assertEqual(escrituras, ['INSERT'])
+
+    def test_creacion_concurrente(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('SQLite en memoria bloquea por tabla sin esperar a las demás conexiones')
+        numeros = []
+        errores = []
+        barrera = threading.Barrier(self.HILOS)
+
+        def crear():
+            try:
+                barrera.wait()
+                for _ in range(self.POR_HILO):
+                    numeros.append(self.nueva().numero)
+            except Exception as e:
+                errores.append(e)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=crear) for _ in range(self.HILOS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        total = self.HILOS * self.POR_HILO
+        self.assertEqual(sorted(numeros), [f'{self.anio}-{n:04d}' for n in range(1, total + 1)])
+        self.assertEqual(ContadorCotizacion.objects.get(anio=self.anio).ultimo, total)
+
+
+class BusquedaTests(CotizacionesBaseTest):
+    """Búsqueda con ranking y tolerancia a errores de tipeo"""
+
+    def setUp(self):
+        super().setUp()
+        self.bomba = Material.objects.create(
+            codigo='BS-750', nombre='Bomba sumergible 1 HP', precio_unitario=150000,
+            descripcion='Bomba para pozo profundo de acero inoxidable',
+        )
+        self.cliente = Cliente.objects.create(
+            nombre='Agrícola Los Aromos', rut='76.543.210-K', email='contacto@aromos.cl'
+        )
+
+    def ids(self, queryset, texto):
+        return [objeto.pk for objeto in busqueda.buscar(queryset, texto)]
+
+    def test_tolera_errores_de_tipeo(self):
+        self.assertEqual(self.ids(Material.objects.all(), 'bomba sumergble')[0], self.bomba.pk)
+        self.assertEqual(self.ids(Cliente.objects.all(), 'agricola aromo')[0], self.cliente.pk)
+
+    def test_rut_y_numero_sin_formato(self):
+        self.assertEqual(self.ids(Cliente.objects.all(), '76543210k'), [self.cliente.pk])
+        cotizacion = crear_cotizacion(self.usuario, self.cliente, self.tipo_trabajo)
+        cotizacion.numero = '2031-0042'
+        cotizacion.save()
+        self.assertEqual(self.ids(Cotizacion.objects.all(), '2031-0042')[0], cotizacion.pk)
+
+    def test_ordena_por_relevancia(self):
+        # El código pesa más que la descripción
+        otro = Material.objects.create(
+            codigo='X-1', nombre='Filtro', precio_unitario=1000, descripcion='Repuesto de BS-750'
+        )
+        self.assertEqual(self.ids(Material.objects.all(), 'BS-750'), [self.bomba.pk, otro.pk])
+
+    def test_cambios_del_cliente_reindexan_sus_cotizaciones(self):
+        cotizacion = crear_cotizacion(self.usuario, self.cliente, self.tipo_trabajo)
+        self.cliente.nombre = 'Forestal Pangal'
+        self.cliente.save()
+        self.assertEqual(self.ids(Cotizacion.objects.all(), 'pangal'), [cotizacion.pk])
+        self.assertEqual(self.ids(Cotizacion.objects.all(), 'aromos'), [])
+
+    def test_eliminar_quita_los_tokens(self):
+        self.bomba.delete()
+        self.assertFalse(TokenBusqueda.objects.filter(indice='material', objeto_id=self.bomba.pk).exists())
+
+    def test_migracion_indexa_igual_que_las_senales(self):
+        crear_cotizacion(self.usuario, self.cliente, self.tipo_trabajo)
+        campos = ('indice', 'objeto_id', 'token', 'peso')
+        esperados = set(TokenBusqueda.objects.values_list(*campos))
+        TokenBusqueda.objects.all().delete()
+        migracion = import_module('cotizaciones.migrations.0003_busqueda')
+        migracion.indexar_existentes(django_apps, SimpleNamespace(connection=connection))
+        self.assertEqual(set(TokenBusqueda.objects.values_list(*campos)), esperados)
+
+    def test_importacion_indexa(self):
+        archivo = SimpleUploadedFile('m.csv', b'codigo,nombre,precio_unitario\nVAL-9,Valvula de retencion,5000\n')
+        self.client.post(reverse('cotizaciones:importar_materiales_csv'), {'archivo': archivo})
+        self.assertEqual(len(self.ids(Material.objects.all(), 'válvula retención')), 1)
+
+    def test_vistas_usan_la_busqueda(self):
+        respuesta = self.client.get(reverse('cotizaciones:gestionar_materiales'), {'busqueda': 'sumergble'})
+        self.assertEqual(respuesta.context['materiales'][0], self.bomba)
+        respuesta = self.client.get(reverse('cotizaciones:gestionar_clientes'), {'busqueda': 'aromos'})
+        self.assertEqual(list(respuesta.context['clientes']), [self.cliente])
+
+    def test_paginar_resultados_por_relevancia(self):
+        url = reverse('cotizaciones:gestionar_materiales') + '?busqueda=material+1-1'
+        vistos = []
+        while url:
+            pagina = self.client.get(url).context['materiales']
+            vistos += [m.pk for m in pagina]
+            url = pagina.url_siguiente and reverse('cotizaciones:gestionar_materiales') + pagina.url_siguiente
+        esperados = busqueda.buscar(Material.objects.all(), 'material 1-1')
+        self.assertGreater(len(vistos), 20)
+        self.assertEqual(sorted(vistos), sorted(m.pk for m in esperados))
+
+    def test_busqueda_global(self):
+        respuesta = self.client.get(reverse('cotizaciones:buscar'), {'q': 'aromos', 'formato': 'json'})
+        datos = respuesta.json()
+        self.assertEqual([c['id'] for c in datos['clientes']], [self.cliente.pk])
+        respuesta = self.client.get(reverse('cotizaciones:buscar'), {'q': 'bomba'})
+        self.assertContains(respuesta, 'BS-750')
+
+    def test_presupuesto_busqueda_global(self):
+        self.assertPresupuesto(6, self.get('buscar', q='Cliente material'))
+
+
+class SugerirMaterialesTests(CotizacionesBaseTest):
+    """Autocompletado de materiales por prefijo"""
+
+    def setUp(self):
+        super().setUp()
+        crear = Material.objects.create
+        self.codigo = crear(codigo='CAB', nombre='Abrazadera', precio_unitario=10, categoria='Fijaciones')
+        self.prefijo_codigo = crear(codigo='CAB-10', nombre='Zócalo', precio_unitario=10)
+        self.nombre = crear(codigo='X-1', nombre='Cable eléctrico 2 mm', precio_unitario=10)
+        self.categoria = crear(codigo='X-2', nombre='Terminal', precio_unitario=10, categoria='Cables')
+        self.inactivo = crear(codigo='CAB-99', nombre='Cable viejo', precio_unitario=10, activo=False)
+
+    def ids(self, texto, **kwargs):
+        return [m['id'] for m in busqueda.sugerir_materiales(texto, **kwargs)]
+
+    def test_orden_por_relevancia(self):
+        # Código exacto, prefijo del código, prefijo del nombre, prefijo de la categoría
+        self.assertEqual(
+            self.ids('cab'), [self.codigo.pk, self.prefijo_codigo.pk, self.nombre.pk, self.categoria.pk],
+        )
+
+    def test_solo_prefijos(self):
+        self.assertEqual(self.ids('eléctrico'), [])
+        self.assertEqual(self.ids('CABLE'), [self.nombre.pk, self.categoria.pk])
+        self.assertEqual(self.ids('ca%'), [])
+        self.assertEqual(self.ids('   '), [])
+
+    def test_limite(self):
+        crear_materiales(30)
+        self.assertEqual(len(self.ids('mat-')), busqueda.LIMITE_SUGERENCIAS)
+        self.assertEqual(len(self.ids('mat-', limite=3)), 3)
+
+    def test_vista(self):
+        datos = self.get('sugerir_materiales', q='cab-1')().json()
+        self.assertEqual(datos, [{
+            'id': self.prefijo_codigo.pk, 'codigo': 'CAB-10', 'nombre': 'Zócalo',
+            'precio_unitario': '10.00', 'unidad': 'UND', 'categoria': None,
+        }])
+
+    def test_presupuesto(self):
+        self.assertPresupuesto(4, self.get('sugerir_materiales', q='material'))
@@ -0,0 +1,57 @@
+# cotizaciones/trabajos.py
+"""Trabajos en segundo plano de cotizaciones (ver trabajos.registro)"""
+import tempfile
+
+from django.conf import settings
+
+from trabajos.registro import almacenamiento, guardar_salida, registrar
+
+from .carga import cotizaciones_completas
+from .documentos import renderizar_html
+from .exportacion_pdf import filtrar_cotizaciones, generar_pdfs, zip_por_partes
+from .importacion import importar_materiales
+from .pdf import PdfNoDisponible, obtener_pdf
+
+
+@registrar('importar_materiales')
+def importar_materiales_trabajo(trabajo):
+    parametros = trabajo.parametros
+    ruta = parametros['archivo']
+    archivos = almacenamiento()
+    try:
+        with archivos.open(ruta, 'rb') as archivo:
+            return importar_materiales(
+                archivo,
+                formato=parametros.get('formato', 'csv'),
+                actualizar_existentes=parametros.get('actualizar_existentes', False),
+                progreso=trabajo.reportar_progreso,
+            )
+    finally:
+        archivos.delete(ruta)
+
+
+@registrar('documento_cotizacion')
+def documento_cotizacion_trabajo(trabajo):
+    cotizacion = cotizaciones_completas().get(pk=trabajo.parametros['cotizacion_id'])
+    try:
+        guardar_salida(trabajo, f'cotizacion_{cotizacion.numero}.pdf', obtener_pdf(cotizacion))
+    except PdfNoDisponible:
+        guardar_salida(trabajo, f'cotizacion_{cotizacion.numero}.html', renderizar_html(cotizacion))
+    return {'cotizacion_id': cotizacion.pk, 'numero': cotizacion.numero}
+
+
+@registrar('exportar_pdfs')
+def exportar_pdfs_trabajo(trabajo):
+    cotizaciones = filtrar_cotizaciones(**trabajo.parametros)
+    archivos = generar_pdfs(
+        cotizaciones,
+        procesos=settings.EXPORTACION_PDF_PROCESOS,
+        progreso=trabajo.reportar_progreso,
+    )
+    # El ZIP se escribe en un temporal para no tenerlo completo en memoria
+    with tempfile.TemporaryFile() as salida:
+        for parte in zip_por_partes(archivos):
+            salida.write(parte)
+        salida.seek(0)
+        guardar_salida(trabajo, 'cotizaciones.zip', salida)
+    return {'cotizaciones': trabajo.progreso}
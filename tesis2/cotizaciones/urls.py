@@ -7,6 +7,7 @@ urlpatterns = [
     # Dashboard y listados principales
     path('', views.dashboard_cotizaciones, name='dashboard'),
     path('lista/', views.lista_cotizaciones, name='lista'),
+    path('buscar/', views.buscar_global, name='buscar'),
     
     # CRUD de cotizaciones
     path('crear/', views.crear_cotizacion, name='crear'),
@@ -14,11 +15,15 @@ urlpatterns = [
     path('<int:pk>/editar/', views.editar_cotizacion, name='editar'),
     path('<int:pk>/pdf/', views.generar_pdf_cotizacion, name='generar_pdf'),
     path('<int:pk>/estado/', views.cambiar_estado_cotizacion, name='cambiar_estado'),
+    path('exportar-pdf/', views.exportar_pdfs, name='exportar_pdfs'),
+    path('exportar-csv/', views.exportar_cotizaciones_csv, name='exportar_csv'),
+    path('analitica/categorias/', views.analitica_categorias, name='analitica_categorias'),
     
     # Gestión de items de cotización (AJAX)
     path('<int:cotizacion_pk>/item-servicio/', views.agregar_item_servicio, name='agregar_item_servicio'),
     path('<int:cotizacion_pk>/item-material/', views.agregar_item_material, name='agregar_item_material'),
     path('<int:cotizacion_pk>/item-mano-obra/', views.agregar_item_mano_obra, name='agregar_item_mano_obra'),
+    path('<int:cotizacion_pk>/items/', views.operaciones_items, name='operaciones_items'),
     path('<int:cotizacion_pk>/gastos-traslado/', views.actualizar_gastos_traslado, name='actualizar_gastos_traslado'),
     
     # Eliminar items (AJAX)
@@ -27,16 +32,21 @@ urlpatterns = [
     path('<int:cotizacion_pk>/item-mano-obra/<int:item_pk>/eliminar/', views.eliminar_item_mano_obra, name='eliminar_item_mano_obra'),
     
     # APIs para formularios dinámicos
+    path('api/catalogo/', views.catalogo_completo, name='catalogo'),
     path('api/categoria/<int:categoria_id>/servicios/', views.obtener_servicios_categoria, name='servicios_categoria'),
     path('api/servicio/<int:servicio_id>/parametros/', views.obtener_parametros_servicio, name='parametros_servicio'),
+    path('api/materiales/sugerir/', views.sugerir_materiales_api, name='sugerir_materiales'),
     
     # Plantillas
     path('<int:cotizacion_pk>/plantilla/<int:plantilla_pk>/aplicar/', views.aplicar_plantilla, name='aplicar_plantilla'),
+    path('plantillas/aplicar/', views.aplicar_plantillas_lote, name='aplicar_plantillas_lote'),
     
     # Gestión de catálogos
     path('clientes/', views.gestionar_clientes, name='gestionar_clientes'),
     path('servicios/', views.gestionar_servicios, name='gestionar_servicios'),
     path('materiales/', views.gestionar_materiales, name='gestionar_materiales'),
+    path('clientes/exportar-csv/', views.exportar_clientes_csv, name='exportar_clientes_csv'),
+    path('materiales/exportar-csv/', views.exportar_materiales_csv, name='exportar_materiales_csv'),
 
     #Crud Clientes
     path('cliente/crear/', views.crear_cliente, name='crear_cliente'),
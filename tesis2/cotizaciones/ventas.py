@@ -0,0 +1,207 @@
+# cotizaciones/ventas.py
+"""
+Resumen diario de ventas (VentaDiaria): una fila por día, cliente, tipo de
+trabajo y estado con la cantidad de cotizaciones y la suma de sus valores.
+
+Las señales lo mantienen al día aplicando la diferencia de cada cotización
+que se crea, cambia o elimina. La clave y los valores con que la cotización
+cuenta en el resumen se leen de la BD en pre_save y pre_delete, bloqueando la
+fila dentro de la transacción del save o delete, así que dos instancias de la
+misma cotización cargadas a la vez no descuadran el resumen. reconstruir() lo
+calcula de nuevo desde Cotizacion (manage.py reconstruir_ventas), por ejemplo
+después de un update() masivo, que no envía señales. Los cambios en lote que
+se guardan sin señales (bulk_update) se aplican con actualizar_lote().
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .fechas import rango_dias
+from .models import Cotizacion, VentaDiaria
+
+CAMPOS_VALOR = ('valor_neto', 'valor_iva', 'valor_total')
+
+# Campos de Cotizacion cuyo cambio mueve la cotización en el resumen
+CAMPOS_VENTA = {'fecha_creacion', 'cliente', 'tipo_trabajo', 'estado', *CAMPOS_VALOR}
+_ATRIBUTOS = ('fecha_creacion', 'cliente_id', 'tipo_trabajo_id', 'estado', *CAMPOS_VALOR)
+
+
+def _registro(valores):
+    clave = (
+        timezone.localdate(valores['fecha_creacion']), valores['cliente_id'],
+        valores['tipo_trabajo_id'], valores['estado'],
+    )
+    return clave, tuple(valores[campo] for campo in CAMPOS_VALOR)
+
+
+def registro(cotizacion):
+    """(clave, valores) con que la cotización cuenta en el resumen"""
+    return _registro({atributo: getattr(cotizacion, atributo) for atributo in _ATRIBUTOS})
+
+
+def leer_anterior(cotizacion):
+    """
+    Lee de la BD el registro con que la cotización cuenta ahora en el resumen
+    y bloquea la fila hasta el fin de la transacción, que debe ser la del
+    save o delete: otro save de la misma cotización espera y lee el valor ya
+    actualizado.
+    """
+    fila = Cotizacion.objects.select_for_update().filter(pk=cotizacion.pk).values(*_ATRIBUTOS).first()
+    cotizacion._venta = None if fila is None else _registro(fila)
+
+
+def actualizar(cotizacion, creada=False):
+    """Mueve la cotización en el resumen desde su registro anterior al actual"""
+    anterior = None if creada else getattr(cotizacion, '_venta', None)
+    actual = registro(cotizacion)
+    if anterior == actual:
+        return
+    if anterior is None:
+        _sumar(*actual)
+    elif anterior[0] == actual[0]:
+        _aplicar(actual[0], 0, [nuevo - viejo for nuevo, viejo in zip(actual[1], anterior[1])])
+    else:
+        _restar(*anterior)
+        _sumar(*actual)
+    cotizacion._venta = actual
+
+
+def actualizar_lote(cambios):
+    """
+    Aplica los cambios (anterior, actual) de varias cotizaciones guardadas
+    sin señales. Las diferencias de las que conservan su clave se suman por
+    clave y se escriben con una lectura y un solo UPDATE; las que cambian de
+    clave se mueven una por una.
+    """
+    diferencias = {}
+    for anterior, actual in cambios:
+        if anterior == actual:
+            continue
+        if anterior[0] != actual[0]:
+            _restar(*anterior)
+            _sumar(*actual)
+            continue
+        suma = diferencias.setdefault(actual[0], [0] * len(CAMPOS_VALOR))
+        for i, (nuevo, viejo) in enumerate(zip(actual[1], anterior[1])):
+            suma[i] += nuevo - viejo
+    if not diferencias:
+        return
+
+    claves = Q()
+    for clave in diferencias:
+        claves |= Q(**_filtro(clave))
+    # Bloqueadas hasta el commit: los UPDATE de otras transacciones esperan
+    filas = list(VentaDiaria.objects.select_for_update().filter(claves).order_by('pk'))
+    for fila in filas:
+        valores = diferencias[(fila.fecha, fila.cliente_id, fila.tipo_trabajo_id, fila.estado)]
+        for campo, valor in zip(CAMPOS_VALOR, valores):
+            setattr(fila, campo, getattr(fila, campo) + valor)
+    # Como en actualizar(), una clave sin fila no se crea (reconstruir la corrige)
+    VentaDiaria.objects.bulk_update(filas, CAMPOS_VALOR)
+
+
+def quitar(cotizacion):
+    anterior = getattr(cotizacion, '_venta', None)
+    if anterior is not None:
+        _restar(*anterior)
+        cotizacion._venta = None
+
+
+def _filtro(clave):
+    fecha, cliente_id, tipo_trabajo_id, estado = clave
+    return {'fecha': fecha, 'cliente_id': cliente_id, 'tipo_trabajo_id': tipo_trabajo_id, 'estado': estado}
+
+
+def _aplicar(clave, cotizaciones, valores):
+    """Suma las diferencias a la fila de la clave con un UPDATE; retorna si la fila existía"""
+    cambios = {campo: F(campo) + valor for campo, valor in zip(CAMPOS_VALOR, valores)}
+    return VentaDiaria.objects.filter(**_filtro(clave)).update(
+        cotizaciones=F('cotizaciones') + cotizaciones, **cambios
+    )
+
+
+def _sumar(clave, valores):
+    while True:
+        if _aplicar(clave, 1, valores):
+            return
+        try:
+            # Primera cotización del grupo; si otra transacción crea la fila
+            # antes, se reintenta el UPDATE
+            with transaction.atomic():
+                VentaDiaria.objects.create(cotizaciones=1, **dict(zip(CAMPOS_VALOR, valores)), **_filtro(clave))
+            return
+        except IntegrityError:
+            continue
+
+
+def _restar(clave, valores):
+    # Nunca crea filas: al eliminar un cliente o tipo de trabajo sus filas se
+    # borran en cascada antes que las cotizaciones
+    _aplicar(clave, -1, [-valor for valor in valores])
+
+
+def reconstruir(desde=None, hasta=None, lote=1000):
+    """Recalcula el resumen entre dos fechas (inclusive; None = sin límite); retorna las filas creadas"""
+    inicio, fin = rango_dias(desde, hasta)
+    cotizaciones = Cotizacion.objects.order_by()
+    resumen = VentaDiaria.objects.all()
+    if inicio:
+        cotizaciones = cotizaciones.filter(fecha_creacion__gte=inicio)
+        resumen = resumen.filter(fecha__gte=desde)
+    if fin:
+        cotizaciones = cotizaciones.filter(fecha_creacion__lt=fin)
+        resumen = resumen.filter(fecha__lte=hasta)
+
+    grupos = (
+        cotizaciones
+        .annotate(dia=TruncDate('fecha_creacion'))
+        .values('dia', 'cliente_id', 'tipo_trabajo_id', 'estado')
+        .annotate(cantidad=Count('id'), neto=Sum('valor_neto'), iva=Sum('valor_iva'), total=Sum('valor_total'))
+    )
+    filas = 0
+    with transaction.atomic():
+        resumen.delete()
+        nuevas = []
+        for grupo in grupos.iterator(chunk_size=lote):
+            nuevas.append(VentaDiaria(
+                fecha=grupo['dia'], cliente_id=grupo['cliente_id'], tipo_trabajo_id=grupo['tipo_trabajo_id'],
+                estado=grupo['estado'], cotizaciones=grupo['cantidad'],
+                valor_neto=grupo['neto'], valor_iva=grupo['iva'], valor_total=grupo['total'],
+            ))
+            if len(nuevas) == lote:
+                filas += len(VentaDiaria.objects.bulk_create(nuevas))
+                nuevas = []
+        filas += len(VentaDiaria.objects.bulk_create(nuevas))
+    return filas
+
+
+# Lectura para los reportes
+
+def del_periodo(desde=None, hasta=None):
+    """Filas del resumen entre dos fechas (inclusive)"""
+    resumen = VentaDiaria.objects.all()
+    if desde:
+        resumen = resumen.filter(fecha__gte=desde)
+    if hasta:
+        resumen = resumen.filter(fecha__lte=hasta)
+    return resumen
+
+
+def resumir(resumen, *campos, **expresiones):
+    """
+    Totales (cantidad, neto, iva, total y lo aprobado) agrupados por los
+    campos o expresiones indicados, p. ej. resumir(del_periodo(), 'estado')
+    o resumir(del_periodo(), mes=TruncMonth('fecha')). Sin grupos retorna un
+    solo diccionario con los totales.
+    """
+    aprobada = Q(estado='aprobada')
+    totales = {
+        'cantidad': Sum('cotizaciones'), 'neto': Sum('valor_neto'),
+        'iva': Sum('valor_iva'), 'total': Sum('valor_total'),
+        'aprobadas': Sum('cotizaciones', filter=aprobada), 'aprobado': Sum('valor_total', filter=aprobada),
+    }
+    if not campos and not expresiones:
+        return resumen.aggregate(**totales)
+    grupos = [*campos, *expresiones]
+    return resumen.annotate(**expresiones).values(*grupos).annotate(**totales).order_by(*grupos)
@@ -1,61 +1,69 @@
 # cotizaciones/views.py
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
-from django.views.decorators.http import require_http_methods
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.vary import vary_on_headers
+from django.views.decorators.http import condition, require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.db import transaction
-from django.core.paginator import Paginator
-from django.db.models import Q, Count, Sum
-from django.template.loader import get_template
-from django.utils import timezone
+from django.db.models import Count
 import json
+import re
+from datetime import date
 from decimal import Decimal
+from urllib.parse import quote
 from .models import *
 from .forms import *
+from home.decorators import requiere_gerente_o_superior
+from home.paginacion import paginar
+from trabajos.registro import encolar, guardar_entrada
+from .busqueda import buscar, busqueda_global, sugerir_materiales
+from .carga import cargar_cotizacion, cargar_items
+from .documentos import contexto_documento, renderizar_html
+from .importacion import ArchivoInvalido, importar_materiales
+from .operaciones import aplicar_operaciones, aplicar_plantillas
+from .parametros import valores_de_items
+from .pdf import PdfNoDisponible, obtener_pdf, pdf_disponible
+from .exportacion_pdf import filtrar_cotizaciones, generar_pdfs, zip_por_partes
+from .estadisticas import estadisticas_dashboard
+from . import catalogo, exportacion_csv
+from .analitica import AnaliticaNoDisponible, metricas_csv, metricas_parquet, metricas_por_categoria
+from .fechas import rango_dias
 
 
+re_acepta_gzip = re.compile(r'\bgzip\b')
+
 
 @login_required
 def dashboard_cotizaciones(request):
     """Dashboard principal de cotizaciones"""
-    # Estadísticas generales
-    total_cotizaciones = Cotizacion.objects.count()
-    cotizaciones_mes = Cotizacion.objects.filter(
-        fecha_creacion__month=timezone.now().month,
-        fecha_creacion__year=timezone.now().year
-    ).count()
-    
-    cotizaciones_pendientes = Cotizacion.objects.filter(estado='enviada').count()
-    valor_total_mes = Cotizacion.objects.filter(
-        fecha_creacion__month=timezone.now().month,
-        fecha_creacion__year=timezone.now().year
-    ).aggregate(Sum('valor_total'))['valor_total__sum'] or 0
-    
-    # Últimas cotizaciones
-    ultimas_cotizaciones = Cotizacion.objects.select_related('cliente').order_by('-fecha_creacion')[:5]
-    
-    # Estados de cotizaciones
-    estados_stats = Cotizacion.objects.values('estado').annotate(
-        total=Count('id')
-    ).order_by('-total')
+    # Estadísticas generales: una consulta, en caché por unos segundos
+    context = dict(estadisticas_dashboard())
     
-    context = {
-        'total_cotizaciones': total_cotizaciones,
-        'cotizaciones_mes': cotizaciones_mes,
-        'cotizaciones_pendientes': cotizaciones_pendientes,
-        'valor_total_mes': valor_total_mes,
-        'ultimas_cotizaciones': ultimas_cotizaciones,
-        'estados_stats': estados_stats,
-    }
+    # Últimas cotizaciones (recorre el índice de fecha_creacion)
+    context['ultimas_cotizaciones'] = Cotizacion.objects.select_related('cliente').order_by('-fecha_creacion', 'id')[:5]
     
     return render(request, 'cotizaciones/dashboard.html', context)
 
+def _cotizaciones_filtradas(datos):
+    """Cotizaciones según los filtros busqueda, estado y cliente de la lista"""
+    cotizaciones = Cotizacion.objects.all()
+    if datos.get('busqueda'):
+        cotizaciones = buscar(cotizaciones, datos['busqueda'])
+    if datos.get('estado'):
+        cotizaciones = cotizaciones.filter(estado=datos['estado'])
+    if datos.get('cliente'):
+        cotizaciones = cotizaciones.filter(cliente_id=datos['cliente'])
+    return cotizaciones
+
 @login_required
 def lista_cotizaciones(request):
     """Lista de cotizaciones con filtros"""
-    cotizaciones = Cotizacion.objects.select_related('cliente', 'tipo_trabajo').order_by('-fecha_creacion')
+    cotizaciones = _cotizaciones_filtradas(request.GET).select_related('cliente', 'tipo_trabajo')
+    orden = ['-fecha_creacion', 'id']
     
     # Filtros
     busqueda = request.GET.get('busqueda', '')
@@ -66,26 +74,16 @@ def lista_cotizaciones(request):
     cliente_nombre = None
     
     if busqueda:
-        cotizaciones = cotizaciones.filter(
-            Q(numero__icontains=busqueda) |
-            Q(cliente__nombre__icontains=busqueda) |
-            Q(referencia__icontains=busqueda)
-        )
-    
-    if estado:
-        cotizaciones = cotizaciones.filter(estado=estado)
+        orden = ['-relevancia'] + orden
         
     if cliente_id:
-        cotizaciones = cotizaciones.filter(cliente_id=cliente_id)
         try:
             cliente_nombre = Cliente.objects.get(id=cliente_id).nombre
         except Cliente.DoesNotExist:
             cliente_nombre = None
 
-    # Paginación
-    paginator = Paginator(cotizaciones, 20)
-    page = request.GET.get('page')
-    cotizaciones = paginator.get_page(page)
+    # Paginación por cursor: el historial crece y OFFSET se vuelve lento
+    cotizaciones = paginar(request, cotizaciones, orden, 20, contar='estimado')
     
     # Para los filtros
     clientes = Cliente.objects.filter(activo=True).order_by('nombre')
@@ -103,6 +101,41 @@ def lista_cotizaciones(request):
     
     return render(request, 'cotizaciones/lista.html', context)
 
+@login_required
+def exportar_cotizaciones_csv(request):
+    """Exportar a CSV las cotizaciones de la lista filtrada (?items=1: una fila por item)"""
+    return exportacion_csv.exportar_cotizaciones(
+        _cotizaciones_filtradas(request.GET), items=bool(request.GET.get('items')),
+    )
+
+@login_required
+def buscar_global(request):
+    """Búsqueda en cotizaciones, clientes y materiales a la vez"""
+    texto = request.GET.get('q', '').strip()
+    resultados = busqueda_global(texto) if texto else {'cotizaciones': [], 'clientes': [], 'materiales': []}
+
+    if request.GET.get('formato') == 'json':
+        return JsonResponse({
+            'success': True,
+            'cotizaciones': [
+                {'id': c.id, 'numero': c.numero, 'cliente': c.cliente.nombre, 'referencia': c.referencia,
+                 'url': reverse('cotizaciones:detalle', args=[c.id])}
+                for c in resultados['cotizaciones']
+            ],
+            'clientes': [
+                {'id': c.id, 'nombre': c.nombre, 'rut': c.rut or '', 'email': c.email or '',
+                 'url': reverse('cotizaciones:lista') + f'?cliente={c.id}'}
+                for c in resultados['clientes']
+            ],
+            'materiales': [
+                {'id': m.id, 'codigo': m.codigo, 'nombre': m.nombre,
+                 'url': reverse('cotizaciones:gestionar_materiales') + f'?busqueda={quote(m.codigo)}'}
+                for m in resultados['materiales']
+            ],
+        })
+
+    return render(request, 'cotizaciones/busqueda.html', {'q': texto, **resultados})
+
 @login_required
 def crear_cotizacion(request):
     """Crear nueva cotización"""
@@ -111,9 +144,7 @@ def crear_cotizacion(request):
         if form.is_valid():
             cotizacion = form.save(commit=False)
             cotizacion.creado_por = request.user
-            cotizacion.save()  # Guardar primero para establecer fecha_creacion
-            cotizacion.generar_numero()  # Luego generar número
-            cotizacion.save()  # Guardar nuevamente con el número
+            cotizacion.save()  # Asigna el número y guarda en una sola inserción
             
             messages.success(request, f'Cotización {cotizacion.numero} creada exitosamente.')
             return redirect('cotizaciones:editar', pk=cotizacion.pk)
@@ -123,33 +154,40 @@ def crear_cotizacion(request):
     return render(request, 'cotizaciones/crear.html', {'form': form})
 
 # Vistas para gestión de catálogos
+def _clientes_filtrados(datos):
+    clientes = Cliente.objects.all()
+    if datos.get('busqueda'):
+        clientes = buscar(clientes, datos['busqueda'])
+    return clientes
+
 @login_required
 def gestionar_clientes(request):
     """Gestión de clientes"""
-    clientes = Cliente.objects.all().order_by('nombre')
+    clientes = _clientes_filtrados(request.GET)
+    orden = ['nombre', 'id']
     
     busqueda = request.GET.get('busqueda', '')
     if busqueda:
-        clientes = clientes.filter(
-            Q(nombre__icontains=busqueda) |
-            Q(rut__icontains=busqueda) |
-            Q(email__icontains=busqueda)
-        )
+        orden = ['-relevancia'] + orden
     
-    paginator = Paginator(clientes, 20)
-    page = request.GET.get('page')
-    clientes = paginator.get_page(page)
+    clientes = paginar(request, clientes, orden, 20, contar='estimado')
     
     return render(request, 'cotizaciones/gestionar_clientes.html', {
         'clientes': clientes,
         'busqueda': busqueda
     })
 
+@login_required
+def exportar_clientes_csv(request):
+    """Exportar a CSV los clientes de la lista filtrada"""
+    return exportacion_csv.exportar_clientes(_clientes_filtrados(request.GET))
+
 @login_required
 def gestionar_servicios(request):
     """Gestión de servicios base"""
     servicios = ServicioBase.objects.select_related('categoria').order_by('categoria__nombre', 'nombre')
-    categorias = CategoriaServicio.objects.filter(activo=True)
+    # Cantidad de servicios por categoría en la misma consulta
+    categorias = CategoriaServicio.objects.filter(activo=True).annotate(total_servicios=Count('serviciobase'))
     
     categoria_filtro = request.GET.get('categoria', '')
     if categoria_filtro:
@@ -167,23 +205,25 @@ def gestionar_servicios(request):
         'servicios_activos': servicios_activos,
     })
 
+def _materiales_filtrados(datos):
+    materiales = Material.objects.all()
+    if datos.get('busqueda'):
+        materiales = buscar(materiales, datos['busqueda'])
+    if datos.get('categoria'):
+        materiales = materiales.filter(categoria=datos['categoria'])
+    return materiales
+
 @login_required
 def gestionar_materiales(request):
     """Gestión de materiales"""
-    materiales = Material.objects.all().order_by('categoria', 'nombre')
+    materiales = _materiales_filtrados(request.GET)
+    orden = ['nombre', 'id']
     
     busqueda = request.GET.get('busqueda', '')
     categoria_filtro = request.GET.get('categoria', '')
     
     if busqueda:
-        materiales = materiales.filter(
-            Q(nombre__icontains=busqueda) |
-            Q(codigo__icontains=busqueda) |
-            Q(descripcion__icontains=busqueda)
-        )
-    
-    if categoria_filtro:
-        materiales = materiales.filter(categoria=categoria_filtro)
+        orden = ['-relevancia'] + orden
     
     categorias = Material.objects.values_list('categoria', flat=True).distinct().order_by('categoria')
     categorias = [cat for cat in categorias if cat]  # Filtrar valores vacíos
@@ -192,9 +232,7 @@ def gestionar_materiales(request):
     materiales_activos = materiales.filter(activo=True).count()
     precio_promedio = materiales.aggregate(promedio=models.Avg('precio_unitario'))['promedio'] or 0
     
-    paginator = Paginator(materiales, 20)
-    page = request.GET.get('page')
-    materiales = paginator.get_page(page)
+    materiales = paginar(request, materiales, orden, 20, contar='estimado')
     
     return render(request, 'cotizaciones/gestionar_materiales.html', {
         'materiales': materiales,
@@ -205,6 +243,11 @@ def gestionar_materiales(request):
         'precio_promedio': precio_promedio,
     })
 
+@login_required
+def exportar_materiales_csv(request):
+    """Exportar a CSV los materiales de la lista filtrada (mismo formato que la importación)"""
+    return exportacion_csv.exportar_materiales(_materiales_filtrados(request.GET))
+
 @login_required
 def aplicar_plantilla(request, cotizacion_pk, plantilla_pk):
     """Aplicar plantilla a cotización"""
@@ -212,26 +255,43 @@ def aplicar_plantilla(request, cotizacion_pk, plantilla_pk):
     plantilla = get_object_or_404(PlantillaCotizacion, pk=plantilla_pk)
     
     try:
-        with transaction.atomic():
-            # Agregar servicios de la plantilla
-            for item_plantilla in plantilla.servicios.all():
-                ItemServicio.objects.create(
-                    cotizacion=cotizacion,
-                    servicio=item_plantilla.servicio,
-                    cantidad=item_plantilla.cantidad_default,
-                    precio_unitario=item_plantilla.servicio.precio_base,
-                    orden=item_plantilla.orden
-                )
-            
-            # Recalcular totales
-            cotizacion.calcular_totales()
-            
+        aplicar_plantillas([cotizacion], [plantilla])
         messages.success(request, f'Plantilla "{plantilla.nombre}" aplicada exitosamente.')
         
     except Exception as e:
         messages.error(request, f'Error al aplicar plantilla: {str(e)}')
     
-    return redirect('cotizaciones:editar_cotizacion', pk=cotizacion_pk)
+    return redirect('cotizaciones:editar', pk=cotizacion_pk)
+
+@login_required
+@require_http_methods(["POST"])
+def aplicar_plantillas_lote(request):
+    """Aplicar varias plantillas a varias cotizaciones vía AJAX"""
+    try:
+        data = json.loads(request.body)
+        cotizacion_ids = [int(pk) for pk in data.get('cotizaciones', [])]
+        plantilla_ids = [int(pk) for pk in data.get('plantillas', [])]
+        
+        cotizaciones = list(Cotizacion.objects.filter(pk__in=cotizacion_ids))
+        plantillas = list(PlantillaCotizacion.objects.filter(pk__in=plantilla_ids))
+        
+        if len(cotizaciones) != len(set(cotizacion_ids)):
+            return JsonResponse({'success': False, 'error': 'Cotización no encontrada'})
+        if len(plantillas) != len(set(plantilla_ids)):
+            return JsonResponse({'success': False, 'error': 'Plantilla no encontrada'})
+        
+        items_creados = aplicar_plantillas(cotizaciones, plantillas)
+        
+        return JsonResponse({
+            'success': True,
+            'items_creados': items_creados,
+            'totales': {
+                cotizacion.pk: float(cotizacion.valor_total) for cotizacion in cotizaciones
+            }
+        })
+        
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
 
 @login_required
 def editar_cotizacion(request, pk):
@@ -247,14 +307,16 @@ def editar_cotizacion(request, pk):
     else:
         form = CotizacionForm(instance=cotizacion)
     
-    # Obtener todos los items
-    items_servicio = cotizacion.items_servicio.all().order_by('orden')
+    # Obtener todos los items (servicio, material y parámetros incluidos)
+    cargar_items(cotizacion)
+    items_servicio = cotizacion.items_servicio.all()
     items_material = cotizacion.items_material.all()
     items_mano_obra = cotizacion.items_mano_obra.all()
     
-    # Para agregar nuevos items
-    categorias_servicio = CategoriaServicio.objects.filter(activo=True)
-    materiales = Material.objects.filter(activo=True)
+    # Para agregar nuevos items: los servicios los carga main.js desde el
+    # catálogo guardado en el navegador (solo si cambió la versión) y los
+    # materiales se buscan con el autocompletado
+    categorias_servicio = catalogo.categorias()
     
     context = {
         'cotizacion': cotizacion,
@@ -263,7 +325,7 @@ def editar_cotizacion(request, pk):
         'items_material': items_material,
         'items_mano_obra': items_mano_obra,
         'categorias_servicio': categorias_servicio,
-        'materiales': materiales,
+        'catalogo_version': catalogo.version(),
     }
     
     return render(request, 'cotizaciones/editar.html', context)
@@ -271,21 +333,9 @@ def editar_cotizacion(request, pk):
 @login_required
 def detalle_cotizacion(request, pk):
     """Ver detalle de cotización"""
-    cotizacion = get_object_or_404(Cotizacion, pk=pk)
+    cotizacion = cargar_cotizacion(pk)
     
-    items_servicio = cotizacion.items_servicio.all().order_by('orden')
-    items_material = cotizacion.items_material.all()
-    items_mano_obra = cotizacion.items_mano_obra.all()
-    
-    context = {
-        'cotizacion': cotizacion,
-        'items_servicio': items_servicio,
-        'items_material': items_material,
-        'items_mano_obra': items_mano_obra,
-        'config_empresa': ConfiguracionEmpresa.get_config(),
-    }
-    
-    return render(request, 'cotizaciones/detalle.html', context)
+    return render(request, 'cotizaciones/detalle.html', contexto_documento(cotizacion))
 
 @login_required
 @require_http_methods(["POST"])
@@ -302,6 +352,8 @@ def agregar_item_servicio(request, cotizacion_pk):
         parametros = data.get('parametros', {})
         
         servicio = get_object_or_404(ServicioBase, pk=servicio_id)
+        # Valores enviados y por defecto, validados contra los parámetros del servicio
+        parametros = valores_de_items([(None, servicio.pk, parametros)])
         
         with transaction.atomic():
             # Crear item de servicio
@@ -314,17 +366,14 @@ def agregar_item_servicio(request, cotizacion_pk):
                 orden=cotizacion.items_servicio.count()
             )
             
-            # Agregar parámetros si existen
-            for param_id, valor in parametros.items():
-                if valor:
-                    ParametroItemServicio.objects.create(
-                        item_servicio=item,
-                        parametro_id=param_id,
-                        valor=valor
-                    )
+            # Agregar parámetros en una sola inserción
+            ParametroItemServicio.objects.bulk_create([
+                ParametroItemServicio(item_servicio=item, parametro=parametro, valor=valor)
+                for _, parametro, valor in parametros
+            ])
             
-            # Recalcular totales
-            cotizacion.calcular_totales()
+            # Actualizar totales con el subtotal del nuevo item
+            cotizacion.aplicar_delta_totales(servicios=item.subtotal)
         
         return JsonResponse({
             'success': True,
@@ -360,8 +409,8 @@ def agregar_item_material(request, cotizacion_pk):
                 descripcion_personalizada=descripcion_personalizada
             )
             
-            # Recalcular totales
-            cotizacion.calcular_totales()
+            # Actualizar totales con el subtotal del nuevo item
+            cotizacion.aplicar_delta_totales(materiales=item.subtotal)
         
         return JsonResponse({
             'success': True,
@@ -393,8 +442,8 @@ def agregar_item_mano_obra(request, cotizacion_pk):
                 precio_hora=precio_hora
             )
             
-            # Recalcular totales
-            cotizacion.calcular_totales()
+            # Actualizar totales con el subtotal del nuevo item
+            cotizacion.aplicar_delta_totales(mano_obra=item.subtotal)
         
         return JsonResponse({
             'success': True,
@@ -406,6 +455,34 @@ def agregar_item_mano_obra(request, cotizacion_pk):
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
+@login_required
+@require_http_methods(["POST"])
+def operaciones_items(request, cotizacion_pk):
+    """Aplicar en lote operaciones de items (agregar, actualizar, eliminar, reordenar) vía AJAX"""
+    cotizacion = get_object_or_404(Cotizacion, pk=cotizacion_pk)
+    
+    try:
+        data = json.loads(request.body)
+        creados = aplicar_operaciones(cotizacion, data.get('operaciones', []))
+        
+        for creado in creados:
+            creado['subtotal'] = float(creado['subtotal'])
+        
+        return JsonResponse({
+            'success': True,
+            'creados': creados,
+            'subtotal_servicios': float(cotizacion.subtotal_servicios),
+            'subtotal_materiales': float(cotizacion.subtotal_materiales),
+            'subtotal_mano_obra': float(cotizacion.subtotal_mano_obra),
+            'gastos_traslado': float(cotizacion.gastos_traslado),
+            'valor_neto': float(cotizacion.valor_neto),
+            'valor_iva': float(cotizacion.valor_iva),
+            'valor_total': float(cotizacion.valor_total)
+        })
+        
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
 @login_required
 @require_http_methods(["DELETE"])
 def eliminar_item_servicio(request, cotizacion_pk, item_pk):
@@ -413,8 +490,9 @@ def eliminar_item_servicio(request, cotizacion_pk, item_pk):
     cotizacion = get_object_or_404(Cotizacion, pk=cotizacion_pk)
     item = get_object_or_404(ItemServicio, pk=item_pk, cotizacion=cotizacion)
     
-    item.delete()
-    cotizacion.calcular_totales()
+    with transaction.atomic():
+        item.delete()
+        cotizacion.aplicar_delta_totales(servicios=-item.subtotal)
     
     return JsonResponse({
         'success': True,
@@ -428,8 +506,9 @@ def eliminar_item_material(request, cotizacion_pk, item_pk):
     cotizacion = get_object_or_404(Cotizacion, pk=cotizacion_pk)
     item = get_object_or_404(ItemMaterial, pk=item_pk, cotizacion=cotizacion)
     
-    item.delete()
-    cotizacion.calcular_totales()
+    with transaction.atomic():
+        item.delete()
+        cotizacion.aplicar_delta_totales(materiales=-item.subtotal)
     
     return JsonResponse({
         'success': True,
@@ -443,36 +522,48 @@ def eliminar_item_mano_obra(request, cotizacion_pk, item_pk):
     cotizacion = get_object_or_404(Cotizacion, pk=cotizacion_pk)
     item = get_object_or_404(ItemManoObra, pk=item_pk, cotizacion=cotizacion)
     
-    item.delete()
-    cotizacion.calcular_totales()
+    with transaction.atomic():
+        item.delete()
+        cotizacion.aplicar_delta_totales(mano_obra=-item.subtotal)
     
     return JsonResponse({
         'success': True,
         'valor_total': float(cotizacion.valor_total)
     })
 
+# El navegador guarda las respuestas del catálogo y las revalida con
+# If-None-Match / If-Modified-Since; si la versión no cambió, responde 304
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=catalogo.etag, last_modified_func=catalogo.ultima_modificacion)
+@vary_on_headers('Accept-Encoding')
+def catalogo_completo(request):
+    """Catálogo completo en un JSON versionado, comprimido con gzip si el navegador lo acepta"""
+    _, cuerpo, comprimido = catalogo.snapshot()
+    if re_acepta_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        response = HttpResponse(comprimido, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+        return response
+    return HttpResponse(cuerpo, content_type='application/json')
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=catalogo.etag, last_modified_func=catalogo.ultima_modificacion)
 def obtener_servicios_categoria(request, categoria_id):
     """Obtener servicios de una categoría vía AJAX"""
-    servicios = ServicioBase.objects.filter(
-        categoria_id=categoria_id, 
-        activo=True
-    ).values('id', 'nombre', 'precio_base', 'unidad', 'es_parametrizable')
-    
-    return JsonResponse(list(servicios), safe=False)
+    return JsonResponse(catalogo.servicios_de_categoria(categoria_id), safe=False)
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=catalogo.etag, last_modified_func=catalogo.ultima_modificacion)
 def obtener_parametros_servicio(request, servicio_id):
     """Obtener parámetros de un servicio vía AJAX"""
-    parametros = ParametroServicio.objects.filter(
-        servicio_id=servicio_id
-    ).values('id', 'nombre', 'tipo', 'requerido', 'opciones', 'valor_por_defecto')
-    
-    for param in parametros:
-        if param['tipo'] == 'select' and param['opciones']:
-            param['opciones_list'] = [opt.strip() for opt in param['opciones'].split(',')]
-    
-    return JsonResponse(list(parametros), safe=False)
+    return JsonResponse(catalogo.parametros_de_servicio(servicio_id), safe=False)
+
+@login_required
+def sugerir_materiales_api(request):
+    """Materiales que empiezan con ?q= para el autocompletado del editor"""
+    return JsonResponse(sugerir_materiales(request.GET.get('q', '')), safe=False)
 
 @login_required
 @require_http_methods(["POST"])
@@ -484,8 +575,8 @@ def actualizar_gastos_traslado(request, cotizacion_pk):
         data = json.loads(request.body)
         gastos_traslado = Decimal(str(data.get('gastos_traslado', 0)))
         
-        cotizacion.gastos_traslado = gastos_traslado
-        cotizacion.calcular_totales()
+        with transaction.atomic():
+            cotizacion.aplicar_delta_totales(gastos_traslado=gastos_traslado)
         
         return JsonResponse({
             'success': True,
@@ -500,23 +591,87 @@ def actualizar_gastos_traslado(request, cotizacion_pk):
 @login_required
 def generar_pdf_cotizacion(request, pk):
     """Generar PDF de la cotización"""
-    cotizacion = get_object_or_404(Cotizacion, pk=pk)
+    if request.GET.get('segundo_plano'):
+        cotizacion = get_object_or_404(Cotizacion, pk=pk)
+        trabajo = encolar('documento_cotizacion', {'cotizacion_id': cotizacion.pk}, request.user)
+        return JsonResponse({'success': True, 'trabajo_id': trabajo.pk})
     
-    context = {
-        'cotizacion': cotizacion,
-        'config_empresa': ConfiguracionEmpresa.get_config(),
-        'items_servicio': cotizacion.items_servicio.all().order_by('orden'),
-        'items_material': cotizacion.items_material.all(),
-        'items_mano_obra': cotizacion.items_mano_obra.all(),
+    cotizacion = cargar_cotizacion(pk)
+    
+    # ?formato=html mantiene la versión imprimible desde el navegador
+    if request.GET.get('formato') != 'html':
+        try:
+            response = HttpResponse(obtener_pdf(cotizacion), content_type='application/pdf')
+            response['Content-Disposition'] = f'inline; filename="cotizacion_{cotizacion.numero}.pdf"'
+            return response
+        except PdfNoDisponible:
+            pass
+    
+    # Sin reportlab: el template detalle.html, para imprimir desde el navegador
+    response = HttpResponse(renderizar_html(cotizacion), content_type='text/html')
+    return response
+
+@login_required
+def exportar_pdfs(request):
+    """Descargar un ZIP con los PDF de las cotizaciones filtradas (por defecto, aprobadas)"""
+    filtros = {
+        'estado': request.GET.get('estado', 'aprobada'),
+        'cliente': request.GET.get('cliente') or None,
+        'desde': request.GET.get('desde') or None,
+        'hasta': request.GET.get('hasta') or None,
     }
     
-    # Usar el template detalle.html existente en lugar de pdf_cotizacion.html
-    template = get_template('cotizaciones/detalle.html')
-    html = template.render(context)
+    try:
+        cotizaciones = filtrar_cotizaciones(**filtros)
+        total = cotizaciones.count()
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Filtros inválidos'}, status=400)
+    
+    if not pdf_disponible():
+        return JsonResponse({'success': False, 'error': 'Para generar PDF se requiere el paquete reportlab'})
     
-    response = HttpResponse(html, content_type='text/html')
+    # Exportaciones grandes: el worker arma el ZIP y reporta el progreso
+    if request.GET.get('segundo_plano'):
+        trabajo = encolar('exportar_pdfs', filtros, request.user)
+        return JsonResponse({'success': True, 'trabajo_id': trabajo.pk, 'total': total})
+    
+    # El ZIP se envía a medida que cada PDF queda listo. Se genera en el
+    # proceso del request: un pool por request multiplicaría los procesos del
+    # servidor; el pool lo usan el worker (segundo_plano) y el comando
+    archivos = generar_pdfs(cotizaciones)
+    response = StreamingHttpResponse(zip_por_partes(archivos), content_type='application/zip')
+    response['Content-Disposition'] = 'attachment; filename="cotizaciones.zip"'
+    response['X-Total-Cotizaciones'] = str(total)
     return response
 
+@login_required
+@requiere_gerente_o_superior
+def analitica_categorias(request):
+    """Métricas por categoría de servicio y mes en JSON, CSV o Parquet (?formato=)"""
+    formato = request.GET.get('formato', 'json')
+    if formato not in ('json', 'csv', 'parquet'):
+        return JsonResponse({'success': False, 'error': 'Formato inválido'}, status=400)
+    try:
+        desde = date.fromisoformat(request.GET['desde']) if request.GET.get('desde') else None
+        hasta = date.fromisoformat(request.GET['hasta']) if request.GET.get('hasta') else None
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Filtros inválidos'}, status=400)
+    
+    try:
+        metricas = metricas_por_categoria(*rango_dias(desde, hasta))
+        if formato == 'parquet':
+            response = HttpResponse(metricas_parquet(metricas), content_type='application/vnd.apache.parquet')
+            response['Content-Disposition'] = 'attachment; filename="analitica_categorias.parquet"'
+            return response
+    except AnaliticaNoDisponible as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+    
+    if formato == 'csv':
+        response = HttpResponse(metricas_csv(metricas), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="analitica_categorias.csv"'
+        return response
+    return JsonResponse({'success': True, 'metricas': metricas})
+
 @login_required
 @require_http_methods(["POST"])
 def cambiar_estado_cotizacion(request, pk):
@@ -529,7 +684,7 @@ def cambiar_estado_cotizacion(request, pk):
         
         if nuevo_estado in dict(Cotizacion.ESTADO_CHOICES):
             cotizacion.estado = nuevo_estado
-            cotizacion.save()
+            cotizacion.save(update_fields=['estado'])
             
             messages.success(request, f'Estado de la cotización actualizado a {cotizacion.get_estado_display()}')
             
@@ -909,84 +1064,45 @@ def validar_codigo_material(request):
 @login_required
 @require_http_methods(["POST"])
 def importar_materiales_csv(request):
-    """Importar materiales desde archivo CSV"""
+    """Importar materiales desde archivo CSV o XLSX"""
     try:
         if 'archivo' not in request.FILES:
             return JsonResponse({'success': False, 'error': 'No se encontró archivo'})
         
         archivo = request.FILES['archivo']
         actualizar_existentes = request.POST.get('actualizar_existentes') == 'true'
+        formato = 'xlsx' if archivo.name.lower().endswith('.xlsx') else 'csv'
+        
+        # Archivos grandes: guardar y dejar la importación al worker
+        if request.POST.get('segundo_plano') == 'true':
+            trabajo = encolar('importar_materiales', {
+                'archivo': guardar_entrada(archivo, archivo.name),
+                'formato': formato,
+                'actualizar_existentes': actualizar_existentes,
+            }, request.user)
+            return JsonResponse({'success': True, 'trabajo_id': trabajo.pk})
+        
+        try:
+            resumen = importar_materiales(
+                archivo.file, formato=formato, actualizar_existentes=actualizar_existentes
+            )
+        except ArchivoInvalido as e:
+            return JsonResponse({'success': False, 'error': str(e)})
         
-        # Leer archivo CSV
-        contenido = archivo.read().decode('utf-8')
-        lineas = contenido.strip().split('\n')
-        
-        if len(lineas) < 2:
-            return JsonResponse({'success': False, 'error': 'Archivo CSV vacío o sin datos'})
-        
-        # Procesar header
-        headers = [h.strip().lower() for h in lineas[0].split(',')]
-        required_fields = ['codigo', 'nombre', 'precio_unitario']
-        
-        for field in required_fields:
-            if field not in headers:
-                return JsonResponse({'success': False, 'error': f'Campo requerido faltante: {field}'})
-        
-        materiales_creados = 0
-        materiales_actualizados = 0
-        
-        # Procesar datos
-        for i, linea in enumerate(lineas[1:], 2):
-            try:
-                valores = [v.strip().strip('"') for v in linea.split(',')]
-                if len(valores) != len(headers):
-                    continue
-                
-                data = dict(zip(headers, valores))
-                
-                # Validar datos requeridos
-                if not data.get('codigo') or not data.get('nombre'):
-                    continue
-                
-                material_data = {
-                    'codigo': data['codigo'],
-                    'nombre': data['nombre'],
-                    'categoria': data.get('categoria', ''),
-                    'precio_unitario': float(data['precio_unitario']),
-                    'unidad': data.get('unidad', 'UND'),
-                    'descripcion': data.get('descripcion', ''),
-                    'activo': True
-                }
-                
-                # Verificar si existe
-                material_existente = Material.objects.filter(codigo=data['codigo']).first()
-                
-                if material_existente:
-                    if actualizar_existentes:
-                        for key, value in material_data.items():
-                            setattr(material_existente, key, value)
-                        material_existente.save()
-                        materiales_actualizados += 1
-                else:
-                    Material.objects.create(**material_data)
-                    materiales_creados += 1
-                    
-            except (ValueError, IndexError) as e:
-                continue  # Saltar líneas con errores
-        
-        mensaje = f'Importación completada: {materiales_creados} creados'
-        if materiales_actualizados:
-            mensaje += f', {materiales_actualizados} actualizados'
+        mensaje = f'Importación completada: {resumen["materiales_creados"]} creados'
+        if resumen['materiales_actualizados']:
+            mensaje += f', {resumen["materiales_actualizados"]} actualizados'
+        if resumen['total_errores']:
+            mensaje += f', {resumen["total_errores"]} filas con errores'
         
         return JsonResponse({
             'success': True,
-            'materiales_creados': materiales_creados,
-            'materiales_actualizados': materiales_actualizados,
-            'message': mensaje
+            'message': mensaje,
+            **resumen
         })
         
     except Exception as e:
         return JsonResponse({
             'success': False,
             'error': str(e)
-        })
\ No newline at end of file
+        })
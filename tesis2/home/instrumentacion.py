@@ -0,0 +1,171 @@
+# home/instrumentacion.py
+"""
+Medición por request: cantidad y tiempo de SQL, tiempo de render de
+plantillas y tiempo total. Lo usa InstrumentacionMiddleware; los registros
+se escriben como JSON (una línea por request) en un log rotativo.
+"""
+import contextvars
+import json
+import logging
+import os
+import time
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.template.backends.django import Template as PlantillaDjango
+
+logger = logging.getLogger('tesis2.instrumentacion')
+
+# Medición del request en curso (None fuera de un request instrumentado)
+_medicion_actual = contextvars.ContextVar('medicion_actual', default=None)
+
+# Una consulta que se repite más veces que esto se marca como N+1 probable
+UMBRAL_REPETIDAS = 5
+
+
+class Medicion:
+    """Acumula las métricas de un request"""
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tiempo_sql = 0.0
+        self.tiempo_plantillas = 0.0
+        self.sentencias = Counter()
+        self.sentencias_con_parametros = Counter()
+
+    def registrar_consulta(self, sql, params, segundos):
+        self.consultas += 1
+        self.tiempo_sql += segundos
+        self.sentencias[sql] += 1
+        try:
+            self.sentencias_con_parametros[(sql, repr(params))] += 1
+        except Exception:
+            pass
+
+    def duplicadas(self):
+        """Consultas idénticas (mismo SQL y parámetros) ejecutadas más de una vez"""
+        return sum(n - 1 for n in self.sentencias_con_parametros.values() if n > 1)
+
+    def repetidas(self):
+        """Sentencias con el mismo SQL y distintos parámetros (N+1 probables)"""
+        return [
+            {'sql': sql[:300], 'veces': veces}
+            for sql, veces in self.sentencias.most_common()
+            if veces > UMBRAL_REPETIDAS
+        ]
+
+
+def _registrar_sql(execute, sql, params, many, context):
+    """execute_wrapper: mide cada consulta de la conexión"""
+    medicion = _medicion_actual.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicion.registrar_consulta(sql, params, time.perf_counter() - inicio)
+
+
+# render original del backend; se guarda al instalar la medición
+_render_original = None
+
+
+def _render_medido(self, context=None, request=None):
+    medicion = _medicion_actual.get()
+    if medicion is None:
+        return _render_original(self, context, request)
+    inicio = time.perf_counter()
+    try:
+        return _render_original(self, context, request)
+    finally:
+        medicion.tiempo_plantillas += time.perf_counter() - inicio
+
+
+def instalar_medicion_plantillas():
+    """
+    Django no expone un hook de render fuera de los tests (template_rendered
+    solo se emite con el renderer de test); se envuelve el render del backend
+    (solo la plantilla de nivel superior, los include quedan dentro de esa
+    medición). Lo llama InstrumentacionMiddleware solo si está activo, y se
+    instala una vez por proceso.
+    """
+    global _render_original
+    if _render_original is None:
+        _render_original = PlantillaDjango.render
+        PlantillaDjango.render = _render_medido
+
+
+def iniciar_medicion():
+    medicion = Medicion()
+    token = _medicion_actual.set(medicion)
+    return medicion, token
+
+
+def terminar_medicion(token):
+    _medicion_actual.reset(token)
+
+
+def crear_log(ruta, max_bytes, copias):
+    """Configura el log JSON rotativo (una vez por proceso)"""
+    if ruta and not logger.handlers:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        handler = RotatingFileHandler(ruta, maxBytes=max_bytes, backupCount=copias, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+def registrar(datos):
+    logger.info(json.dumps(datos, ensure_ascii=False, default=str))
+
+
+def leer_registros(ruta, limite=5000):
+    """Lee los últimos registros del log (incluye la copia rotada anterior)"""
+    lineas = []
+    for archivo in (ruta + '.1', ruta):
+        if os.path.exists(archivo):
+            with open(archivo, encoding='utf-8') as f:
+                lineas.extend(f.readlines())
+    registros = []
+    for linea in lineas[-limite:]:
+        try:
+            registros.append(json.loads(linea))
+        except ValueError:
+            continue
+    return registros
+
+
+def resumen_endpoints(registros, limite=50):
+    """Agrupa los registros por endpoint, ordenados por el p95 del tiempo total"""
+    grupos = {}
+    for registro in registros:
+        clave = (registro.get('metodo'), registro.get('endpoint'))
+        grupos.setdefault(clave, []).append(registro)
+
+    resumen = []
+    for (metodo, endpoint), lista in grupos.items():
+        tiempos = sorted(r['total_ms'] for r in lista)
+        n = len(lista)
+        resumen.append({
+            'metodo': metodo,
+            'endpoint': endpoint,
+            'requests': n,
+            'promedio_ms': round(sum(tiempos) / n, 2),
+            'p95_ms': tiempos[min(n - 1, int(n * 0.95))],
+            'max_ms': tiempos[-1],
+            'consultas_promedio': round(sum(r['consultas'] for r in lista) / n, 1),
+            'consultas_max': max(r['consultas'] for r in lista),
+            'sql_ms_promedio': round(sum(r['sql_ms'] for r in lista) / n, 2),
+            'plantillas_ms_promedio': round(sum(r['plantillas_ms'] for r in lista) / n, 2),
+            'duplicadas_max': max(r['duplicadas'] for r in lista),
+            'con_repetidas': sum(1 for r in lista if r.get('repetidas')),
+        })
+    resumen.sort(key=lambda r: r['p95_ms'], reverse=True)
+    return resumen[:limite]
+
+
+def ruta_log():
+    return getattr(settings, 'INSTRUMENTACION_LOG', '')
@@ -1,43 +1,174 @@
+import re
+import time
+
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.contrib.auth import logout
-from .models import PerfilEmpleado
+from . import instrumentacion
+from .perfiles import obtener_perfil
+
+
+def registrar_tiempo(request, nombre, segundos):
+    """Agrega una medición (en segundos) al header Server-Timing del request"""
+    tiempos = getattr(request, '_server_timing', None)
+    if tiempos is not None:
+        tiempos[nombre] = tiempos.get(nombre, 0) + segundos
+
+
+def agregar_server_timing(response, metricas):
+    """Agrega métricas al header Server-Timing sin pisar las existentes"""
+    if response.get('Server-Timing'):
+        metricas = [response['Server-Timing']] + metricas
+    response['Server-Timing'] = ', '.join(metricas)
+
+
+def compilar_rutas_exentas(prefijos, exactas):
+    """Compila las rutas exentas en una sola expresión regular anclada al inicio"""
+    partes = [re.escape(prefijo) for prefijo in prefijos if prefijo]
+    partes += [re.escape(ruta) + r'\Z' for ruta in exactas]
+    if not partes:
+        return None
+    return re.compile('(?:' + '|'.join(partes) + ')')
+
+
+class TiempoMiddleware:
+    """
+    Mide el costo del stack de middleware. Debe ir primero en MIDDLEWARE y
+    TiempoVistaMiddleware al final: la diferencia entre el tiempo total y el
+    de la vista es lo que cuestan los middlewares. Con SERVER_TIMING activo
+    se agrega el header Server-Timing a la respuesta.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.activo = getattr(settings, 'SERVER_TIMING', False)
+
+    def __call__(self, request):
+        if not self.activo:
+            return self.get_response(request)
+
+        request._server_timing = {}
+        inicio = time.perf_counter()
+        response = self.get_response(request)
+        total = time.perf_counter() - inicio
+
+        tiempos = request._server_timing
+        vista = tiempos.pop('vista', None)
+        metricas = [f'total;dur={total * 1000:.2f}']
+        if vista is not None:
+            metricas.append(f'vista;dur={vista * 1000:.2f}')
+            metricas.append(f'middleware;dur={(total - vista) * 1000:.2f}')
+        metricas += [f'{nombre};dur={segundos * 1000:.2f}' for nombre, segundos in tiempos.items()]
+        agregar_server_timing(response, metricas)
+        return response
+
+
+class InstrumentacionMiddleware:
+    """
+    Registra por request la cantidad y el tiempo de las consultas SQL, el
+    tiempo de render de plantillas y el tiempo total, y marca las consultas
+    duplicadas. Se activa con INSTRUMENTACION = True; debe ir justo después
+    de TiempoMiddleware para incluir las consultas de sesión y usuario.
+    """
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTACION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        instrumentacion.instalar_medicion_plantillas()
+        instrumentacion.crear_log(
+            instrumentacion.ruta_log(),
+            getattr(settings, 'INSTRUMENTACION_LOG_BYTES', 10 * 1024 * 1024),
+            getattr(settings, 'INSTRUMENTACION_LOG_COPIAS', 5),
+        )
+
+    def __call__(self, request):
+        medicion, token = instrumentacion.iniciar_medicion()
+        try:
+            with ExitStack() as pila:
+                for conexion in connections.all():
+                    pila.enter_context(conexion.execute_wrapper(instrumentacion._registrar_sql))
+                response = self.get_response(request)
+        finally:
+            instrumentacion.terminar_medicion(token)
+        total = time.perf_counter() - medicion.inicio
+
+        duplicadas = medicion.duplicadas()
+        agregar_server_timing(response, [
+            f'sql;dur={medicion.tiempo_sql * 1000:.2f};desc="{medicion.consultas} consultas, {duplicadas} duplicadas"',
+            f'plantillas;dur={medicion.tiempo_plantillas * 1000:.2f}',
+            f'app;dur={total * 1000:.2f}',
+        ])
+
+        match = request.resolver_match
+        usuario = getattr(request, 'user', None)
+        instrumentacion.registrar({
+            'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'metodo': request.method,
+            'endpoint': match.view_name if match else request.path,
+            'ruta': request.path,
+            'estado': response.status_code,
+            'usuario': usuario.pk if usuario is not None and usuario.is_authenticated else None,
+            'total_ms': round(total * 1000, 2),
+            'consultas': medicion.consultas,
+            'sql_ms': round(medicion.tiempo_sql * 1000, 2),
+            'plantillas_ms': round(medicion.tiempo_plantillas * 1000, 2),
+            'duplicadas': duplicadas,
+            'repetidas': medicion.repetidas(),
+        })
+        return response
+
+
+class TiempoVistaMiddleware:
+    """Mide la resolución de URL y la vista (ver TiempoMiddleware)"""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        inicio = time.perf_counter()
+        response = self.get_response(request)
+        registrar_tiempo(request, 'vista', time.perf_counter() - inicio)
+        return response
+
 
 class PerfilEmpleadoMiddleware:
     """Middleware que verifica el estado del perfil del empleado en cada request"""
     def __init__(self, get_response):
         self.get_response = get_response
+        # URLs que no requieren verificación, compiladas una sola vez
+        self.rutas_exentas = compilar_rutas_exentas(
+            settings.PERFIL_RUTAS_EXENTAS, settings.PERFIL_RUTAS_EXENTAS_EXACTAS
+        )
 
     def __call__(self, request):
-        # URLs que no requieren verificación
-        exempt_urls = [
-            '/login/', 
-            '/logout/', 
-            '/admin/',
-            '/static/',
-            '/media/',
-            '/',  # página principal
-        ]
-        
-        # Si la URL está exenta, continuar
-        if any(request.path.startswith(url) for url in exempt_urls):
+        # Si la URL está exenta, continuar sin resolver sesión ni usuario
+        if self.rutas_exentas and self.rutas_exentas.match(request.path):
             return self.get_response(request)
         
+        inicio = time.perf_counter()
+        respuesta = self.verificar_perfil(request)
+        registrar_tiempo(request, 'perfil', time.perf_counter() - inicio)
+        
+        return respuesta or self.get_response(request)
+
+    def verificar_perfil(self, request):
         # Solo verificar usuarios autenticados
         if request.user.is_authenticated:
-            try:
-                perfil = PerfilEmpleado.objects.get(user=request.user)
-                
-                # Si el perfil está inactivo, cerrar sesión
-                if not perfil.activo:
-                    messages.error(request, 'Tu cuenta ha sido desactivada.')
-                    logout(request)
-                    return redirect('login')
-                    
-            except PerfilEmpleado.DoesNotExist:
+            perfil = obtener_perfil(request)
+            
+            if perfil is None:
                 # Si no tiene perfil de empleado, cerrar sesión
                 messages.error(request, 'Perfil de empleado no encontrado.')
                 logout(request)
-                return redirect('login')
+                return redirect('home:login')
+            
+            # Si el perfil está inactivo, cerrar sesión
+            if not perfil.activo:
+                messages.error(request, 'Tu cuenta ha sido desactivada.')
+                logout(request)
+                return redirect('home:login')
         
-        return self.get_response(request)
\ No newline at end of file
+        return None
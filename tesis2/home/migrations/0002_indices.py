@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='perfilempleado',
+            index=models.Index(fields=['-fecha_creacion', 'id'], name='perfil_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='perfilempleado',
+            index=models.Index(fields=['cargo', '-fecha_creacion', 'id'], name='perfil_cargo_idx'),
+        ),
+    ]
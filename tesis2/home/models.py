@@ -61,6 +61,13 @@ class PerfilEmpleado(models.Model):
         verbose_name = "Perfil de Empleado"
         verbose_name_plural = "Perfiles de Empleados"
         ordering = ['user__first_name', 'user__last_name']
+        indexes = [
+            # Gestión de usuarios por cursor, sin filtro y por cargo. El filtro
+            # por activo no lleva índice propio: descarta pocas filas y se
+            # resuelve recorriendo perfil_fecha_idx
+            models.Index(fields=['-fecha_creacion', 'id'], name='perfil_fecha_idx'),
+            models.Index(fields=['cargo', '-fecha_creacion', 'id'], name='perfil_cargo_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.get_full_name() or self.user.username} - {self.get_cargo_display()}"
@@ -0,0 +1,191 @@
+# home/paginacion.py
+"""
+Paginación por cursor (keyset). En vez de OFFSET, cada página filtra las filas
+posteriores (o anteriores) a la última que se mostró según el orden de la
+lista, así que cualquier página cuesta lo mismo que la primera. El cursor va
+en la URL como ?cursor=... y el total es opcional o estimado.
+"""
+import base64
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Q
+from django.utils.formats import number_format
+
+PARAMETRO = 'cursor'
+
+# Hasta este número de filas el total estimado se cuenta exacto
+TOPE_CONTEO = 1000
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+class _CodificadorCursor(DjangoJSONEncoder):
+    """DjangoJSONEncoder recorta los microsegundos; el cursor necesita el valor exacto"""
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class PaginaCursor:
+    """Una página de resultados; se recorre como una lista"""
+    def __init__(self, object_list, has_next, has_previous, cursor_siguiente, cursor_anterior):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.cursor_siguiente = cursor_siguiente
+        self.cursor_anterior = cursor_anterior
+        self.total = None
+        self.total_tipo = None
+        self.url_primera = self.url_siguiente = self.url_anterior = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, indice):
+        return self.object_list[indice]
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    @property
+    def total_texto(self):
+        """Total para mostrar: exacto, '~N' si se estimó o 'más de N' si se cortó"""
+        if self.total is None:
+            return ''
+        total = number_format(self.total, force_grouping=True)
+        return {'estimado': f'~{total}', 'minimo': f'más de {total}'}.get(self.total_tipo, total)
+
+
+class PaginadorCursor:
+    """
+    orden: campos del ORDER BY ('-fecha_creacion', 'id'). El último debe ser
+    único y ninguno puede ser nulo; pueden ser anotaciones del queryset.
+    contar: None (sin total), 'exacto' o 'estimado'.
+    """
+    def __init__(self, queryset, orden, por_pagina=20, contar=None):
+        self.orden = [(campo.lstrip('-'), campo.startswith('-')) for campo in orden]
+        self.queryset = queryset.order_by(*orden)
+        self.por_pagina = por_pagina
+        self.contar = contar
+
+    def pagina(self, cursor=None):
+        """Página que sigue (o precede) al cursor; un cursor inválido da la primera"""
+        try:
+            direccion, valores = self._decodificar(cursor) if cursor else ('s', None)
+        except CursorInvalido:
+            direccion, valores = 's', None
+
+        queryset = self.queryset
+        if valores is not None:
+            queryset = queryset.filter(self._despues_de(valores, atras=direccion == 'a'))
+        if direccion == 'a':
+            queryset = queryset.reverse()
+
+        # Una fila extra indica si hay más en esa dirección
+        filas = list(queryset[:self.por_pagina + 1])
+        hay_mas = len(filas) > self.por_pagina
+        filas = filas[:self.por_pagina]
+        if direccion == 'a':
+            filas.reverse()
+            has_next, has_previous = valores is not None, hay_mas
+        else:
+            has_next, has_previous = hay_mas, valores is not None
+
+        pagina = PaginaCursor(
+            filas, has_next, has_previous,
+            cursor_siguiente=self._codificar('s', filas[-1]) if has_next and filas else None,
+            cursor_anterior=self._codificar('a', filas[0]) if has_previous and filas else None,
+        )
+        if self.contar:
+            pagina.total, pagina.total_tipo = contar_filas(self.queryset, self.contar)
+        return pagina
+
+    def _despues_de(self, valores, atras=False):
+        """(a, b, c) > (x, y, z) respetando la dirección de cada campo"""
+        condicion = Q()
+        iguales = Q()
+        for (campo, descendente), valor in zip(self.orden, valores):
+            operador = 'lt' if descendente != atras else 'gt'
+            condicion |= iguales & Q(**{f'{campo}__{operador}': valor})
+            iguales &= Q(**{campo: valor})
+        # Cota redundante sobre el primer campo: permite recorrer su índice como rango
+        (campo, descendente), valor = self.orden[0], valores[0]
+        return Q(**{f'{campo}__{"lt" if descendente != atras else "gt"}e': valor}) & condicion
+
+    def _codificar(self, direccion, objeto):
+        valores = [_valor(objeto, campo) for campo, _ in self.orden]
+        datos = json.dumps([direccion, valores], cls=_CodificadorCursor, separators=(',', ':'))
+        return base64.urlsafe_b64encode(datos.encode()).decode().rstrip('=')
+
+    def _decodificar(self, cursor):
+        try:
+            datos = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direccion, valores = json.loads(datos)
+            if direccion not in ('s', 'a') or len(valores) != len(self.orden):
+                raise ValueError
+            return direccion, [
+                self._campo(campo).to_python(valor) for (campo, _), valor in zip(self.orden, valores)
+            ]
+        except Exception as e:
+            raise CursorInvalido(str(e))
+
+    def _campo(self, nombre):
+        if nombre in self.queryset.query.annotations:
+            return self.queryset.query.annotations[nombre].output_field
+        modelo = self.queryset.model
+        *relaciones, nombre = nombre.split('__')
+        for relacion in relaciones:
+            modelo = modelo._meta.get_field(relacion).related_model
+        return modelo._meta.get_field(nombre)
+
+
+def _valor(objeto, campo):
+    for parte in campo.split('__'):
+        objeto = getattr(objeto, parte)
+    return objeto
+
+
+def contar_filas(queryset, modo='exacto'):
+    """
+    Devuelve (total, tipo). 'estimado' cuenta exacto hasta TOPE_CONTEO filas;
+    sobre eso usa la estimación del planificador de PostgreSQL (tipo
+    'estimado') o, en otras bases, informa el tope (tipo 'minimo').
+    """
+    queryset = queryset.order_by()
+    if modo == 'exacto':
+        return queryset.count(), 'exacto'
+    total = queryset[:TOPE_CONTEO + 1].count()
+    if total <= TOPE_CONTEO:
+        return total, 'exacto'
+    if connection.vendor == 'postgresql':
+        plan = json.loads(queryset.explain(format='json'))
+        if isinstance(plan, list):
+            plan = plan[0]
+        return max(int(plan['Plan']['Plan Rows']), total), 'estimado'
+    return TOPE_CONTEO, 'minimo'
+
+
+def paginar(request, queryset, orden, por_pagina=20, contar=None):
+    """Página del request (?cursor=...) con las URLs de navegación, que conservan los demás filtros"""
+    pagina = PaginadorCursor(queryset, orden, por_pagina, contar).pagina(request.GET.get(PARAMETRO))
+
+    parametros = request.GET.copy()
+    parametros.pop(PARAMETRO, None)
+    parametros.pop('page', None)
+    pagina.url_primera = '?' + parametros.urlencode()
+    for atributo, cursor in (('url_siguiente', pagina.cursor_siguiente),
+                             ('url_anterior', pagina.cursor_anterior)):
+        if cursor:
+            parametros[PARAMETRO] = cursor
+            setattr(pagina, atributo, '?' + parametros.urlencode())
+    return pagina
@@ -0,0 +1,46 @@
+# home/perfiles.py
+"""Acceso al PerfilEmpleado del usuario actual, memorizado por request y en caché"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import PerfilEmpleado
+
+# Marca en caché para usuarios autenticados sin perfil de empleado
+_SIN_PERFIL = 'sin-perfil'
+
+
+def _clave(user_id):
+    return f'home:perfil_empleado:{user_id}'
+
+
+def obtener_perfil(request):
+    """
+    Retorna el PerfilEmpleado de request.user o None si no tiene. La primera
+    llamada del request consulta la caché (y la BD si no está); las siguientes
+    (middleware, decoradores, vistas) reutilizan el mismo objeto.
+    """
+    if hasattr(request, '_perfil_empleado'):
+        return request._perfil_empleado
+
+    perfil = None
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        perfil = cache.get(_clave(user.pk))
+        if perfil is None:
+            try:
+                perfil = PerfilEmpleado.objects.get(user=user)
+            except PerfilEmpleado.DoesNotExist:
+                perfil = _SIN_PERFIL
+            cache.set(_clave(user.pk), perfil, settings.PERFIL_CACHE_TTL)
+        if perfil == _SIN_PERFIL:
+            perfil = None
+        else:
+            # Evita una consulta extra al acceder a perfil.user
+            perfil.user = user
+
+    request._perfil_empleado = perfil
+    return perfil
+
+
+def invalidar_perfil(user_id):
+    cache.delete(_clave(user_id))
@@ -0,0 +1,160 @@
+# home/reportes.py
+"""
+Reportes de ventas del panel. Se leen del resumen diario VentaDiaria
+(cotizaciones/ventas.py), así que varios años de reportes agrupan unos miles
+de filas en vez de recorrer todas las cotizaciones.
+"""
+from datetime import date, timedelta
+
+from django.db.models import F
+from django.db.models.functions import ExtractYear, TruncMonth
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.formats import date_format, number_format
+
+from cotizaciones import analitica, ventas
+from cotizaciones.models import Cotizacion, VentaDiaria
+
+MESES_POR_DEFECTO = 12
+TOP_CLIENTES = 10
+
+_ESTADOS = dict(Cotizacion.ESTADO_CHOICES)
+
+
+def periodo(datos, meses=MESES_POR_DEFECTO):
+    """
+    (desde, hasta) de los parámetros desde/hasta (AAAA-MM-DD). Por defecto,
+    los últimos 'meses' meses hasta hoy; una fecha inválida usa el valor por defecto.
+    """
+    hoy = timezone.localdate()
+    inicio = hoy.replace(day=1)
+    for _ in range(meses - 1):
+        inicio = (inicio - timedelta(days=1)).replace(day=1)
+    return _fecha(datos.get('desde'), inicio), _fecha(datos.get('hasta'), hoy)
+
+
+def _fecha(valor, defecto):
+    try:
+        return date.fromisoformat(valor) if valor else defecto
+    except ValueError:
+        return defecto
+
+
+def _monto(valor):
+    return '$' + number_format(valor or 0, decimal_pos=0, force_grouping=True)
+
+
+def _entero(valor):
+    return number_format(valor or 0, force_grouping=True)
+
+
+def _porcentaje(parte, total):
+    return f'{(parte or 0) * 100 / total:.1f}%' if total else '-'
+
+
+def _tabla(titulo, columnas, filas):
+    return {'titulo': titulo, 'columnas': columnas, 'filas': filas}
+
+
+def _kpis(totales):
+    return [
+        ('Cotizaciones', _entero(totales['cantidad'])),
+        ('Valor cotizado', _monto(totales['total'])),
+        ('Valor aprobado', _monto(totales['aprobado'])),
+        ('Tasa de aprobación', _porcentaje(totales['aprobadas'], totales['cantidad'])),
+    ]
+
+
+def _fila_valores(grupo):
+    return [
+        _entero(grupo['cantidad']), _monto(grupo['neto']), _monto(grupo['iva']),
+        _monto(grupo['total']), _monto(grupo['aprobado']),
+    ]
+
+
+_COLUMNAS_VALORES = ['Cotizaciones', 'Neto', 'IVA', 'Total', 'Aprobado']
+
+
+def _por_cliente(resumen, limite=TOP_CLIENTES):
+    grupos = ventas.resumir(resumen, 'cliente_id', nombre=F('cliente__nombre')).order_by('-total')[:limite]
+    return _tabla(
+        f'Principales {limite} clientes', ['Cliente'] + _COLUMNAS_VALORES,
+        [[grupo['nombre']] + _fila_valores(grupo) for grupo in grupos],
+    )
+
+
+def _por_tipo(resumen):
+    grupos = ventas.resumir(resumen, 'tipo_trabajo_id', nombre=F('tipo_trabajo__nombre')).order_by('-total')
+    return _tabla(
+        'Por tipo de trabajo', ['Tipo de trabajo'] + _COLUMNAS_VALORES,
+        [[grupo['nombre']] + _fila_valores(grupo) for grupo in grupos],
+    )
+
+
+def reporte_ventas(desde, hasta):
+    """Ventas del período por mes, cliente y tipo de trabajo"""
+    resumen = ventas.del_periodo(desde, hasta)
+    por_mes = ventas.resumir(resumen, mes=TruncMonth('fecha'))
+    return {
+        'titulo': 'Reporte de ventas',
+        'kpis': _kpis(ventas.resumir(resumen)),
+        'tablas': [
+            _tabla('Por mes', ['Mes'] + _COLUMNAS_VALORES, [
+                [date_format(grupo['mes'], 'F Y').capitalize()] + _fila_valores(grupo) for grupo in por_mes
+            ]),
+            _por_cliente(resumen),
+            _por_tipo(resumen),
+        ],
+    }
+
+
+def reporte_estadisticas():
+    """Cotizaciones por estado y tasa de aprobación por año, de toda la historia"""
+    resumen = VentaDiaria.objects.all()
+    totales = ventas.resumir(resumen)
+    por_estado = ventas.resumir(resumen, 'estado').order_by('-cantidad')
+    por_anio = ventas.resumir(resumen, anio=ExtractYear('fecha'))
+    return {
+        'titulo': 'Estadísticas de cotizaciones',
+        'kpis': _kpis(totales),
+        'tablas': [
+            _tabla('Por estado', ['Estado', 'Cotizaciones', '% del total', 'Valor total'], [
+                [_ESTADOS.get(grupo['estado'], grupo['estado']), _entero(grupo['cantidad']),
+                 _porcentaje(grupo['cantidad'], totales['cantidad']), _monto(grupo['total'])]
+                for grupo in por_estado
+            ]),
+            _tabla('Aprobación por año', ['Año', 'Cotizaciones', 'Aprobadas', 'Tasa', 'Valor aprobado'], [
+                [grupo['anio'], _entero(grupo['cantidad']), _entero(grupo['aprobadas']),
+                 _porcentaje(grupo['aprobadas'], grupo['cantidad']), _monto(grupo['aprobado'])]
+                for grupo in por_anio
+            ]),
+        ],
+    }
+
+
+def reporte_general():
+    """Totales por año, tipo de trabajo y principales clientes de toda la historia"""
+    resumen = VentaDiaria.objects.all()
+    por_anio = ventas.resumir(resumen, anio=ExtractYear('fecha'))
+    return {
+        'titulo': 'Reportes generales',
+        'kpis': _kpis(ventas.resumir(resumen)),
+        'tablas': [
+            _tabla('Por año', ['Año'] + _COLUMNAS_VALORES, [
+                [grupo['anio']] + _fila_valores(grupo) for grupo in por_anio
+            ]),
+            _por_tipo(resumen),
+            _por_cliente(resumen),
+        ],
+    }
+
+
+def descargas_analitica():
+    """Enlaces a la analítica por categoría de servicio, en los formatos disponibles"""
+    if not analitica.analitica_disponible():
+        return []
+    url = reverse('cotizaciones:analitica_categorias')
+    formatos = [('JSON', 'json'), ('CSV', 'csv')]
+    if analitica.parquet_disponible():
+        formatos.append(('Parquet', 'parquet'))
+    return [(f'Analítica por categoría ({nombre})', f'{url}?formato={formato}') for nombre, formato in formatos]
@@ -0,0 +1,16 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import PerfilEmpleado
+from .perfiles import invalidar_perfil
+
+
+@receiver(post_save, sender=PerfilEmpleado)
+@receiver(post_delete, sender=PerfilEmpleado)
+def invalidar_cache_perfil(sender, instance, **kwargs):
+    """Un cambio de cargo o estado debe verse en el siguiente request"""
+    invalidar_perfil(instance.user_id)
+    # Un request que lea el perfil antes del commit guardaría el anterior
+    # en la caché; se borra de nuevo al confirmarse la transacción
+    transaction.on_commit(lambda: invalidar_perfil(instance.user_id))
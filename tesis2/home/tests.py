@@ -1,3 +1,564 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+from datetime import date
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory
+from django.urls import reverse
+
+from trabajos.models import Trabajo
+from trabajos.registro import almacenamiento, ejecutar
+
+from . import exportacion, instrumentacion
+from .middleware import agregar_server_timing, compilar_rutas_exentas
+from .models import PerfilEmpleado
+from .paginacion import PaginadorCursor, contar_filas, paginar
+from .perfiles import obtener_perfil
+
+
+# Fábricas
+
+# Hash precalculado: create_user con contraseña es lento y no se mide aquí
+CLAVE = make_password('clave-de-prueba')
+
+
+def crear_empleado(username, cargo='admin', **kwargs):
+    """Crea un usuario con su perfil de empleado"""
+    user = User.objects.create(
+        username=username,
+        email=f'{username}@example.com',
+        first_name=username.title(),
+        last_name='Prueba',
+        password=CLAVE,
+        is_staff=kwargs.pop('is_staff', cargo == 'admin'),
+    )
+    PerfilEmpleado.objects.create(
+        user=user, cargo=cargo, fecha_ingreso=kwargs.pop('fecha_ingreso', date(2024, 1, 1)), **kwargs
+    )
+    return user
+
+
+def crear_empleados(cantidad, prefijo='empleado'):
+    """Crea empleados en bloque (dos consultas por lote)"""
+    inicio = User.objects.count()
+    usuarios = User.objects.bulk_create([
+        User(
+            username=f'{prefijo}{inicio + i}',
+            email=f'{prefijo}{inicio + i}@example.com',
+            first_name=f'Nombre{i}',
+            last_name=f'Apellido{i}',
+            password=CLAVE,
+        )
+        for i in range(cantidad)
+    ])
+    cargos = [c for c, _ in PerfilEmpleado.CARGO_CHOICES]
+    PerfilEmpleado.objects.bulk_create([
+        PerfilEmpleado(
+            user=usuario,
+            cargo=cargos[i % len(cargos)],
+            fecha_ingreso=date(2024, 1, 1),
+            activo=i % 7 != 0,
+        )
+        for i, usuario in enumerate(usuarios)
+    ])
+    return usuarios
+
+
+def descargar(respuesta):
+    """Lee el contenido de la respuesta, también si es en streaming"""
+    respuesta.contenido = respuesta.getvalue()
+    return respuesta
+
+
+def leer_csv(respuesta):
+    """Filas del CSV descargado, sin el BOM"""
+    texto = descargar(respuesta).contenido.decode('utf-8')
+    return list(csv.reader(io.StringIO(texto.removeprefix('\ufeff'))))
+
+
+class PresupuestoConsultasMixin:
+    """
+    Verifica el número de consultas de una vista. Cada petición se mide dos
+    veces: antes y después de llamar a crecer(), que agrega más datos. La
+    cantidad de consultas debe ser la misma en ambas mediciones (la vista no
+    escala con los datos) y no superar el presupuesto.
+    """
+
+    def crecer(self):
+        raise NotImplementedError
+
+    def medir(self, peticion, preparar=None):
+        if preparar:
+            preparar()
+        # La caché de perfiles se vacía para que cada medición parta igual
+        cache.clear()
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = peticion()
+        return respuesta, consultas
+
+    def assertPresupuesto(self, maximo, peticion, estado=200, preparar=None):
+        respuesta, antes = self.medir(peticion, preparar)
+        self.assertEqual(respuesta.status_code, estado)
+        self.crecer()
+        respuesta, despues = self.medir(peticion, preparar)
+        self.assertEqual(respuesta.status_code, estado)
+
+        detalle = '\n'.join(q['sql'] for q in despues.captured_queries)
+        self.assertLessEqual(
+            len(antes), maximo,
+            f'{len(antes)} consultas, presupuesto {maximo}:\n{detalle}'
+        )
+        self.assertEqual(
+            len(antes), len(despues),
+            f'Las consultas crecen con los datos ({len(antes)} -> {len(despues)}):\n{detalle}'
+        )
+        return respuesta
+
+
+class PresupuestoConsultasHomeTests(PresupuestoConsultasMixin, TestCase):
+    """Presupuesto de consultas de cada URL de home/urls.py"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = crear_empleado('admin', cargo='admin')
+        crear_empleados(200)
+        cls.otro = PerfilEmpleado.objects.exclude(user=cls.admin).first()
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def crecer(self):
+        crear_empleados(200, prefijo='extra')
+
+    def test_index(self):
+        self.assertPresupuesto(0, lambda: self.client.get(reverse('home:index')))
+
+    def test_login(self):
+        self.assertPresupuesto(0, lambda: self.client.get(reverse('home:login')))
+
+    def test_logout(self):
+        # Cada medición vuelve a iniciar sesión (fuera de la medición)
+        self.assertPresupuesto(
+            4, lambda: self.client.get(reverse('home:logout')), estado=302,
+            preparar=lambda: self.client.force_login(self.admin),
+        )
+
+    def test_panel_empleados(self):
+        self.assertPresupuesto(3, lambda: self.client.get(reverse('home:panel_empleados')))
+
+    def test_gestion_usuarios(self):
+        respuesta = self.assertPresupuesto(8, lambda: self.client.get(reverse('home:gestion_usuarios')))
+        self.assertEqual(len(respuesta.context['empleados']), 15)
+
+    def test_gestion_usuarios_filtrado(self):
+        url = reverse('home:gestion_usuarios') + '?q=nombre&cargo=empleado&activo=1'
+        self.assertPresupuesto(8, lambda: self.client.get(url))
+
+    def test_gestion_usuarios_pagina_profunda(self):
+        # El cursor de la página 5 cuesta lo mismo que la primera
+        url = reverse('home:gestion_usuarios')
+        for _ in range(4):
+            url = reverse('home:gestion_usuarios') + self.client.get(url).context['empleados'].url_siguiente
+        self.assertPresupuesto(8, lambda: self.client.get(url))
+
+    def test_export_usuarios_csv(self):
+        # Las consultas del streaming se hacen al leer la respuesta
+        url = reverse('home:export_usuarios_csv')
+        self.assertPresupuesto(4, lambda: descargar(self.client.get(url)))
+
+    def test_export_usuarios_csv_filtrado(self):
+        url = reverse('home:export_usuarios_csv') + '?q=nombre&cargo=empleado&activo=1'
+        self.assertPresupuesto(4, lambda: descargar(self.client.get(url)))
+
+    def test_export_usuarios_csv_segundo_plano(self):
+        url = reverse('home:export_usuarios_csv') + '?segundo_plano=1'
+        self.assertPresupuesto(4, lambda: self.client.get(url))
+
+    def test_crear_usuario_api(self):
+        datos = {'i': 0}
+
+        def peticion():
+            datos['i'] += 1
+            return self.client.post(reverse('home:crear_usuario_api'), {
+                'username': f'nuevo{datos["i"]}', 'email': f'nuevo{datos["i"]}@example.com',
+                'first_name': 'Nuevo', 'last_name': 'Usuario', 'password': 'x',
+                'cargo': 'empleado', 'fecha_ingreso': '2024-05-01', 'activo': 'on',
+            })
+        respuesta = self.assertPresupuesto(10, peticion)
+        self.assertTrue(respuesta.json()['success'])
+
+    def test_obtener_usuario_api(self):
+        url = reverse('home:obtener_usuario_api', args=[self.otro.pk])
+        respuesta = self.assertPresupuesto(5, lambda: self.client.get(url))
+        self.assertTrue(respuesta.json()['success'])
+
+    def test_actualizar_usuario_api(self):
+        url = reverse('home:actualizar_usuario_api', args=[self.otro.pk])
+        datos = {
+            'username': self.otro.user.username, 'email': self.otro.user.email,
+            'first_name': 'Editado', 'last_name': 'Usuario',
+            'cargo': 'supervisor', 'fecha_ingreso': '2024-05-01', 'activo': 'on',
+        }
+        respuesta = self.assertPresupuesto(9, lambda: self.client.post(url, datos))
+        self.assertTrue(respuesta.json()['success'])
+
+    def test_cambiar_estado_usuario_api(self):
+        url = reverse('home:cambiar_estado_usuario_api', args=[self.otro.pk])
+        respuesta = self.assertPresupuesto(6, lambda: self.client.post(
+            url, json.dumps({'activo': False}), content_type='application/json'
+        ))
+        self.assertTrue(respuesta.json()['success'])
+
+    def test_eliminar_usuario_api(self):
+        perfiles = iter(PerfilEmpleado.objects.exclude(user=self.admin).values_list('pk', flat=True)[:2])
+
+        def peticion():
+            return self.client.delete(reverse('home:eliminar_usuario_api', args=[next(perfiles)]))
+        respuesta = self.assertPresupuesto(16, peticion)
+        self.assertTrue(respuesta.json()['success'])
+
+    def test_vistas_pendientes(self):
+        """Las vistas 'Próximamente' no consultan más allá de sesión y perfil"""
+        for nombre in ('configuracion', 'auditoria', 'gestion_servicios', 'mis_tareas', 'gestion_empleados',
+                       'supervision_tareas', 'reportes_equipo', 'asignacion_trabajos', 'mi_perfil',
+                       'registro_tiempo'):
+            with self.subTest(nombre=nombre):
+                self.assertPresupuesto(3, lambda: self.client.get(reverse(f'home:{nombre}')), estado=403)
+
+    def test_reportes(self):
+        # Sesión, usuario y perfil más una consulta por tabla sobre el resumen de ventas
+        for nombre, consultas in (('reportes', 7), ('reportes_ventas', 7), ('estadisticas', 6)):
+            with self.subTest(nombre=nombre):
+                self.assertPresupuesto(consultas, lambda: self.client.get(reverse(f'home:{nombre}')))
+
+    def test_reportes_requieren_cargo(self):
+        # Las cifras de ventas de la empresa no son visibles para un empleado
+        self.client.force_login(crear_empleado('vendedor', cargo='empleado'))
+        for nombre in ('reportes', 'reportes_ventas', 'estadisticas'):
+            with self.subTest(nombre=nombre):
+                respuesta = self.client.get(reverse(f'home:{nombre}'))
+                self.assertEqual(respuesta.status_code, 403)
+                self.assertTemplateUsed(respuesta, 'home/error.html')
+
+    def test_rendimiento(self):
+        self.assertPresupuesto(3, lambda: self.client.get(reverse('home:rendimiento')))
+
+
+class PerfilCacheTests(TestCase):
+    """PerfilEmpleado memorizado por request y en la caché compartida"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = crear_empleado('vendedor', cargo='empleado')
+        self.factory = RequestFactory()
+
+    def peticion(self, user=None):
+        request = self.factory.get('/')
+        request.user = user or self.user
+        return request
+
+    def test_memo_por_request(self):
+        request = self.peticion()
+        with self.assertNumQueries(1):
+            perfil = obtener_perfil(request)
+        with self.assertNumQueries(0):
+            self.assertIs(obtener_perfil(request), perfil)
+            # perfil.user es el mismo usuario del request, sin otra consulta
+            self.assertIs(perfil.user, self.user)
+
+    def test_cache_entre_requests(self):
+        obtener_perfil(self.peticion())
+        with self.assertNumQueries(0):
+            self.assertEqual(obtener_perfil(self.peticion()).cargo, 'empleado')
+
+    def test_usuario_sin_perfil(self):
+        sin_perfil = User.objects.create(username='externo')
+        self.assertIsNone(obtener_perfil(self.peticion(sin_perfil)))
+        with self.assertNumQueries(0):
+            self.assertIsNone(obtener_perfil(self.peticion(sin_perfil)))
+
+    def test_guardar_invalida(self):
+        obtener_perfil(self.peticion())
+        perfil = PerfilEmpleado.objects.get(user=self.user)
+        perfil.activo = False
+        with self.captureOnCommitCallbacks(execute=True):
+            perfil.save()
+        self.assertFalse(obtener_perfil(self.peticion()).activo)
+
+    def test_lectura_antes_del_commit(self):
+        # Un request que vuelve a guardar el perfil anterior en la caché antes
+        # del commit no lo deja ahí: la invalidación se repite al confirmar
+        perfil = PerfilEmpleado.objects.get(user=self.user)
+        perfil.cargo = 'supervisor'
+        with self.captureOnCommitCallbacks(execute=True):
+            perfil.save()
+            cache.set(f'home:perfil_empleado:{self.user.pk}', PerfilEmpleado(user=self.user, cargo='empleado'))
+        self.assertEqual(obtener_perfil(self.peticion()).cargo, 'supervisor')
+
+    def test_eliminar_invalida(self):
+        obtener_perfil(self.peticion())
+        PerfilEmpleado.objects.filter(user=self.user).get().delete()
+        self.assertIsNone(obtener_perfil(self.peticion()))
+
+
+class PaginacionCursorTests(TestCase):
+    """Paginación por cursor (keyset)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_empleados(47)
+        # Fechas repetidas: el id desempata
+        PerfilEmpleado.objects.filter(pk__in=PerfilEmpleado.objects.values('pk')[:10]).update(
+            fecha_creacion=PerfilEmpleado.objects.first().fecha_creacion
+        )
+        cls.orden = ['-fecha_creacion', 'id']
+        cls.esperado = list(PerfilEmpleado.objects.order_by(*cls.orden).values_list('pk', flat=True))
+
+    def recorrer(self, paginador):
+        pagina = paginador.pagina()
+        paginas = [pagina]
+        while pagina.has_next:
+            pagina = paginador.pagina(pagina.cursor_siguiente)
+            paginas.append(pagina)
+        return paginas
+
+    def test_recorre_todo_sin_repetir(self):
+        paginas = self.recorrer(PaginadorCursor(PerfilEmpleado.objects.all(), self.orden, 10))
+        self.assertEqual([len(p) for p in paginas], [10, 10, 10, 10, 7])
+        self.assertEqual([e.pk for p in paginas for e in p], self.esperado)
+        self.assertFalse(paginas[0].has_previous)
+        self.assertTrue(paginas[-1].has_previous)
+
+    def test_volver_atras(self):
+        paginador = PaginadorCursor(PerfilEmpleado.objects.all(), self.orden, 10)
+        paginas = self.recorrer(paginador)
+        anterior = paginador.pagina(paginas[2].cursor_anterior)
+        self.assertEqual([e.pk for e in anterior], [e.pk for e in paginas[1]])
+        self.assertTrue(anterior.has_next)
+        primera = paginador.pagina(paginas[1].cursor_anterior)
+        self.assertEqual([e.pk for e in primera], self.esperado[:10])
+        self.assertFalse(primera.has_previous)
+
+    def test_cursor_invalido_da_la_primera_pagina(self):
+        paginador = PaginadorCursor(PerfilEmpleado.objects.all(), self.orden, 10)
+        for cursor in ('basura', 'W10', 'WyJzIiwgWzFdXQ'):
+            with self.subTest(cursor=cursor):
+                self.assertEqual([e.pk for e in paginador.pagina(cursor)], self.esperado[:10])
+
+    def test_una_consulta_por_pagina(self):
+        paginador = PaginadorCursor(PerfilEmpleado.objects.all(), self.orden, 10)
+        cursor = self.recorrer(paginador)[3].cursor_anterior
+        with self.assertNumQueries(1):
+            paginador.pagina(cursor)
+
+    def test_total(self):
+        self.assertEqual(contar_filas(PerfilEmpleado.objects.all(), 'exacto'), (47, 'exacto'))
+        self.assertEqual(contar_filas(PerfilEmpleado.objects.all(), 'estimado'), (47, 'exacto'))
+        with mock.patch('home.paginacion.TOPE_CONTEO', 20):
+            self.assertEqual(contar_filas(PerfilEmpleado.objects.all(), 'estimado'), (20, 'minimo'))
+
+    def test_urls_conservan_los_filtros(self):
+        request = RequestFactory().get('/', {'q': 'a b', 'cargo': 'empleado', 'page': '3'})
+        pagina = paginar(request, PerfilEmpleado.objects.all(), self.orden, 10, contar='exacto')
+        self.assertEqual(pagina.url_primera, '?q=a+b&cargo=empleado')
+        self.assertTrue(pagina.url_siguiente.startswith('?q=a+b&cargo=empleado&cursor='))
+        self.assertIsNone(pagina.url_anterior)
+        self.assertEqual(pagina.total_texto, '47')
+
+
+class ExportacionCsvTests(TestCase):
+    """Exportación de empleados en streaming"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = crear_empleado('admin', cargo='admin')
+        crear_empleados(30)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_formato(self):
+        respuesta = self.client.get(reverse('home:export_usuarios_csv'))
+        self.assertTrue(respuesta.streaming)
+        self.assertEqual(respuesta['Content-Disposition'], 'attachment; filename="empleados.csv"')
+        self.assertTrue(descargar(respuesta).contenido.startswith('\ufeff'.encode('utf-8')))
+        filas = leer_csv(self.client.get(reverse('home:export_usuarios_csv')))
+        self.assertEqual(filas[0][0], 'Usuario')
+        self.assertEqual(len(filas), PerfilEmpleado.objects.count() + 1)
+        admin = next(fila for fila in filas if fila[0] == 'admin')
+        self.assertEqual(admin[4:6], ['Administrador', '01/01/2024'])
+        self.assertEqual(admin[8], 'Activo')
+
+    def test_filtros_de_la_lista(self):
+        filas = leer_csv(self.client.get(reverse('home:export_usuarios_csv'), {'cargo': 'empleado'}))
+        self.assertEqual(len(filas) - 1, PerfilEmpleado.objects.filter(cargo='empleado').count())
+        self.assertEqual({fila[4] for fila in filas[1:]}, {'Empleado'})
+
+    def test_bloques(self):
+        columnas = [('Usuario', 'user__username', None), ('Ingreso', 'fecha_ingreso', exportacion.fecha)]
+        filas = exportacion.filas(PerfilEmpleado.objects.order_by('pk'), columnas, lote=7)
+        bloques = list(exportacion.bloques_csv(exportacion.encabezados(columnas), filas, lote=7))
+        total = PerfilEmpleado.objects.count()
+        self.assertEqual(len(bloques), (total + 2) // 7 + 1)
+        self.assertEqual(''.join(bloques).count('\r\n'), total + 1)
+        self.assertIn('admin,01/01/2024\r\n', bloques[0])
+
+    @override_settings(TRABAJOS_ARCHIVOS_DIR=tempfile.mkdtemp(prefix='trabajos-'))
+    def test_segundo_plano(self):
+        respuesta = self.client.get(reverse('home:export_usuarios_csv'), {'segundo_plano': 1, 'cargo': 'admin'})
+        trabajo = Trabajo.objects.get(pk=respuesta.json()['trabajo_id'])
+        self.assertEqual(trabajo.parametros, {'cargo': 'admin'})
+        ejecutar(trabajo.pk)
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.resultado, {'filas': PerfilEmpleado.objects.filter(cargo='admin').count()})
+        with almacenamiento().open(trabajo.archivo, 'rb') as archivo:
+            self.assertTrue(archivo.read().decode('utf-8').startswith('\ufeffUsuario,'))
+
+
+class InstrumentacionTests(TestCase):
+    """Medición por request de InstrumentacionMiddleware y su resumen"""
+
+    def setUp(self):
+        self.admin = crear_empleado('admin')
+        self.ruta = os.path.join(tempfile.mkdtemp(prefix='instrumentacion-'), 'requests.jsonl')
+        logger = instrumentacion.logger
+        estado = (logger.handlers[:], logger.level, logger.propagate)
+        logger.handlers.clear()
+
+        def restaurar():
+            for handler in logger.handlers:
+                handler.close()
+            logger.handlers[:], logger.level, logger.propagate = estado
+        self.addCleanup(restaurar)
+
+    def test_medicion(self):
+        medicion = instrumentacion.Medicion()
+        for i in range(instrumentacion.UMBRAL_REPETIDAS + 1):
+            medicion.registrar_consulta('SELECT %s', (i,), 0.001)
+        medicion.registrar_consulta('SELECT %s', (0,), 0.001)
+        medicion.registrar_consulta('SELECT 1', [{}], 0.002)
+        self.assertEqual(medicion.consultas, instrumentacion.UMBRAL_REPETIDAS + 3)
+        self.assertAlmostEqual(medicion.tiempo_sql, 0.001 * (instrumentacion.UMBRAL_REPETIDAS + 2) + 0.002)
+        self.assertEqual(medicion.duplicadas(), 1)
+        self.assertEqual(medicion.repetidas(), [{'sql': 'SELECT %s', 'veces': instrumentacion.UMBRAL_REPETIDAS + 2}])
+
+    def test_execute_wrapper_cuenta_solo_durante_la_medicion(self):
+        with connection.execute_wrapper(instrumentacion._registrar_sql):
+            User.objects.count()
+            medicion, token = instrumentacion.iniciar_medicion()
+            try:
+                User.objects.count()
+                list(PerfilEmpleado.objects.all())
+            finally:
+                instrumentacion.terminar_medicion(token)
+            User.objects.count()
+        self.assertEqual(medicion.consultas, 2)
+        self.assertGreater(medicion.tiempo_sql, 0)
+
+    def test_instalar_una_vez(self):
+        instrumentacion.instalar_medicion_plantillas()
+        instrumentacion.instalar_medicion_plantillas()
+        self.assertIsNot(instrumentacion._render_original, instrumentacion._render_medido)
+
+    def test_log_por_request(self):
+        self.client.force_login(self.admin)
+        with override_settings(INSTRUMENTACION=True, INSTRUMENTACION_LOG=self.ruta):
+            with CaptureQueriesContext(connection) as consultas:
+                respuesta = self.client.get(reverse('home:panel_empleados'))
+        registros = instrumentacion.leer_registros(self.ruta)
+        self.assertEqual(len(registros), 1)
+        registro = registros[0]
+        self.assertEqual(
+            (registro['metodo'], registro['endpoint'], registro['estado'], registro['usuario']),
+            ('GET', 'home:panel_empleados', 200, self.admin.pk),
+        )
+        self.assertEqual(registro['consultas'], len(consultas))
+        self.assertGreater(registro['plantillas_ms'], 0)
+        self.assertGreaterEqual(registro['total_ms'], registro['sql_ms'] + registro['plantillas_ms'])
+        self.assertIn(f'{len(consultas)} consultas', respuesta['Server-Timing'])
+
+    def test_inactiva_sin_log(self):
+        self.client.force_login(self.admin)
+        with override_settings(INSTRUMENTACION=False, INSTRUMENTACION_LOG=self.ruta):
+            self.client.get(reverse('home:panel_empleados'))
+        self.assertEqual(instrumentacion.leer_registros(self.ruta), [])
+
+    def test_resumen_endpoints(self):
+        def registro(endpoint, total_ms, consultas, repetidas=()):
+            return {
+                'metodo': 'GET', 'endpoint': endpoint, 'total_ms': total_ms, 'consultas': consultas,
+                'sql_ms': 1.0, 'plantillas_ms': 2.0, 'duplicadas': 0, 'repetidas': list(repetidas),
+            }
+        registros = [registro('rapido', 5.0, 2) for _ in range(19)] + [registro('rapido', 100.0, 4, ['x'])]
+        registros += [registro('lento', 50.0, 10), registro('lento', 70.0, 12)]
+        resumen = instrumentacion.resumen_endpoints(registros)
+        self.assertEqual([r['endpoint'] for r in resumen], ['rapido', 'lento'])
+        rapido, lento = resumen
+        self.assertEqual((rapido['requests'], rapido['p95_ms'], rapido['max_ms']), (20, 100.0, 100.0))
+        self.assertEqual((rapido['consultas_max'], rapido['con_repetidas']), (4, 1))
+        self.assertEqual((lento['promedio_ms'], lento['consultas_promedio']), (60.0, 11.0))
+        self.assertEqual(len(instrumentacion.resumen_endpoints(registros, limite=1)), 1)
+
+
+class MiddlewareTests(TestCase):
+    """Rutas exentas de PerfilEmpleadoMiddleware y header Server-Timing"""
+
+    # nombre;dur=ms con una descripción opcional entre comillas
+    METRICA = re.compile(r'(?P<nombre>[a-z]+);dur=(?P<dur>\d+\.\d{2})(?:;desc="[^"]*")?\Z')
+
+    def setUp(self):
+        self.admin = crear_empleado('admin')
+        self.client.force_login(self.admin)
+
+    def metricas(self, respuesta):
+        metricas = {}
+        for parte in respuesta['Server-Timing'].split(', '):
+            coincidencia = self.METRICA.match(parte)
+            self.assertIsNotNone(coincidencia, parte)
+            metricas[coincidencia['nombre']] = float(coincidencia['dur'])
+        return metricas
+
+    def test_compilar_rutas_exentas(self):
+        exentas = compilar_rutas_exentas(['/login/', '/admin/', '/static/', ''], ['/'])
+        for ruta in ('/', '/login/', '/admin/auth/user/', '/static/css/base.css'):
+            self.assertTrue(exentas.match(ruta), ruta)
+        for ruta in ('/loginx', '/login', '/cotizaciones/', '/usuarios/'):
+            self.assertFalse(exentas.match(ruta), ruta)
+        self.assertIsNone(compilar_rutas_exentas([], []))
+
+    def test_perfil_inactivo_solo_en_rutas_no_exentas(self):
+        PerfilEmpleado.objects.filter(user=self.admin).update(activo=False)
+        cache.clear()
+        self.assertEqual(self.client.get('/').status_code, 200)
+        respuesta = self.client.get('/loginx')
+        self.assertRedirects(respuesta, reverse('home:login'), fetch_redirect_response=False)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing(self):
+        metricas = self.metricas(self.client.get(reverse('home:panel_empleados')))
+        self.assertLessEqual({'total', 'vista', 'middleware', 'perfil'}, set(metricas))
+        self.assertLessEqual(metricas['vista'], metricas['total'])
+        # En una ruta exenta no se verifica el perfil
+        self.assertNotIn('perfil', self.metricas(self.client.get('/')))
+
+    @override_settings(SERVER_TIMING=False, INSTRUMENTACION=False)
+    def test_sin_server_timing(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('home:panel_empleados')))
+
+    def test_agregar_server_timing_conserva_existentes(self):
+        respuesta = HttpResponse()
+        agregar_server_timing(respuesta, ['a;dur=1.00'])
+        agregar_server_timing(respuesta, ['b;dur=2.00', 'c;dur=3.00'])
+        self.assertEqual(respuesta['Server-Timing'], 'a;dur=1.00, b;dur=2.00, c;dur=3.00')
@@ -0,0 +1,20 @@
+# home/trabajos.py
+"""Trabajos en segundo plano de gestión de usuarios (ver trabajos.registro)"""
+import io
+import tempfile
+
+from trabajos.registro import guardar_salida, registrar
+
+from .views import escribir_usuarios_csv
+
+
+@registrar('exportar_usuarios_csv')
+def exportar_usuarios_csv_trabajo(trabajo):
+    # El CSV se escribe en un temporal para no tenerlo completo en memoria
+    with tempfile.TemporaryFile() as salida:
+        texto = io.TextIOWrapper(salida, encoding='utf-8', newline='', write_through=True)
+        filas = escribir_usuarios_csv(texto, trabajo.parametros)
+        texto.detach()
+        salida.seek(0)
+        guardar_salida(trabajo, 'empleados.csv', salida)
+    return {'filas': filas}
@@ -36,4 +36,5 @@ urlpatterns = [
     path('asignacion-trabajos/', views.asignacion_trabajos, name='asignacion_trabajos'),
     path('mi-perfil/', views.mi_perfil, name='mi_perfil'),
     path('registro-tiempo/', views.registro_tiempo, name='registro_tiempo'),
+    path('rendimiento/', views.rendimiento, name='rendimiento'),
 ]
\ No newline at end of file
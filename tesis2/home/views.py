@@ -2,11 +2,13 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.http import HttpResponseForbidden, JsonResponse, HttpResponse
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
 from .decorators import requiere_admin, requiere_gerente_o_superior, requiere_cargo
+from .perfiles import obtener_perfil
 from django.contrib import messages
 from .models import PerfilEmpleado
 from django.contrib.auth.models import User
-from django.core.paginator import Paginator
 from django.db.models import Q, Count
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
@@ -15,9 +17,12 @@ from django.db import transaction
 import json
 from .models import *
 
-import csv
 from datetime import datetime, timedelta
 
+from trabajos.registro import encolar
+from .paginacion import paginar
+from . import exportacion, instrumentacion, reportes
+
 
 
 
@@ -53,7 +58,9 @@ def logout_view(request):
 @login_required
 def panel_empleados(request):
     try:
-        perfil = PerfilEmpleado.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
+        if perfil is None:
+            raise PerfilEmpleado.DoesNotExist
         
         # Definir funciones disponibles según el cargo
         funciones_disponibles = []
@@ -105,23 +112,16 @@ def panel_empleados(request):
         
     except PerfilEmpleado.DoesNotExist:
         messages.error(request, 'No tienes permisos de empleado.')
-        return redirect('index')
+        return redirect('home:index')
 
-# Vistas para las diferentes funciones de Admin
-@login_required
-@requiere_gerente_o_superior
-def gestion_usuarios(request):
-    """Vista principal del panel de gestión de usuarios"""
+def filtrar_empleados(datos):
+    """Empleados según los filtros q, cargo y activo de la lista"""
+    query = datos.get('q', '')
+    cargo_filter = datos.get('cargo', '')
+    activo_filter = datos.get('activo', '')
     
-    # Obtener parámetros de filtro
-    query = request.GET.get('q', '')
-    cargo_filter = request.GET.get('cargo', '')
-    activo_filter = request.GET.get('activo', '')
+    empleados = PerfilEmpleado.objects.all()
     
-    # Query base
-    empleados = PerfilEmpleado.objects.select_related('user').all()
-    
-    # Aplicar filtros
     if query:
         empleados = empleados.filter(
             Q(user__first_name__icontains=query) |
@@ -136,14 +136,18 @@ def gestion_usuarios(request):
     if activo_filter in ['0', '1']:
         empleados = empleados.filter(activo=activo_filter == '1')
     
+    return empleados
+
+# Vistas para las diferentes funciones de Admin
+@login_required
+@requiere_gerente_o_superior
+def gestion_usuarios(request):
+    """Vista principal del panel de gestión de usuarios"""
     
-    # Ordenar
-    empleados = empleados.order_by('-fecha_creacion')
+    empleados = filtrar_empleados(request.GET).select_related('user')
     
-    # Paginación
-    paginator = Paginator(empleados, 15)  # 15 empleados por página
-    page = request.GET.get('page')
-    empleados_page = paginator.get_page(page)
+    # Paginación por cursor, 15 empleados por página
+    empleados_page = paginar(request, empleados, ['-fecha_creacion', 'id'], 15, contar='estimado')
     
     # Estadísticas
     total_empleados = PerfilEmpleado.objects.count()
@@ -158,15 +162,6 @@ def gestion_usuarios(request):
     # Opciones para filtros
     cargos_choices = PerfilEmpleado.CARGO_CHOICES
     
-    # Construir parámetros URL para paginación
-    url_params = ''
-    if query:
-        url_params += f'&q={query}'
-    if cargo_filter:
-        url_params += f'&cargo={cargo_filter}'
-    if activo_filter:
-        url_params += f'&activo={activo_filter}'
-    
     context = {
         'empleados': empleados_page,
         'total_empleados': total_empleados,
@@ -175,7 +170,6 @@ def gestion_usuarios(request):
         'porcentaje_activos': porcentaje_activos,
         'nuevos_mes': nuevos_mes,
         'cargos_choices': cargos_choices,
-        'url_params': url_params,
     }
     
     return render(request, 'home/gestion_usuarios.html', context)
@@ -400,37 +394,40 @@ def eliminar_usuario_api(request, user_id):
             'message': f'Error al eliminar usuario: {str(e)}'
         })
 
+COLUMNAS_EMPLEADOS = [
+    ('Usuario', 'user__username', None),
+    ('Nombre', 'user__first_name', None),
+    ('Apellido', 'user__last_name', None),
+    ('Email', 'user__email', None),
+    ('Cargo', 'cargo', exportacion.opciones(PerfilEmpleado.CARGO_CHOICES)),
+    ('Fecha Ingreso', 'fecha_ingreso', exportacion.fecha),
+    ('Teléfono', 'telefono', None),
+    ('Salario', 'salario', None),
+    ('Estado', 'activo', exportacion.si_no('Activo', 'Inactivo')),
+    ('Fecha Creación', 'fecha_creacion', exportacion.fecha_hora),
+]
+
+def empleados_a_exportar(filtros):
+    return filtrar_empleados(filtros).order_by('-fecha_creacion', 'id')
+
+def escribir_usuarios_csv(destino, filtros=None):
+    """Escribe el CSV de empleados en un archivo abierto; retorna la cantidad de filas"""
+    return exportacion.escribir_csv(
+        destino,
+        exportacion.encabezados(COLUMNAS_EMPLEADOS),
+        exportacion.filas(empleados_a_exportar(filtros or {}), COLUMNAS_EMPLEADOS),
+    )
+
 @login_required
 @requiere_gerente_o_superior
 def export_usuarios_csv(request):
-    """Exportar usuarios a CSV"""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="empleados.csv"'
-    response.write('\ufeff')  # BOM para UTF-8
+    """Exportar a CSV los usuarios de la lista filtrada, en streaming"""
+    filtros = {campo: request.GET[campo] for campo in ('q', 'cargo', 'activo') if request.GET.get(campo)}
+    if request.GET.get('segundo_plano'):
+        trabajo = encolar('exportar_usuarios_csv', filtros, usuario=request.user)
+        return JsonResponse({'success': True, 'trabajo_id': trabajo.pk})
     
-    writer = csv.writer(response)
-    writer.writerow([
-        'Usuario', 'Nombre', 'Apellido', 'Email', 'Cargo',
-        'Fecha Ingreso', 'Teléfono', 'Salario', 'Estado', 'Fecha Creación'
-    ])
-    
-    empleados = PerfilEmpleado.objects.select_related('user').all()
-    
-    for perfil in empleados:
-        writer.writerow([
-            perfil.user.username,
-            perfil.user.first_name,
-            perfil.user.last_name,
-            perfil.user.email,
-            perfil.get_cargo_display(),
-            perfil.fecha_ingreso.strftime('%d/%m/%Y'),
-            perfil.telefono or '',
-            perfil.salario or '',
-            'Activo' if perfil.activo else 'Inactivo',
-            perfil.fecha_creacion.strftime('%d/%m/%Y %H:%M')
-        ])
-    
-    return response
+    return exportacion.exportar_csv('empleados.csv', empleados_a_exportar(filtros), COLUMNAS_EMPLEADOS)
 
 """                                                                                        
 ,------.                        ,--.                                             ,--.          
@@ -445,51 +442,53 @@ def export_usuarios_csv(request):
 @login_required
 @requiere_admin
 def reportes_generales(request):
-    perfil = PerfilEmpleado.objects.get(user=request.user)
+    perfil = obtener_perfil(request)
     if not perfil.es_admin():
         messages.error(request, 'No tienes permisos para acceder a esta función.')
-        return redirect('panel_empleados')
+        return redirect('home:panel_empleados')
     
-    return HttpResponseForbidden("Proximamente")
+    return render(request, 'home/reportes.html', reportes.reporte_general())
 
 @login_required
 @requiere_admin
 def configuracion(request):
-    perfil = PerfilEmpleado.objects.get(user=request.user)
+    perfil = obtener_perfil(request)
     if not perfil.es_admin():
         messages.error(request, 'No tienes permisos para acceder a esta función.')
-        return redirect('panel_empleados')
+        return redirect('home:panel_empleados')
     return HttpResponseForbidden("Proximamente")
 
 @login_required
 @requiere_admin
 def auditoria(request):
-    perfil = PerfilEmpleado.objects.get(user=request.user)
+    perfil = obtener_perfil(request)
     if not perfil.es_admin():
         messages.error(request, 'No tienes permisos para acceder a esta función.')
-        return redirect('panel_empleados')
+        return redirect('home:panel_empleados')
     return HttpResponseForbidden("Proximamente")
 
 @login_required
 @requiere_admin
 def gestion_servicios(request):
-    perfil = PerfilEmpleado.objects.get(user=request.user)
+    perfil = obtener_perfil(request)
     if not perfil.es_admin():
         messages.error(request, 'No tienes permisos para acceder a esta función.')
-        return redirect('panel_empleados')
+        return redirect('home:panel_empleados')
     return HttpResponseForbidden("Proximamente")
 
 #Por Hacer:
 @login_required
 @requiere_admin
 def reportes_ventas(request):
-    perfil = PerfilEmpleado.objects.get(user=request.user)
+    perfil = obtener_perfil(request)
     if not perfil.es_gerente_o_superior():
         messages.error(request, 'No tienes permisos para acceder a esta función.')
-        return redirect('panel_empleados')
+        return redirect('home:panel_empleados')
     
-    # Aquí iría la lógica para reportes de ventas
-    return HttpResponseForbidden("Proximamente")
+    desde, hasta = reportes.periodo(request.GET)
+    context = reportes.reporte_ventas(desde, hasta)
+    context.update(desde=desde, hasta=hasta)
+    return render(request, 'home/reportes.html', context)
 
 @login_required
 def mis_tareas(request):
@@ -500,8 +499,12 @@ def gestion_empleados(request):
     return HttpResponseForbidden("Proximamente")
 
 @login_required
+@requiere_gerente_o_superior
 def estadisticas(request):
-    return HttpResponseForbidden("Proximamente")
+    """Resumen de ventas de toda la historia y descargas de la analítica"""
+    context = reportes.reporte_estadisticas()
+    context['descargas'] = reportes.descargas_analitica()
+    return render(request, 'home/reportes.html', context)
 
 @login_required
 def supervision_tareas(request):
@@ -521,4 +524,18 @@ def mi_perfil(request):
 
 @login_required
 def registro_tiempo(request):
-    return HttpResponseForbidden("Proximamente")
\ No newline at end of file
+    return HttpResponseForbidden("Proximamente")
+
+@staff_member_required
+def rendimiento(request):
+    """Endpoints más lentos según el log de InstrumentacionMiddleware"""
+    ruta = instrumentacion.ruta_log()
+    registros = instrumentacion.leer_registros(ruta) if ruta else []
+    context = {
+        'activa': getattr(settings, 'INSTRUMENTACION', False),
+        'total_registros': len(registros),
+        'endpoints': instrumentacion.resumen_endpoints(registros),
+        # Requests individuales con consultas repetidas (N+1 probables)
+        'repetidas': [r for r in registros if r.get('repetidas')][-20:][::-1],
+    }
+    return render(request, 'home/rendimiento.html', context)
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -30,9 +31,12 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'home',
     'cotizaciones',
+    'trabajos',
 ]
 
 MIDDLEWARE = [
+    'home.middleware.TiempoMiddleware',
+    'home.middleware.InstrumentacionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -41,8 +45,19 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'home.middleware.PerfilEmpleadoMiddleware',
+    'home.middleware.TiempoVistaMiddleware',
 ]
 
+# Header Server-Timing con el costo del middleware y de la vista
+SERVER_TIMING = DEBUG
+
+# Instrumentación por request (consultas SQL, plantillas, tiempo total).
+# Escribe un log JSON rotativo; el resumen se ve en /rendimiento/ (solo staff)
+INSTRUMENTACION = False
+INSTRUMENTACION_LOG = str(BASE_DIR / 'logs' / 'instrumentacion.jsonl')
+INSTRUMENTACION_LOG_BYTES = 10 * 1024 * 1024
+INSTRUMENTACION_LOG_COPIAS = 5
+
 ROOT_URLCONF = 'tesis2.urls'
 
 TEMPLATES = [
@@ -118,6 +133,51 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Caché en disco de los PDF de cotizaciones (no se sirve públicamente)
+PDF_CACHE_DIR = BASE_DIR / 'cache' / 'pdf'
+
+# Procesos para generar PDF en la exportación masiva desde el worker y el
+# comando exportar_pdfs (1 = sin pool); la descarga directa usa uno
+EXPORTACION_PDF_PROCESOS = min(4, os.cpu_count() or 1)
+
+# Rutas que PerfilEmpleadoMiddleware no verifica: prefijos y rutas exactas.
+# Los estáticos y media no resuelven sesión ni usuario.
+PERFIL_RUTAS_EXENTAS = ['/login/', '/logout/', '/admin/', STATIC_URL, MEDIA_URL]
+PERFIL_RUTAS_EXENTAS_EXACTAS = ['/']  # página principal
+
+# Caché
+# Debe ser compartida por todos los procesos del servidor: las señales
+# invalidan perfiles, estadísticas y la versión del catálogo en la caché, y
+# con una caché por proceso (LocMemCache) los demás procesos no lo verían
+# hasta que expire la entrada. La caché en archivos sirve para los procesos
+# de un mismo servidor; con varios servidores se usa Redis o Memcached.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'django',
+        # Sobre el máximo se borra un tercio de las entradas al azar
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# Segundos que se mantiene en caché el PerfilEmpleado del usuario
+PERFIL_CACHE_TTL = 30
+
+# Segundos que se mantienen en caché las estadísticas del dashboard de
+# cotizaciones (las señales las invalidan antes si cambian)
+DASHBOARD_CACHE_TTL = 60
+
+# Segundos que se mantiene en caché el catálogo de servicios de cada versión.
+# La versión no expira: solo la cambian las señales al editar el catálogo
+CATALOGO_CACHE_TTL = 300
+
+# Trabajos en segundo plano (python manage.py procesar_trabajos)
+# None usa un proceso por núcleo
+TRABAJOS_PROCESOS = None
+# Archivos de entrada y salida de los trabajos (pueden tener sueldos u otros
+# datos privados): fuera de MEDIA_ROOT, solo se descargan vía descargar_trabajo
+TRABAJOS_ARCHIVOS_DIR = BASE_DIR / 'privado' / 'trabajos'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
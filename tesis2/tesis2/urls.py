@@ -7,6 +7,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('home.urls')),
     path('cotizaciones/', include('cotizaciones.urls')),
+    path('trabajos/', include('trabajos.urls')),
 ]
 
 # Servir archivos estáticos en desarrollo
@@ -0,0 +1,8 @@
+from django.contrib import admin
+from .models import Trabajo
+
+@admin.register(Trabajo)
+class TrabajoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tipo', 'estado', 'progreso', 'total', 'creado_por', 'fecha_creacion', 'fecha_fin')
+    list_filter = ('estado', 'tipo')
+    readonly_fields = ('fecha_creacion', 'fecha_inicio', 'fecha_fin')
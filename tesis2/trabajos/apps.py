@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+
+class TrabajosConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'trabajos'
+    verbose_name = 'Trabajos en segundo plano'
@@ -0,0 +1,104 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from trabajos import proceso
+from trabajos.models import Trabajo
+
+
+class Command(BaseCommand):
+    help = 'Procesa los trabajos en segundo plano usando un pool de procesos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--procesos', type=int,
+            default=getattr(settings, 'TRABAJOS_PROCESOS', None) or os.cpu_count() or 1,
+            help='Cantidad de procesos en paralelo',
+        )
+        parser.add_argument('--intervalo', type=float, default=2.0,
+                            help='Segundos entre consultas de trabajos pendientes')
+        parser.add_argument('--una-vez', action='store_true',
+                            help='Procesar los trabajos pendientes y terminar')
+        parser.add_argument('--recuperar', action='store_true',
+                            help='Volver a encolar los trabajos que quedaron en proceso')
+
+    def handle(self, *args, **options):
+        procesos = max(1, options['procesos'])
+        intervalo = options['intervalo']
+
+        if options['recuperar']:
+            recuperados = Trabajo.objects.filter(estado='en_proceso').update(
+                estado='pendiente', fecha_inicio=None
+            )
+            self.stdout.write(f'{recuperados} trabajos vueltos a encolar')
+
+        self.stdout.write(f'Worker iniciado con {procesos} procesos')
+        try:
+            # Si un proceso hijo muere el pool queda inutilizable; se crea otro
+            while not self._procesar(procesos, intervalo, options['una_vez']):
+                self.stderr.write('El pool de procesos se interrumpió; reiniciando')
+        except KeyboardInterrupt:
+            self.stdout.write('Deteniendo worker...')
+
+    def _procesar(self, procesos, intervalo, una_vez):
+        """Ciclo principal; retorna False si el pool de procesos se rompió"""
+        contexto = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(
+            max_workers=procesos,
+            mp_context=contexto,
+            initializer=proceso.inicializar,
+            initargs=(os.environ['DJANGO_SETTINGS_MODULE'],),
+        ) as pool:
+            en_curso = {}
+            while True:
+                libres = procesos - len(en_curso)
+                if libres:
+                    for trabajo in self._pendientes(libres):
+                        try:
+                            en_curso[pool.submit(proceso.ejecutar_trabajo, trabajo.pk)] = trabajo
+                        except BrokenProcessPool:
+                            Trabajo.objects.filter(pk=trabajo.pk).update(estado='pendiente', fecha_inicio=None)
+                            self._finalizar_todos(en_curso)
+                            return False
+                        self.stdout.write(f'Iniciado {trabajo}')
+
+                if not en_curso:
+                    if una_vez:
+                        return True
+                    time.sleep(intervalo)
+                    continue
+
+                terminados, _ = wait(en_curso, timeout=intervalo, return_when=FIRST_COMPLETED)
+                for futuro in terminados:
+                    self._finalizar(en_curso.pop(futuro), futuro)
+
+    def _finalizar_todos(self, en_curso):
+        for futuro, trabajo in en_curso.items():
+            self._finalizar(trabajo, futuro)
+        en_curso.clear()
+
+    def _pendientes(self, limite):
+        """Toma hasta 'limite' trabajos pendientes, en orden de llegada"""
+        tomados = []
+        candidatos = Trabajo.objects.filter(estado='pendiente').order_by('fecha_creacion', 'pk')
+        for trabajo in candidatos[:limite]:
+            if trabajo.tomar():
+                tomados.append(trabajo)
+        return tomados
+
+    def _finalizar(self, trabajo, futuro):
+        try:
+            estado = futuro.result()
+        except Exception as e:
+            # El proceso hijo terminó de forma anormal; registrar el error
+            estado = 'error'
+            Trabajo.objects.filter(pk=trabajo.pk).update(
+                estado='error', error=str(e) or e.__class__.__name__, fecha_fin=timezone.now()
+            )
+        self.stdout.write(f'Terminado {trabajo.tipo} #{trabajo.pk}: {estado}')
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trabajos', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trabajo',
+            name='archivo',
+            field=models.CharField(blank=True, default='', help_text='Ruta del archivo generado en TRABAJOS_ARCHIVOS_DIR', max_length=255),
+        ),
+    ]
@@ -0,0 +1,80 @@
+from django.db import models
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+
+class Trabajo(models.Model):
+    """Operación pesada (importación, exportación, PDF) ejecutada por el worker"""
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En proceso'),
+        ('completado', 'Completado'),
+        ('error', 'Error'),
+    ]
+
+    tipo = models.CharField(max_length=50)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
+    parametros = models.JSONField(default=dict, blank=True)
+    progreso = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    resultado = models.JSONField(blank=True, null=True)
+    archivo = models.CharField(max_length=255, blank=True, default='', help_text="Ruta del archivo generado en TRABAJOS_ARCHIVOS_DIR")
+    error = models.TextField(blank=True, default='')
+    creado_por = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(blank=True, null=True)
+    fecha_fin = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'fecha_creacion'], name='trabajo_estado_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} #{self.pk} ({self.get_estado_display()})"
+
+    @property
+    def porcentaje(self):
+        if self.estado == 'completado':
+            return 100
+        if not self.total:
+            return 0
+        return min(100, round(self.progreso * 100 / self.total))
+
+    def reportar_progreso(self, progreso, total=None):
+        """Actualiza el avance con un UPDATE directo, sin guardar el resto de columnas"""
+        self.progreso = progreso
+        campos = {'progreso': progreso}
+        if total is not None:
+            self.total = total
+            campos['total'] = total
+        Trabajo.objects.filter(pk=self.pk).update(**campos)
+
+    def tomar(self):
+        """Marca el trabajo como en proceso; retorna False si otro worker ya lo tomó"""
+        ahora = timezone.now()
+        tomado = Trabajo.objects.filter(pk=self.pk, estado='pendiente').update(
+            estado='en_proceso', fecha_inicio=ahora
+        )
+        if tomado:
+            self.estado = 'en_proceso'
+            self.fecha_inicio = ahora
+        return bool(tomado)
+
+    def como_dict(self):
+        return {
+            'id': self.pk,
+            'tipo': self.tipo,
+            'estado': self.estado,
+            'estado_display': self.get_estado_display(),
+            'progreso': self.progreso,
+            'total': self.total,
+            'porcentaje': self.porcentaje,
+            'resultado': self.resultado,
+            'error': self.error,
+            'tiene_archivo': bool(self.archivo),
+            'fecha_creacion': self.fecha_creacion.isoformat() if self.fecha_creacion else None,
+            'fecha_inicio': self.fecha_inicio.isoformat() if self.fecha_inicio else None,
+            'fecha_fin': self.fecha_fin.isoformat() if self.fecha_fin else None,
+        }
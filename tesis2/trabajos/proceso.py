@@ -0,0 +1,25 @@
+# trabajos/proceso.py
+"""
+Funciones que corren dentro de los procesos hijos del worker. Este módulo no
+importa modelos al cargarse: con el método 'spawn' se importa antes de que
+Django esté configurado en el proceso hijo.
+"""
+import os
+
+
+def inicializar(settings_module):
+    """Prepara Django en cada proceso hijo (no hereda conexiones del padre)"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def ejecutar_trabajo(trabajo_id):
+    from django.db import close_old_connections, connections
+    from .registro import ejecutar
+
+    close_old_connections()
+    try:
+        return ejecutar(trabajo_id)
+    finally:
+        connections.close_all()
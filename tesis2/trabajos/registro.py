@@ -0,0 +1,86 @@
+# trabajos/registro.py
+"""Registro de tipos de trabajo y ejecución dentro de los procesos del worker"""
+import traceback
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+_manejadores = {}
+
+
+def registrar(tipo):
+    """
+    Decorador que asocia una función a un tipo de trabajo. La función recibe
+    el Trabajo y retorna un dict con el resultado (se guarda como JSON).
+    Los manejadores se declaran en el módulo trabajos.py de cada app.
+    """
+    def decorator(funcion):
+        _manejadores[tipo] = funcion
+        return funcion
+    return decorator
+
+
+def cargar_manejadores():
+    autodiscover_modules('trabajos')
+    return _manejadores
+
+
+def encolar(tipo, parametros=None, usuario=None):
+    """Crea un trabajo pendiente para que lo procese el worker"""
+    from .models import Trabajo
+
+    if tipo not in cargar_manejadores():
+        raise ValueError(f'Tipo de trabajo desconocido: {tipo}')
+    return Trabajo.objects.create(
+        tipo=tipo,
+        parametros=parametros or {},
+        creado_por=usuario if usuario is not None and usuario.is_authenticated else None,
+    )
+
+
+def almacenamiento():
+    """Storage de los archivos de trabajos: fuera de MEDIA_ROOT, no se sirve públicamente"""
+    return FileSystemStorage(location=settings.TRABAJOS_ARCHIVOS_DIR)
+
+
+def guardar_entrada(archivo, nombre):
+    """Guarda un archivo subido para que el worker lo lea; retorna su ruta en el storage"""
+    return almacenamiento().save(f'entradas/{nombre}', File(archivo))
+
+
+def guardar_salida(trabajo, nombre, contenido):
+    """
+    Guarda el archivo generado por un trabajo y lo asocia a él. contenido
+    puede ser texto, bytes o un archivo abierto (para salidas grandes).
+    """
+    if isinstance(contenido, str):
+        contenido = contenido.encode('utf-8')
+    archivo = ContentFile(contenido) if isinstance(contenido, bytes) else File(contenido)
+    trabajo.archivo = almacenamiento().save(f'{trabajo.pk}/{nombre}', archivo)
+    return trabajo.archivo
+
+
+def ejecutar(trabajo_id):
+    """Ejecuta un trabajo ya tomado. Corre dentro de un proceso del pool del worker."""
+    from .models import Trabajo
+
+    trabajo = Trabajo.objects.get(pk=trabajo_id)
+    manejador = cargar_manejadores().get(trabajo.tipo)
+    try:
+        if manejador is None:
+            raise ValueError(f'Tipo de trabajo desconocido: {trabajo.tipo}')
+        trabajo.resultado = manejador(trabajo)
+        trabajo.estado = 'completado'
+        if trabajo.total:
+            trabajo.progreso = trabajo.total
+    except Exception as e:
+        trabajo.estado = 'error'
+        trabajo.error = str(e)
+        if settings.DEBUG:
+            trabajo.error += '\n\n' + traceback.format_exc()
+    trabajo.fecha_fin = timezone.now()
+    trabajo.save(update_fields=['estado', 'resultado', 'progreso', 'archivo', 'error', 'fecha_fin'])
+    return trabajo.estado
@@ -0,0 +1,189 @@
+import io
+import shutil
+import tempfile
+from concurrent.futures import Future
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from home.tests import crear_empleado
+
+from . import registro
+from .models import Trabajo
+from .registro import almacenamiento, ejecutar, encolar, guardar_salida
+
+ARCHIVOS_TEST = tempfile.mkdtemp(prefix='trabajos-')
+
+
+def completar(trabajo):
+    guardar_salida(trabajo, 'salida.txt', 'contenido')
+    return {'ok': True}
+
+
+def fallar(trabajo):
+    raise ValueError('Archivo inválido')
+
+
+class PoolSincronico:
+    """Reemplazo de ProcessPoolExecutor que ejecuta cada trabajo al enviarlo"""
+    def __init__(self, max_workers, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, funcion, *args):
+        futuro = Future()
+        try:
+            futuro.set_result(funcion(*args))
+        except Exception as e:
+            futuro.set_exception(e)
+        return futuro
+
+
+@override_settings(TRABAJOS_ARCHIVOS_DIR=ARCHIVOS_TEST)
+class TrabajosTestCase(TestCase):
+    """Registra los tipos de trabajo de prueba y limpia los archivos generados"""
+
+    def setUp(self):
+        manejadores = registro.cargar_manejadores()
+        self.addCleanup(lambda: [manejadores.pop(tipo, None) for tipo in ('prueba_ok', 'prueba_falla')])
+        registro.registrar('prueba_ok')(completar)
+        registro.registrar('prueba_falla')(fallar)
+        self.addCleanup(shutil.rmtree, ARCHIVOS_TEST, ignore_errors=True)
+
+
+class TrabajoTests(TrabajosTestCase):
+
+    def test_tomar(self):
+        trabajo = encolar('prueba_ok')
+        otro_worker = Trabajo.objects.get(pk=trabajo.pk)
+        self.assertTrue(trabajo.tomar())
+        self.assertEqual(trabajo.estado, 'en_proceso')
+        self.assertIsNotNone(trabajo.fecha_inicio)
+        self.assertFalse(otro_worker.tomar())
+        self.assertEqual(otro_worker.estado, 'pendiente')
+
+    def test_encolar_tipo_desconocido(self):
+        with self.assertRaises(ValueError):
+            encolar('no_existe')
+
+    def test_ejecutar_completado(self):
+        trabajo = encolar('prueba_ok')
+        self.assertEqual(ejecutar(trabajo.pk), 'completado')
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.resultado, {'ok': True})
+        self.assertEqual(trabajo.porcentaje, 100)
+        self.assertIsNotNone(trabajo.fecha_fin)
+        with almacenamiento().open(trabajo.archivo) as archivo:
+            self.assertEqual(archivo.read(), b'contenido')
+
+    def test_archivos_fuera_de_media(self):
+        trabajo = encolar('prueba_ok')
+        ejecutar(trabajo.pk)
+        trabajo.refresh_from_db()
+        self.assertTrue(almacenamiento().path(trabajo.archivo).startswith(ARCHIVOS_TEST))
+
+    def test_ejecutar_registra_error(self):
+        trabajo = encolar('prueba_falla')
+        self.assertEqual(ejecutar(trabajo.pk), 'error')
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.error, 'Archivo inválido')
+        self.assertIsNone(trabajo.resultado)
+        self.assertIsNotNone(trabajo.fecha_fin)
+
+    def test_ejecutar_tipo_sin_manejador(self):
+        trabajo = Trabajo.objects.create(tipo='no_existe')
+        self.assertEqual(ejecutar(trabajo.pk), 'error')
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.error, 'Tipo de trabajo desconocido: no_existe')
+
+
+# Los hijos del pool real abren su propia conexión y no ven la base de test:
+# el ciclo del worker se prueba con un pool que ejecuta en el mismo proceso
+@mock.patch('trabajos.management.commands.procesar_trabajos.ProcessPoolExecutor', PoolSincronico)
+@mock.patch('trabajos.proceso.ejecutar_trabajo', ejecutar)
+class ProcesarTrabajosTests(TrabajosTestCase):
+
+    def procesar(self, **opciones):
+        salida = io.StringIO()
+        call_command('procesar_trabajos', una_vez=True, procesos=2, stdout=salida, **opciones)
+        return salida.getvalue()
+
+    def test_procesa_pendientes(self):
+        trabajos = [encolar('prueba_ok'), encolar('prueba_falla'), encolar('prueba_ok')]
+        salida = self.procesar()
+        estados = [Trabajo.objects.get(pk=trabajo.pk).estado for trabajo in trabajos]
+        self.assertEqual(estados, ['completado', 'error', 'completado'])
+        self.assertIn(f'Terminado prueba_falla #{trabajos[1].pk}: error', salida)
+
+    def test_no_toma_trabajos_en_proceso(self):
+        trabajo = encolar('prueba_ok')
+        trabajo.tomar()
+        self.procesar()
+        self.assertEqual(Trabajo.objects.get(pk=trabajo.pk).estado, 'en_proceso')
+
+    def test_recuperar(self):
+        trabajo = encolar('prueba_ok')
+        trabajo.tomar()
+        self.assertIn('1 trabajos vueltos a encolar', self.procesar(recuperar=True))
+        self.assertEqual(Trabajo.objects.get(pk=trabajo.pk).estado, 'completado')
+
+    def test_proceso_interrumpido(self):
+        trabajo = encolar('prueba_ok')
+        with mock.patch('trabajos.proceso.ejecutar_trabajo', side_effect=RuntimeError('proceso terminado')):
+            self.procesar()
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, 'error')
+        self.assertEqual(trabajo.error, 'proceso terminado')
+        self.assertIsNotNone(trabajo.fecha_fin)
+
+
+class VistasTrabajosTests(TrabajosTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dueno = crear_empleado('dueno', cargo='empleado')
+        cls.otro = crear_empleado('otro', cargo='empleado')
+        cls.admin = crear_empleado('admin')
+
+    def setUp(self):
+        super().setUp()
+        self.trabajo = encolar('prueba_ok', usuario=self.dueno)
+        self.client.force_login(self.dueno)
+
+    def url(self, nombre, *args):
+        return reverse(f'trabajos:{nombre}', args=args)
+
+    def test_lista(self):
+        self.assertEqual([t['id'] for t in self.client.get(self.url('lista')).json()['trabajos']], [self.trabajo.pk])
+        self.client.force_login(self.otro)
+        self.assertEqual(self.client.get(self.url('lista')).json()['trabajos'], [])
+        self.client.force_login(self.admin)
+        self.assertEqual([t['id'] for t in self.client.get(self.url('lista')).json()['trabajos']], [self.trabajo.pk])
+
+    def test_estado(self):
+        datos = self.client.get(self.url('estado', self.trabajo.pk)).json()
+        self.assertEqual((datos['estado'], datos['tiene_archivo']), ('pendiente', False))
+        self.client.force_login(self.otro)
+        self.assertEqual(self.client.get(self.url('estado', self.trabajo.pk)).status_code, 404)
+
+    def test_descargar(self):
+        self.assertEqual(self.client.get(self.url('descargar', self.trabajo.pk)).status_code, 404)
+        ejecutar(self.trabajo.pk)
+        respuesta = self.client.get(self.url('descargar', self.trabajo.pk))
+        self.assertEqual(b''.join(respuesta.streaming_content), b'contenido')
+        self.assertIn('attachment; filename="salida.txt"', respuesta['Content-Disposition'])
+        self.client.force_login(self.otro)
+        self.assertEqual(self.client.get(self.url('descargar', self.trabajo.pk)).status_code, 404)
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(self.url('descargar', self.trabajo.pk)).status_code, 200)
+
+    def test_requiere_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url('estado', self.trabajo.pk)).status_code, 302)
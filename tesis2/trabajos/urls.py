@@ -0,0 +1,10 @@
+from django.urls import path
+from . import views
+
+app_name = 'trabajos'
+
+urlpatterns = [
+    path('', views.lista_trabajos, name='lista'),
+    path('<int:pk>/', views.estado_trabajo, name='estado'),
+    path('<int:pk>/descargar/', views.descargar_trabajo, name='descargar'),
+]
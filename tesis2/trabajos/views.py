@@ -0,0 +1,42 @@
+from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+import os
+
+from .models import Trabajo
+from .registro import almacenamiento
+
+
+def _trabajos_visibles(request):
+    """Los usuarios ven sus trabajos; el staff ve todos"""
+    if request.user.is_staff:
+        return Trabajo.objects.all()
+    return Trabajo.objects.filter(creado_por=request.user)
+
+
+@login_required
+def lista_trabajos(request):
+    """Últimos trabajos del usuario vía AJAX"""
+    trabajos = _trabajos_visibles(request)[:20]
+    return JsonResponse({'trabajos': [trabajo.como_dict() for trabajo in trabajos]})
+
+
+@login_required
+def estado_trabajo(request, pk):
+    """Estado y progreso de un trabajo vía AJAX"""
+    trabajo = get_object_or_404(_trabajos_visibles(request), pk=pk)
+    return JsonResponse(trabajo.como_dict())
+
+
+@login_required
+def descargar_trabajo(request, pk):
+    """Descargar el archivo generado por un trabajo completado"""
+    trabajo = get_object_or_404(_trabajos_visibles(request), pk=pk, estado='completado')
+    archivos = almacenamiento()
+    if not trabajo.archivo or not archivos.exists(trabajo.archivo):
+        raise Http404('El trabajo no generó un archivo')
+    return FileResponse(
+        archivos.open(trabajo.archivo, 'rb'),
+        as_attachment=True,
+        filename=os.path.basename(trabajo.archivo),
+    )